@@ -1,6 +1,23 @@
+import sys
+from datetime import datetime
+
 from airflow import DAG
 from airflow.decorators import task
-from datetime import datetime
+
+# Asegura que `src` sea importable también al parsear el DAG: el grafo de tareas
+# se construye a partir del mapeo de CSV y del registro de consultas
+sys.path.insert(0, "/opt/airflow")
+
+from src.aggregates import AGG_DELIVERY_MONTH_TABLE, AGG_ORDERS_DAY_TABLE, AGG_REVENUE_MONTH_TABLE
+from src.config import get_csv_to_table_mapping
+from src.delivery import AGG_DELIVERY_HIST_TABLE
+from src.sellers import SELLER_SCORECARD_TABLE
+from src.transform import get_query_functions, get_query_tables
+from src.validation import FOREIGN_KEYS
+
+# Tablas base: una tarea de extracción/carga por cada una
+TABLES = list(get_csv_to_table_mapping().values()) + ["public_holidays"]
+SUMMARY_TABLES = (AGG_REVENUE_MONTH_TABLE, AGG_DELIVERY_MONTH_TABLE, AGG_ORDERS_DAY_TABLE)
 
 
 with DAG(
@@ -12,65 +29,181 @@ with DAG(
 ) as dag:
 
     @task
-    def extract_task():
+    def extract_load_table(table: str):
         import logging
         import sys
         # Asegura que la carpeta montada `src` esté en sys.path cuando la tarea se ejecute dentro del contenedor
         sys.path.insert(0, "/opt/airflow/src")
         sys.path.insert(0, "/opt/airflow")
-        from src.extract import extract
-        from src.load import get_engine, load_all
-        from src.config import DATASET_ROOT_PATH, get_csv_to_table_mapping, PUBLIC_HOLIDAYS_URL
+        from src.extract import compact_dataframe, extract_table, table_nbytes
+        from src.load import get_engine, load_staging, staging_table_name
+        from src.validation import ValidationReport, errors, format_report, profile_table
 
-        logging.info("Iniciando paso de extracción")
-        dfs = extract(DATASET_ROOT_PATH, get_csv_to_table_mapping(), PUBLIC_HOLIDAYS_URL)
-        logging.info(f"Se extrajeron {len(dfs)} tablas: {list(dfs.keys())}")
-        engine = get_engine()
-        load_all(dfs, engine)
-        logging.info("Paso de extracción completado y datos cargados en la BD")
+        logging.info(f"Extrayendo tabla {table}")
+        df = extract_table(table)
+        # Representación compacta (categorías, strings Arrow, numéricos reducidos):
+        # baja el pico de memoria de la carga y permite más workers por nodo
+        raw_bytes = table_nbytes(df)
+        df = compact_dataframe(table, df)
+        logging.info(f"Tabla {table}: {raw_bytes} bytes -> {table_nbytes(df)} bytes en memoria")
+        # Esquema, nulos, rangos y clave primaria antes de cargar: con errores
+        # la tarea falla y la tabla publicada queda como estaba
+        profile = profile_table(table, [df])
+        report = ValidationReport({table: profile.rows}, profile.issues)
+        if errors(report):
+            raise ValueError(format_report(report))
+        logging.info(format_report(report))
+        # Se carga sólo en la tabla sombra: publish_tables_task publica todas
+        # juntas cuando terminan las cargas
+        load_staging(table, df, get_engine())
+        logging.info(f"Tabla {table} cargada en {staging_table_name(table)} ({len(df)} filas)")
 
     @task
-    def transform_task():
+    def validate_foreign_keys_task():
         import logging
         import sys
         sys.path.insert(0, "/opt/airflow/src")
         sys.path.insert(0, "/opt/airflow")
-        from src.transform import run_queries
-        from src.load import get_engine, load_all
+        from pandas import read_sql
+        from src.load import get_engine, staging_table_name
+        from src.validation import FOREIGN_KEYS, check_foreign_keys, key_columns, profile_table
 
-        logging.info("Iniciando paso de transformación")
+        # Las claves foráneas cruzan tablas que se cargan en tareas distintas:
+        # se revisan en las tablas sombra antes de publicar, leyendo sólo las
+        # columnas clave por bloques
         engine = get_engine()
-        query_results = run_queries(engine)
-        logging.info(f"Se ejecutaron {len(query_results)} consultas: {list(query_results.keys())}")
-        prefixed = {f"qry_{k}": v for k, v in query_results.items()}
-        load_all(prefixed, engine)
-        logging.info("Paso de transformación completado y resultados de consultas almacenados")
+        tables = {fk.table for fk in FOREIGN_KEYS} | {fk.ref_table for fk in FOREIGN_KEYS}
+        profiles = {}
+        for table in sorted(tables):
+            columns = key_columns(table)
+            chunks = read_sql(
+                f"SELECT {', '.join(columns)} FROM {staging_table_name(table)}", engine, chunksize=200_000
+            )
+            profiles[table] = profile_table(table, chunks, columns=columns)
+        for issue in check_foreign_keys(profiles):
+            logging.warning(f"{issue.table}.{issue.column} {issue.check}: {issue.count} claves (p. ej. {issue.example!r})")
 
     @task
-    def load_task():
-        import os
+    def publish_tables_task():
         import logging
         import sys
         sys.path.insert(0, "/opt/airflow/src")
         sys.path.insert(0, "/opt/airflow")
-        import pandas as pd
+        from src.load import get_engine, publish_staging
+
+        # Todas las tablas base en una sola transacción, con sus índices y el
+        # índice de texto de las reseñas: quien lea la BD (servicio, dashboard)
+        # ve el conjunto anterior completo o el nuevo completo, nunca una mezcla
+        publish_staging(get_engine(), TABLES)
+        logging.info(f"Publicadas {len(TABLES)} tablas")
+
+    @task
+    def refresh_aggregates_task():
+        import logging
+        import sys
+        sys.path.insert(0, "/opt/airflow/src")
+        sys.path.insert(0, "/opt/airflow")
+        from src.aggregates import refresh_aggregates
         from src.load import get_engine
 
-        outdir = "/opt/airflow/query_results"
-        os.makedirs(outdir, exist_ok=True)
-        logging.info(f"Exportando resultados de consultas a {outdir}")
+        refresh_aggregates(get_engine())
+        logging.info("Tablas resumen mensuales/diarias actualizadas")
+
+    @task
+    def refresh_scorecard_task():
+        import logging
+        import sys
+        sys.path.insert(0, "/opt/airflow/src")
+        sys.path.insert(0, "/opt/airflow")
+        from src.load import get_engine
+        from src.sellers import refresh_seller_scorecard
+
+        rows = refresh_seller_scorecard(get_engine())
+        logging.info(f"Scorecard de vendedores actualizado ({rows} vendedores)")
+
+    @task
+    def refresh_delivery_histograms_task():
+        import logging
+        import sys
+        sys.path.insert(0, "/opt/airflow/src")
+        sys.path.insert(0, "/opt/airflow")
+        from src.delivery import refresh_delivery_histograms
+        from src.load import get_engine
+
+        refresh_delivery_histograms(get_engine())
+        logging.info("Histogramas de tiempos de entrega actualizados")
+
+    @task
+    def transform_query(query_name: str, run_id: str | None = None) -> str:
+        import logging
+        import sys
+        sys.path.insert(0, "/opt/airflow/src")
+        sys.path.insert(0, "/opt/airflow")
+        from src.artifacts import write_result_artifact
+        from src.transform import run_query
+        from src.load import get_engine
+
+        logging.info(f"Ejecutando consulta {query_name}")
         engine = get_engine()
-        tables = pd.read_sql("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'qry_%'", engine)
-        logging.info(f"Se encontraron {len(tables)} tablas de resultados: {tables['name'].tolist()}")
-        for name in tables['name'].tolist():
-            df = pd.read_sql(f"SELECT * FROM {name}", engine)
-            outpath = os.path.join(outdir, f"{name}.json")
-            df.to_json(outpath, orient='records', force_ascii=False)
-            logging.info(f"Se escribieron {len(df)} filas en {outpath}")
-
-    # Define order
-    e = extract_task()
-    t = transform_task()
-    l = load_task()
-
-    e >> t >> l
+        result = run_query(query_name, engine, use_cache=True, incremental=True).result
+        # El resultado viaja a la exportación como Parquet tipado; por XCom sólo
+        # pasa la ruta, sin escribirlo y releerlo desde SQLite
+        path = write_result_artifact(query_name, result, run_id=run_id)
+        logging.info(f"Consulta {query_name} completada ({len(result)} filas) -> {path}")
+        return path
+
+    @task
+    def load_task(paths: list[str]):
+        import logging
+        import sys
+        sys.path.insert(0, "/opt/airflow/src")
+        sys.path.insert(0, "/opt/airflow")
+        from src.artifacts import export_artifact_json, export_filter_options
+
+        outdir = "/opt/airflow/query_results"
+        logging.info(f"Exportando {len(paths)} resultados de consultas a {outdir}")
+        for path in paths:
+            outpath = export_artifact_json(path, outdir)
+            logging.info(f"Se escribió {outpath}")
+        # Opciones de los filtros del dashboard, para no leer los datasets al arrancar
+        outpath = export_filter_options(paths, outdir)
+        logging.info(f"Se escribió {outpath}")
+
+    # Una tarea de carga por tabla, en paralelo, y una publicación conjunta de
+    # todas; después, una tarea por consulta. Las consultas dependen sólo de
+    # las tablas que leen (según el registro de src.transform), así que el
+    # camino crítico es la carga más lenta + la consulta más lenta, no la suma
+    # de todas. Las tablas derivadas (resúmenes, scorecard, histogramas) se
+    # recalculan tras la publicación y sus consultas esperan a su tarea. Las
+    # tareas se generan al parsear (no con .expand) porque una tarea mapeada
+    # sólo puede depender del grupo mapeado completo, no de tablas concretas.
+    loads = {
+        table: extract_load_table.override(task_id=f"extract_load_{table}")(table)
+        for table in TABLES
+    }
+    foreign_keys = validate_foreign_keys_task()
+    for table in {fk.table for fk in FOREIGN_KEYS} | {fk.ref_table for fk in FOREIGN_KEYS}:
+        loads[table] >> foreign_keys
+    published = publish_tables_task()
+    for load in loads.values():
+        load >> published
+    foreign_keys >> published
+    aggregates = refresh_aggregates_task()
+    scorecard = refresh_scorecard_task()
+    delivery_histograms = refresh_delivery_histograms_task()
+    published >> [aggregates, scorecard, delivery_histograms]
+    producers = {table: published for table in TABLES}
+    producers.update({table: aggregates for table in SUMMARY_TABLES})
+    producers[SELLER_SCORECARD_TABLE] = scorecard
+    producers[AGG_DELIVERY_HIST_TABLE] = delivery_histograms
+
+    transforms = []
+    for query_name in get_query_functions():
+        t = transform_query.override(task_id=f"transform_{query_name}")(query_name)
+        # Una dependencia por tarea productora, aunque produzca varias tablas
+        upstream = {id(producers[table]): producers[table] for table in get_query_tables(query_name, incremental=True)}
+        for producer in upstream.values():
+            producer >> t
+        transforms.append(t)
+
+    load_task(transforms)
@@ -11,12 +11,14 @@ para el marketplace brasileño Olist durante el período completo 2016-2018.
 # ===================================================================================
 import streamlit as st          # Framework principal para crear la aplicación web
 import pandas as pd            # Manipulación y análisis de datos
-import plotly.express as px    # Gráficos rápidos e interactivos
-import plotly.graph_objects as go  # Gráficos personalizados y avanzados
-from plotly.subplots import make_subplots  # Para crear múltiples gráficos en una figura
 import json                    # Para leer archivos JSON con los datos
-import sqlite3                 # Conector de base de datos SQLite (opcional)
+from concurrent.futures import ThreadPoolExecutor  # Carga paralela de datasets
 from pathlib import Path       # Manejo de rutas de archivos
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx  # Contexto en hilos
+# Plotly (express, graph_objects, subplots) se importa dentro de cada builder de
+# figuras: sólo se paga su import la primera vez que se construye un gráfico
+from src.artifacts import FILTER_OPTIONS_FILE, build_filter_options, result_json_name  # Resultados exportados
+from src.config import QUERY_RESULTS_EXPORT_PATH  # Carpeta donde exporta el pipeline
 
 # ===================================================================================
 # CONFIGURACIÓN INICIAL DE LA APLICACIÓN
@@ -49,88 +51,169 @@ st.sidebar.markdown("---")  # Línea separadora
 # ===================================================================================
 # El decorador @st.cache_data hace que Streamlit guarde en memoria los resultados
 # Esto evita recargar los datos cada vez que el usuario interactúa
+# Carpeta con los resultados de las consultas (JSON en formato records): la
+# misma donde los exportan el pipeline local y el DAG (query_results/qry_<consulta>.json)
+QUERY_RESULTS_DIR = Path(QUERY_RESULTS_EXPORT_PATH)
 
-@st.cache_data
-def load_query_result(filename):
+
+def result_path(name):
+    """Ruta del JSON exportado de una consulta"""
+    return QUERY_RESULTS_DIR / result_json_name(name)
+
+# Datasets que necesita cada página: en cada rerun sólo se cargan los de la
+# página seleccionada (Streamlit re-ejecuta el script en cada interacción)
+PAGE_DATASETS = {
+    "📈 Resumen Ejecutivo": ("revenue_by_month_year", "top_10_revenue_categories"),
+    "💰 Análisis de Ingresos": ("top_10_revenue_categories", "top_10_least_revenue_categories"),
+    "🚚 Performance de Entregas": (
+        "real_vs_estimated_delivered_time", "delivery_percentiles", "delivery_lateness_histogram"
+    ),
+    "🗺️ Distribución Geográfica": ("revenue_per_state",),
+    "👥 Clientes": ("customer_cohorts", "customer_rfm_segments"),
+    "🏪 Vendedores": (),  # lee sólo la página pedida del scorecard en la BD
+    "🔎 Búsqueda de Reseñas": (),  # consulta la BD directamente (índice FTS5)
+}
+
+# Datasets cuya página muestra su propio aviso si aún no se exportaron (las
+# consultas añadidas después de los resultados publicados): sin error al cargar
+OPTIONAL_DATASETS = {
+    "customer_cohorts", "customer_rfm_segments", "delivery_percentiles", "delivery_lateness_histogram"
+}
+
+# Datasets de los que salen las opciones de filtros si falta filter_options.json
+FILTER_DATASETS = ("revenue_by_month_year", "revenue_per_state", "top_10_revenue_categories")
+
+
+def _read_query_result(filename):
     """
-    Carga resultados de consultas desde archivos JSON
-    
+    Lee un JSON de resultados como DataFrame, sin llamar a Streamlit
+    (se ejecuta en hilos del pool de carga)
+
+    Returns:
+        pd.DataFrame | None: None si el archivo no existe
+    """
+    try:
+        with open(result_path(filename), "r") as f:
+            return pd.DataFrame(json.load(f))
+    except FileNotFoundError:
+        return None
+
+
+def dataset_versions(names):
+    """
+    Versión de cada dataset: (mtime, tamaño) de su JSON. Es una llamada a
+    stat por archivo, así que sirve de clave de caché en cada rerun y cambia
+    cuando el pipeline exporta resultados nuevos.
+    """
+    versions = []
+    for name in names:
+        try:
+            stat = result_path(name).stat()
+            versions.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            versions.append(None)
+    return tuple(versions)
+
+
+# Datasets distintos que puede cargar el dashboard
+ALL_DATASETS = tuple(sorted({name for names in PAGE_DATASETS.values() for name in names} | set(FILTER_DATASETS)))
+
+# Versiones parseadas guardadas en caché: la actual y la anterior de cada
+# dataset (un rerun puede llegar durante la exportación del pipeline); las
+# más viejas se descartan
+DATASET_CACHE_ENTRIES = 2 * len(ALL_DATASETS)
+
+
+@st.cache_data(max_entries=DATASET_CACHE_ENTRIES, show_spinner=False)
+def _load_dataset_cached(name, version):
+    """Lee y parsea un dataset; la caché es por (dataset, versión), así cada
+    JSON se parsea una vez aunque lo pidan páginas o gráficos distintos"""
+    return _read_query_result(name)
+
+
+def _load_datasets_cached(names, versions):
+    """Carga varios datasets en paralelo (lectura de disco + parseo JSON de los
+    que no están en caché)"""
+    if len(names) <= 1:
+        return {name: _load_dataset_cached(name, version) for name, version in zip(names, versions)}
+    # Los hilos comparten el contexto del rerun para poder usar la caché de Streamlit
+    with ThreadPoolExecutor(
+        max_workers=len(names), initializer=add_script_run_ctx, initargs=(None, get_script_run_ctx())
+    ) as executor:
+        return dict(zip(names, executor.map(_load_dataset_cached, names, versions)))
+
+
+def load_datasets(names):
+    """
+    Carga los datasets indicados (con caché) y avisa de los que faltan,
+    salvo los de OPTIONAL_DATASETS
+
     Args:
-        filename (str): Nombre del archivo sin extensión .json
-    
+        names (tuple): Nombres de las consultas (sin prefijo ni extensión)
+
     Returns:
-        list: Lista de diccionarios con los datos del JSON
+        dict: nombre -> DataFrame (vacío si no se pudo cargar)
     """
+    names = tuple(names)
+    datasets = _load_datasets_cached(names, dataset_versions(names))
+    result = {}
+    for name, df in datasets.items():
+        if df is None:
+            if name not in OPTIONAL_DATASETS:
+                st.error(f"No se pudo cargar el archivo {result_json_name(name)}")
+            df = pd.DataFrame()
+        result[name] = df
+    return result
+
+
+@st.cache_data(show_spinner=False)
+def _load_filter_options_cached(version):
     try:
-        with open(f"tests/query_results/{filename}.json", "r") as f:
+        with open(QUERY_RESULTS_DIR / FILTER_OPTIONS_FILE, "r") as f:
             return json.load(f)
     except FileNotFoundError:
-        st.error(f"No se pudo cargar el archivo {filename}.json")
-        return []
-
-@st.cache_data
-def load_revenue_by_month():
-    """Carga y procesa datos de ingresos por mes y año"""
-    data = load_query_result("revenue_by_month_year")
-    df = pd.DataFrame(data)
-    return df
-
-@st.cache_data  
-def load_top_categories():
-    """Carga datos de top categorías por ingresos"""
-    data = load_query_result("top_10_revenue_categories")
-    df = pd.DataFrame(data)
-    return df
-
-@st.cache_data
-def load_revenue_by_state():
-    """Carga datos de ingresos por estado"""
-    data = load_query_result("revenue_per_state")
-    df = pd.DataFrame(data)
-    return df
-
-@st.cache_data
-def load_delivery_comparison():
-    """Carga datos de comparación de tiempos de entrega"""
-    data = load_query_result("real_vs_estimated_delivered_time")
-    df = pd.DataFrame(data)
-    return df
+        datasets = _load_datasets_cached(FILTER_DATASETS, dataset_versions(FILTER_DATASETS))
+        return build_filter_options(*(datasets[name] for name in FILTER_DATASETS))
+
+
+def load_filter_options():
+    """
+    Carga las opciones de los filtros desde el artefacto de metadatos
+    (filter_options.json, exportado por el pipeline junto a los resultados).
+    Si no existe, las calcula a partir de los datasets. La caché se invalida
+    cuando el pipeline vuelve a exportar el archivo o los datasets.
+    """
+    try:
+        stat = (QUERY_RESULTS_DIR / FILTER_OPTIONS_FILE).stat()
+        version = (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        version = dataset_versions(FILTER_DATASETS)
+    return _load_filter_options_cached(version)
 
 
 # =========================
 # Helper: filtros sidebar
 # =========================
-def create_sidebar_filters(revenue_df: pd.DataFrame, categories_df: pd.DataFrame, states_df: pd.DataFrame):
+def create_sidebar_filters(options: dict):
     """Crea controles en la barra lateral y devuelve un diccionario con filtros seleccionados."""
     st.sidebar.markdown("---")
     st.sidebar.header("Filtros")
 
-    # Año (toma las columnas YearXXXX del dataframe de revenue)
-    years = []
-    for c in revenue_df.columns:
-        if c.startswith("Year"):
-            try:
-                years.append(int(c.replace("Year", "")))
-            except Exception:
-                continue
-    years = sorted(years)
+    # Año (años con columna YearXXXX en revenue_by_month_year)
     # Añadir opción 'All' para que por defecto no se aplique filtro por año
-    year_options = ["All"] + years
+    year_options = ["All"] + options.get("years", [])
     year = st.sidebar.selectbox("Año", options=year_options, index=0)
 
     # Estado
-    states = list(states_df['customer_state'].dropna().unique()) if 'customer_state' in states_df.columns else []
     # Por defecto no seleccionar estados (equivalente a 'sin filtro')
-    states_selected = st.sidebar.multiselect("Estado(s)", options=sorted(states), default=[])
+    states_selected = st.sidebar.multiselect("Estado(s)", options=options.get("states", []), default=[])
 
     # Categoría
-    cats = list(categories_df['Category'].dropna().unique()) if 'Category' in categories_df.columns else []
     # Por defecto no seleccionar categorías
-    cats_selected = st.sidebar.multiselect("Categoría(s)", options=sorted(cats), default=[])
+    cats_selected = st.sidebar.multiselect("Categoría(s)", options=options.get("categories", []), default=[])
 
     # Mes (opcional)
-    months = list(revenue_df['month'].dropna().unique()) if 'month' in revenue_df.columns else []
-    months_selected = st.sidebar.multiselect("Mes(es)", options=months, default=[])
+    months_selected = st.sidebar.multiselect("Mes(es)", options=options.get("months", []), default=[])
 
     return {
         'year': year,
@@ -160,6 +243,288 @@ def apply_filters_df(df: pd.DataFrame, filters: dict):
 
     return res
 
+# ===================================================================================
+# FIGURAS CACHEADAS
+# ===================================================================================
+# Las figuras se construyen con funciones puras (DataFrame filtrado -> figura)
+# y se memorizan por (versión de los datasets, filtros que les afectan). En un
+# rerun con los mismos filtros Streamlit recibe la especificación ya armada
+# en lugar de rehacer trazas, fillna/dropna y layout.
+
+# Máximo de resultados guardados por builder (cada combinación de filtros es una entrada)
+FIGURE_CACHE_ENTRIES = 64
+
+# Columna sobre la que actúa cada filtro en apply_filters_df
+FILTER_COLUMNS = {'states': 'customer_state', 'categories': 'Category', 'months': 'month'}
+
+
+def _filters_key(filters, frames):
+    """Clave hashable con sólo los filtros que afectan a alguno de los DataFrames"""
+    columns = set()
+    for df in frames:
+        if df is not None:
+            columns.update(df.columns)
+    return tuple(
+        (key, tuple(filters[key]))
+        for key, column in FILTER_COLUMNS.items()
+        if filters.get(key) and column in columns
+    )
+
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def _build_cached(builder_name, names, versions, filters_key):
+    """Aplica los filtros a los datasets y ejecuta el builder; las figuras se guardan como dict"""
+    datasets = _load_datasets_cached(names, versions)
+    filters = {key: list(values) for key, values in filters_key}
+    frames = [
+        apply_filters_df(datasets[name] if datasets[name] is not None else pd.DataFrame(), filters)
+        for name in names
+    ]
+    result = FIGURE_BUILDERS[builder_name](*frames)
+    return result.to_dict() if hasattr(result, "to_plotly_json") else result
+
+
+def cached_build(builder, names, filters):
+    """
+    Devuelve el resultado memorizado de `builder` sobre los datasets `names`
+    filtrados (las figuras como dict, listas para st.plotly_chart)
+
+    Args:
+        builder (callable): Función pura registrada en FIGURE_BUILDERS
+        names (tuple): Datasets que recibe el builder, en orden
+        filters (dict): Filtros del sidebar
+    """
+    names = tuple(names)
+    versions = dataset_versions(names)
+    datasets = _load_datasets_cached(names, versions)
+    key = _filters_key(filters, datasets.values())
+    return _build_cached(builder.__name__, names, versions, key)
+
+
+def build_revenue_trend_figure(revenue_df):
+    """Gráfico principal: evolución temporal de ingresos (una línea por año)"""
+    import plotly.graph_objects as go  # Gráficos personalizados y avanzados
+
+    # Crear figura usando plotly.graph_objects para más control
+    fig = go.Figure()
+
+    # Una línea por año (rojo, azul, naranja): eje X meses, eje Y ingresos del año
+    for year, color in (("2016", '#d62728'), ("2017", '#1f77b4'), ("2018", '#ff7f0e')):
+        fig.add_trace(go.Scatter(
+            x=revenue_df['month'],
+            y=revenue_df[f'Year{year}'],
+            mode='lines+markers',           # Mostrar líneas y puntos
+            name=year,                      # Nombre en la leyenda
+            line=dict(color=color, width=3),
+            marker=dict(size=8)             # Tamaño de los marcadores
+        ))
+
+    # Configurar el layout del gráfico
+    fig.update_layout(
+        title="Ingresos Mensuales 2016-2018",    # Título del gráfico actualizado
+        xaxis_title="Mes",                       # Etiqueta eje X
+        yaxis_title="Ingresos ($)",              # Etiqueta eje Y
+        height=500,                              # Altura en píxeles
+        hovermode='x unified'                    # Mostrar hover unificado por X
+    )
+    return fig
+
+
+def build_top_categories_figure(categories_df):
+    """Barras horizontales de las categorías con mayores ingresos"""
+    import plotly.express as px    # Gráficos rápidos e interactivos
+
+    # Usar plotly.express para gráfico de barras rápido
+    fig = px.bar(
+        categories_df,                           # DataFrame con los datos
+        x='Revenue',                            # Columna para eje X
+        y='Category',                           # Columna para eje Y
+        orientation='h',                        # Horizontal (barras acostadas)
+        title="Categorías con Mayores Ingresos", # Título
+        labels={'Revenue': 'Ingresos ($)', 'Category': 'Categoría'},  # Etiquetas
+        color='Revenue',                        # Colorear por valor de ingresos
+        color_continuous_scale='viridis'        # Esquema de colores
+    )
+
+    # Configurar layout específico
+    fig.update_layout(
+        height=600,                             # Altura del gráfico
+        yaxis={'categoryorder':'total ascending'} # Ordenar categorías por valor
+    )
+    return fig
+
+
+def build_least_categories_figure(least_df):
+    """Barras de las 10 categorías con menores ingresos"""
+    import plotly.express as px
+
+    fig = px.bar(
+        least_df,
+        x='Category',
+        y='Revenue',
+        title="10 Categorías con Menores Ingresos",
+        labels={'Revenue': 'Ingresos ($)', 'Category': 'Categoría'},
+        color='Revenue',
+        color_continuous_scale='reds'
+    )
+    fig.update_layout(height=400, xaxis_tickangle=-45)
+    return fig
+
+
+def build_delivery_comparison_figure(delivery_df):
+    """Tiempo real vs estimado de entrega por mes, un subplot por año"""
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots  # Para crear múltiples gráficos en una figura
+
+    months = delivery_df['month'].tolist()
+
+    fig = make_subplots(
+        rows=3, cols=1,
+        subplot_titles=('Año 2016', 'Año 2017', 'Año 2018'),
+        vertical_spacing=0.08
+    )
+
+    # (año, color real, color estimado) de cada fila
+    years = (("2016", 'darkred', 'lightcoral'), ("2017", 'blue', 'lightblue'), ("2018", 'orange', 'moccasin'))
+    for row, (year, real_color, est_color) in enumerate(years, start=1):
+        fig.add_trace(
+            go.Scatter(x=months, y=delivery_df[f'Year{year}_real_time'].fillna(0), name=f'Real {year}',
+                      line=dict(color=real_color), legendgroup=year),
+            row=row, col=1
+        )
+        fig.add_trace(
+            go.Scatter(x=months, y=delivery_df[f'Year{year}_estimated_time'].fillna(0), name=f'Estimado {year}',
+                      line=dict(color=est_color, dash='dash'), legendgroup=year),
+            row=row, col=1
+        )
+
+    fig.update_layout(height=900, title_text="Comparación de Tiempos de Entrega por Mes")
+    for row in (1, 2, 3):
+        fig.update_yaxes(title_text="Días", row=row, col=1)
+    return fig
+
+
+def build_delivery_averages(delivery_df):
+    """Promedios (sin nulos) de tiempo real y estimado por año"""
+    return {
+        f'{kind}_{year}': delivery_df[f'Year{year}_{kind}_time'].dropna().mean()
+        for year in ("2016", "2017", "2018")
+        for kind in ("real", "estimated")
+    }
+
+
+def build_states_figure(states_df):
+    """Barras de ingresos por estado (Top 15)"""
+    import plotly.express as px
+
+    fig = px.bar(
+        states_df.head(15),  # Top 15 estados
+        x='customer_state',
+        y='Revenue',
+        title="Ingresos por Estado (Top 15)",
+        labels={'Revenue': 'Ingresos ($)', 'customer_state': 'Estado'},
+        color='Revenue',
+        color_continuous_scale='blues'
+    )
+    fig.update_layout(height=500)
+    return fig
+
+
+def build_cohort_retention_figure(cohorts_df):
+    """Mapa de calor de retención: cohorte de adquisición x meses desde la primera compra"""
+    import plotly.express as px
+
+    matrix = cohorts_df.pivot(index='cohort_month', columns='period', values='retention').sort_index()
+    # El mes 0 es siempre 100%: se omite para que la escala muestre la recompra
+    matrix = matrix.drop(columns=0, errors='ignore') * 100
+    fig = px.imshow(
+        matrix,
+        labels={'x': 'Meses desde la primera compra', 'y': 'Cohorte', 'color': 'Retención %'},
+        color_continuous_scale='blues',
+        aspect='auto',
+        title="Retención de clientes por cohorte mensual (%)"
+    )
+    fig.update_layout(height=600)
+    return fig
+
+
+def build_rfm_segments_figure(segments_df):
+    """Barras de clientes por segmento RFM, coloreadas por gasto promedio"""
+    import plotly.express as px
+
+    fig = px.bar(
+        segments_df,
+        x='segment',
+        y='customers',
+        color='monetary',
+        title="Clientes por segmento RFM",
+        labels={'segment': 'Segmento', 'customers': 'Clientes', 'monetary': 'Gasto promedio ($)'},
+        color_continuous_scale='viridis'
+    )
+    fig.update_layout(height=450)
+    return fig
+
+
+# Días de adelanto/atraso mostrados en el histograma; las colas se acumulan en los extremos
+LATENESS_RANGE_DAYS = 30
+
+
+def build_lateness_histogram_figure(lateness_df):
+    """Histograma de días de atraso (entrega real - estimada) de los estados filtrados"""
+    import plotly.express as px
+
+    hist = lateness_df.assign(days=lateness_df['days'].clip(-LATENESS_RANGE_DAYS, LATENESS_RANGE_DAYS))
+    hist = hist.groupby('days', as_index=False)['order_count'].sum()
+    hist['status'] = hist['days'].gt(0).map({True: 'Atrasado', False: 'A tiempo'})
+    fig = px.bar(
+        hist,
+        x='days',
+        y='order_count',
+        color='status',
+        color_discrete_map={'Atrasado': '#d62728', 'A tiempo': '#2ca02c'},
+        title="Días de atraso respecto a la fecha estimada",
+        labels={'days': 'Días (negativo = antes de lo estimado)', 'order_count': 'Pedidos', 'status': ''}
+    )
+    fig.update_layout(height=450, bargap=0.05)
+    return fig
+
+
+def build_delivery_percentiles_figure(percentiles_df):
+    """Percentiles 50/90/99 del tiempo de entrega por estado, ordenados por p90"""
+    import plotly.graph_objects as go
+
+    states = percentiles_df[percentiles_df['dimension'] == 'customer_state']
+    states = states.sort_values('delivery_days_p90', ascending=False)
+    fig = go.Figure()
+    for p, color in (('p50', '#9ecae1'), ('p90', '#3182bd'), ('p99', '#08519c')):
+        fig.add_trace(go.Bar(x=states['value'], y=states[f'delivery_days_{p}'], name=p.upper(), marker_color=color))
+    fig.update_layout(
+        title="Percentiles del tiempo de entrega por estado (días)",
+        xaxis_title="Estado",
+        yaxis_title="Días",
+        barmode='group',
+        height=450
+    )
+    return fig
+
+
+# Builders que puede ejecutar _build_cached (por nombre: la clave de caché es un str)
+FIGURE_BUILDERS = {
+    builder.__name__: builder
+    for builder in (
+        build_revenue_trend_figure,
+        build_top_categories_figure,
+        build_least_categories_figure,
+        build_delivery_comparison_figure,
+        build_delivery_averages,
+        build_states_figure,
+        build_cohort_retention_figure,
+        build_rfm_segments_figure,
+        build_lateness_histogram_figure,
+        build_delivery_percentiles_figure,
+    )
+}
+
 # ===================================================================================
 # FUNCIÓN PRINCIPAL DEL DASHBOARD - SISTEMA DE NAVEGACIÓN
 # ===================================================================================
@@ -175,35 +540,42 @@ def main():
         "📈 Resumen Ejecutivo",      # Vista general con KPIs principales
         "💰 Análisis de Ingresos",   # Deep dive en categorías y tendencias
         "🚚 Performance de Entregas", # Métricas de cumplimiento
-        "🗺️ Distribución Geográfica" # Análisis por estados
+        "🗺️ Distribución Geográfica", # Análisis por estados
+        "👥 Clientes",               # Cohortes, retención y segmentos RFM
+        "🏪 Vendedores",             # Scorecard paginado de vendedores
+        "🔎 Búsqueda de Reseñas"     # Búsqueda de texto en las reseñas
     ]
 
     # selectbox crea un menú desplegable - el usuario elige una opción
     selected_page = st.sidebar.selectbox("Selecciona una sección:", menu_options)
 
-    # Cargar datos una vez (después de la selección de página) para poblar filtros
-    revenue_df = load_revenue_by_month()
-    categories_df = load_top_categories()
-    states_df = load_revenue_by_state()
-    delivery_df = load_delivery_comparison()
+    # Los filtros salen del artefacto de metadatos: no hace falta cargar datasets
+    filter_options = load_filter_options()
+    filters = create_sidebar_filters(filter_options)
+
+    # Cargar sólo los datasets que declara la página seleccionada
+    data = load_datasets(PAGE_DATASETS[selected_page])
 
-    # Crear filtros en la barra lateral
-    filters = create_sidebar_filters(revenue_df, categories_df, states_df)
-    
     # Según la selección, mostrar la página correspondiente
     if selected_page == "📈 Resumen Ejecutivo":
-        show_executive_summary(filters, revenue_df, categories_df, states_df)
+        show_executive_summary(filters, data["revenue_by_month_year"], data["top_10_revenue_categories"])
     elif selected_page == "💰 Análisis de Ingresos":
-        show_revenue_analysis(filters, categories_df)
+        show_revenue_analysis(filters, data["top_10_revenue_categories"], data["top_10_least_revenue_categories"])
     elif selected_page == "🚚 Performance de Entregas":
-        show_delivery_analysis(filters, delivery_df)
+        show_delivery_analysis(filters, data["delivery_percentiles"], data["delivery_lateness_histogram"])
     elif selected_page == "🗺️ Distribución Geográfica":
-        show_geographic_analysis(filters, states_df)
+        show_geographic_analysis(filters, data["revenue_per_state"])
+    elif selected_page == "👥 Clientes":
+        show_customer_analysis(filters, data["customer_cohorts"], data["customer_rfm_segments"])
+    elif selected_page == "🏪 Vendedores":
+        show_seller_scorecard(filter_options)
+    elif selected_page == "🔎 Búsqueda de Reseñas":
+        show_review_search(filter_options)
 
 # ===================================================================================
 # PÁGINA 1: RESUMEN EJECUTIVO
 # ===================================================================================
-def show_executive_summary(filters, revenue_df=None, categories_df=None, states_df=None):
+def show_executive_summary(filters, revenue_df, categories_df):
     """
     Página de resumen ejecutivo con métricas principales
     
@@ -214,16 +586,9 @@ def show_executive_summary(filters, revenue_df=None, categories_df=None, states_
     """
     st.header("📈 Resumen Ejecutivo")
     
-    # Cargar todos los datos necesarios para esta página
-    # Si los DataFrames se pasaron desde main, úsalos, sino cárgalos
-    revenue_df = revenue_df if revenue_df is not None else load_revenue_by_month()
-    categories_df = categories_df if categories_df is not None else load_top_categories()
-    states_df = states_df if states_df is not None else load_revenue_by_state()
-
-    # Aplicar filtros de sidebar
+    # Aplicar filtros de sidebar (los datos llegan cargados desde main)
     revenue_df = apply_filters_df(revenue_df, filters)
     categories_df = apply_filters_df(categories_df, filters)
-    states_df = apply_filters_df(states_df, filters)
     
     # ===================================================================================
     # CÁLCULO DE MÉTRICAS PRINCIPALES
@@ -281,48 +646,9 @@ def show_executive_summary(filters, revenue_df=None, categories_df=None, states_
     # ===================================================================================
     st.subheader("📊 Evolución de Ingresos Mensuales")
     
-    # Crear figura usando plotly.graph_objects para más control
-    fig = go.Figure()
-    
-    # Agregar línea para 2016
-    fig.add_trace(go.Scatter(
-        x=revenue_df['month'],           # Eje X: meses
-        y=revenue_df['Year2016'],        # Eje Y: ingresos 2016
-        mode='lines+markers',           # Mostrar líneas y puntos
-        name='2016',                    # Nombre en la leyenda
-        line=dict(color='#d62728', width=3),  # Color rojo
-        marker=dict(size=8)             # Tamaño de los marcadores
-    ))
-    
-    # Agregar línea para 2017
-    fig.add_trace(go.Scatter(
-        x=revenue_df['month'],           # Eje X: meses
-        y=revenue_df['Year2017'],        # Eje Y: ingresos 2017
-        mode='lines+markers',           # Mostrar líneas y puntos
-        name='2017',                    # Nombre en la leyenda
-        line=dict(color='#1f77b4', width=3),  # Color azul
-        marker=dict(size=8)             # Tamaño de los marcadores
-    ))
-    
-    # Agregar línea para 2018
-    fig.add_trace(go.Scatter(
-        x=revenue_df['month'],
-        y=revenue_df['Year2018'],
-        mode='lines+markers',
-        name='2018',
-        line=dict(color='#ff7f0e', width=3),  # Color naranja
-        marker=dict(size=8)
-    ))
-    
-    # Configurar el layout del gráfico
-    fig.update_layout(
-        title="Ingresos Mensuales 2016-2018",    # Título del gráfico actualizado
-        xaxis_title="Mes",                       # Etiqueta eje X
-        yaxis_title="Ingresos ($)",              # Etiqueta eje Y
-        height=500,                              # Altura en píxeles
-        hovermode='x unified'                    # Mostrar hover unificado por X
-    )
-    
+    # Figura cacheada por versión del dataset y filtros (ver build_revenue_trend_figure)
+    fig = cached_build(build_revenue_trend_figure, ("revenue_by_month_year",), filters)
+
     # Mostrar el gráfico en Streamlit (use_container_width=True hace que use todo el ancho)
     st.plotly_chart(fig, use_container_width=True)
     
@@ -351,7 +677,7 @@ def show_executive_summary(filters, revenue_df=None, categories_df=None, states_
 # ===================================================================================
 # PÁGINA 2: ANÁLISIS DE INGRESOS
 # ===================================================================================
-def show_revenue_analysis(filters, categories_df=None):
+def show_revenue_analysis(filters, categories_df, least_df):
     """
     Página de análisis detallado de ingresos
     
@@ -365,46 +691,17 @@ def show_revenue_analysis(filters, categories_df=None):
     # Gráfico de top categorías
     st.subheader("🏆 Top 10 Categorías por Ingresos")
     
-    categories_df = categories_df if categories_df is not None else load_top_categories()
     categories_df = apply_filters_df(categories_df, filters)
     
-    # Usar plotly.express para gráfico de barras rápido
-    fig = px.bar(
-        categories_df,                           # DataFrame con los datos
-        x='Revenue',                            # Columna para eje X
-        y='Category',                           # Columna para eje Y
-        orientation='h',                        # Horizontal (barras acostadas)
-        title="Categorías con Mayores Ingresos", # Título
-        labels={'Revenue': 'Ingresos ($)', 'Category': 'Categoría'},  # Etiquetas
-        color='Revenue',                        # Colorear por valor de ingresos
-        color_continuous_scale='viridis'        # Esquema de colores
-    )
-    
-    # Configurar layout específico
-    fig.update_layout(
-        height=600,                             # Altura del gráfico
-        yaxis={'categoryorder':'total ascending'} # Ordenar categorías por valor
-    )
+    fig = cached_build(build_top_categories_figure, ("top_10_revenue_categories",), filters)
     st.plotly_chart(fig, use_container_width=True)
     
     # Análisis de categorías menos exitosas
     st.subheader("📉 Categorías con Menor Rendimiento")
     
-    least_categories = load_query_result("top_10_least_revenue_categories")
-    least_df = pd.DataFrame(least_categories)
-    
     if not least_df.empty:
-        fig2 = px.bar(
-            least_df,
-            x='Category',
-            y='Revenue',
-            title="10 Categorías con Menores Ingresos",
-            labels={'Revenue': 'Ingresos ($)', 'Category': 'Categoría'},
-            color='Revenue',
-            color_continuous_scale='reds'
-        )
-        
-        fig2.update_layout(height=400, xaxis_tickangle=-45)
+        # Sin filtros: esta vista siempre muestra las 10 categorías con menores ingresos
+        fig2 = cached_build(build_least_categories_figure, ("top_10_least_revenue_categories",), {})
         st.plotly_chart(fig2, use_container_width=True)
     
     # Tabla de detalles
@@ -426,75 +723,20 @@ def show_revenue_analysis(filters, categories_df=None):
             least_display['Revenue'] = least_display['Revenue'].apply(lambda x: f"${x:,.0f}")
             st.dataframe(least_display, hide_index=True)
 
-def show_delivery_analysis(filters, delivery_df=None):
-    """Página de análisis de performance de entregas"""
+def show_delivery_analysis(filters, percentiles_df, lateness_df):
+    """
+    Página de análisis de performance de entregas
+
+    Muestra:
+    - Tiempo real vs estimado por mes y año
+    - Distribución de los días de atraso y percentiles del tiempo de entrega por estado
+    """
     st.header("🚚 Performance de Entregas")
     
-    delivery_df = delivery_df if delivery_df is not None else load_delivery_comparison()
-    delivery_df = apply_filters_df(delivery_df, filters)
-    
     # Gráfico de comparación tiempos reales vs estimados
     st.subheader("⏱️ Tiempo Real vs Estimado de Entrega")
     
-    # Filtrar datos válidos para 2016, 2017 y 2018
-    months = delivery_df['month'].tolist()
-    
-    fig = make_subplots(
-        rows=3, cols=1,
-        subplot_titles=('Año 2016', 'Año 2017', 'Año 2018'),
-        vertical_spacing=0.08
-    )
-    
-    # Datos 2016
-    real_2016 = delivery_df['Year2016_real_time'].fillna(0)
-    est_2016 = delivery_df['Year2016_estimated_time'].fillna(0)
-    
-    fig.add_trace(
-        go.Scatter(x=months, y=real_2016, name='Real 2016', 
-                  line=dict(color='darkred'), legendgroup="2016"),
-        row=1, col=1
-    )
-    fig.add_trace(
-        go.Scatter(x=months, y=est_2016, name='Estimado 2016', 
-                  line=dict(color='lightcoral', dash='dash'), legendgroup="2016"),
-        row=1, col=1
-    )
-    
-    # Datos 2017
-    real_2017 = delivery_df['Year2017_real_time'].fillna(0)
-    est_2017 = delivery_df['Year2017_estimated_time'].fillna(0)
-    
-    fig.add_trace(
-        go.Scatter(x=months, y=real_2017, name='Real 2017', 
-                  line=dict(color='blue'), legendgroup="2017"),
-        row=2, col=1
-    )
-    fig.add_trace(
-        go.Scatter(x=months, y=est_2017, name='Estimado 2017', 
-                  line=dict(color='lightblue', dash='dash'), legendgroup="2017"),
-        row=2, col=1
-    )
-    
-    # Datos 2018
-    real_2018 = delivery_df['Year2018_real_time'].fillna(0)
-    est_2018 = delivery_df['Year2018_estimated_time'].fillna(0)
-    
-    fig.add_trace(
-        go.Scatter(x=months, y=real_2018, name='Real 2018', 
-                  line=dict(color='orange'), legendgroup="2018"),
-        row=3, col=1
-    )
-    fig.add_trace(
-        go.Scatter(x=months, y=est_2018, name='Estimado 2018', 
-                  line=dict(color='moccasin', dash='dash'), legendgroup="2018"),
-        row=3, col=1
-    )
-    
-    fig.update_layout(height=900, title_text="Comparación de Tiempos de Entrega por Mes")
-    fig.update_yaxes(title_text="Días", row=1, col=1)
-    fig.update_yaxes(title_text="Días", row=2, col=1)
-    fig.update_yaxes(title_text="Días", row=3, col=1)
-    
+    fig = cached_build(build_delivery_comparison_figure, ("real_vs_estimated_delivered_time",), filters)
     st.plotly_chart(fig, use_container_width=True)
     
     # Métricas de performance
@@ -502,14 +744,11 @@ def show_delivery_analysis(filters, delivery_df=None):
     
     col1, col2, col3, col4 = st.columns(4)
     
-    # Calcular métricas (solo con valores no nulos)
-    avg_real_2016 = delivery_df['Year2016_real_time'].dropna().mean()
-    avg_real_2017 = delivery_df['Year2017_real_time'].dropna().mean()
-    avg_real_2018 = delivery_df['Year2018_real_time'].dropna().mean()
-    avg_est_2016 = delivery_df['Year2016_estimated_time'].dropna().mean()
-    avg_est_2017 = delivery_df['Year2017_estimated_time'].dropna().mean()
-    # Calcular promedio estimado 2018 aquí para que esté disponible antes de usarlo
-    avg_est_2018 = delivery_df['Year2018_estimated_time'].dropna().mean()
+    # Calcular métricas (solo con valores no nulos), también cacheadas por filtros
+    averages = cached_build(build_delivery_averages, ("real_vs_estimated_delivered_time",), filters)
+    avg_real_2016, avg_est_2016 = averages['real_2016'], averages['estimated_2016']
+    avg_real_2017, avg_est_2017 = averages['real_2017'], averages['estimated_2017']
+    avg_real_2018, avg_est_2018 = averages['real_2018'], averages['estimated_2018']
     
     with col1:
         if not pd.isna(avg_real_2016):
@@ -567,7 +806,6 @@ def show_delivery_analysis(filters, delivery_df=None):
             accuracies.append(100 - accuracy_2017)
         
         # Agregar precisión 2018 si hay datos
-        avg_est_2018 = delivery_df['Year2018_estimated_time'].dropna().mean()
         if not pd.isna(avg_real_2018) and not pd.isna(avg_est_2018) and avg_est_2018 > 0:
             accuracy_2018 = abs(avg_real_2018 - avg_est_2018) / avg_est_2018 * 100
             accuracies.append(100 - accuracy_2018)
@@ -586,27 +824,48 @@ def show_delivery_analysis(filters, delivery_df=None):
                 delta="En desarrollo"
             )
 
-def show_geographic_analysis(filters, states_df=None):
+    # Distribución de tiempos: los promedios esconden la cola de pedidos muy atrasados
+    st.subheader("📐 Distribución de Tiempos de Entrega")
+
+    if percentiles_df.empty or lateness_df.empty:
+        st.info(f"💡 Faltan los resultados de las consultas de distribución ({result_json_name('delivery_percentiles')}, {result_json_name('delivery_lateness_histogram')}) en {QUERY_RESULTS_DIR}: ejecuta el pipeline (python run_pipeline.py) para exportarlos")
+        return
+
+    lateness = apply_filters_df(lateness_df, filters)
+    total = lateness['order_count'].sum()
+    late = lateness.loc[lateness['days'] > 0, 'order_count'].sum()
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("📦 Pedidos entregados", f"{total:,}")
+    with col2:
+        st.metric("⏰ Entregados con atraso", f"{late / max(total, 1) * 100:.1f}%", "estados filtrados")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        fig = cached_build(build_lateness_histogram_figure, ("delivery_lateness_histogram",), filters)
+        st.plotly_chart(fig, use_container_width=True)
+    with col2:
+        fig = cached_build(build_delivery_percentiles_figure, ("delivery_percentiles",), filters)
+        st.plotly_chart(fig, use_container_width=True)
+
+    table = percentiles_df[percentiles_df['dimension'] == 'customer_state'].drop(columns='dimension')
+    table['late_share'] = (table['late_share'] * 100).round(1)
+    st.dataframe(
+        table.round(1).rename(columns={'value': 'Estado', 'order_count': 'Pedidos', 'late_share': 'Atrasados %'}),
+        use_container_width=True,
+        hide_index=True
+    )
+
+def show_geographic_analysis(filters, states_df):
     """Página de análisis geográfico"""
     st.header("🗺️ Distribución Geográfica")
     
-    states_df = states_df if states_df is not None else load_revenue_by_state()
     states_df = apply_filters_df(states_df, filters)
     
     # Gráfico de barras por estado
     st.subheader("💰 Ingresos por Estado")
     
-    fig = px.bar(
-        states_df.head(15),  # Top 15 estados
-        x='customer_state',
-        y='Revenue',
-        title="Ingresos por Estado (Top 15)",
-        labels={'Revenue': 'Ingresos ($)', 'customer_state': 'Estado'},
-        color='Revenue',
-        color_continuous_scale='blues'
-    )
-    
-    fig.update_layout(height=500)
+    fig = cached_build(build_states_figure, ("revenue_per_state",), filters)
     st.plotly_chart(fig, use_container_width=True)
     
     # Análisis de concentración
@@ -636,6 +895,255 @@ def show_geographic_analysis(filters, states_df=None):
         else:
             st.success("✅ Distribución geográfica balanceada")
 
+# ===================================================================================
+# PÁGINA 5: CLIENTES (COHORTES Y RFM)
+# ===================================================================================
+def show_customer_analysis(filters, cohorts_df, segments_df):
+    """
+    Página de análisis de clientes
+
+    Muestra:
+    - Retención de cada cohorte mensual de adquisición (clientes por customer_unique_id)
+    - Segmentos RFM (recencia, frecuencia y valor monetario)
+    """
+    st.header("👥 Análisis de Clientes")
+
+    if cohorts_df.empty or segments_df.empty:
+        st.info(f"💡 Faltan los resultados de las consultas de clientes ({result_json_name('customer_cohorts')}, {result_json_name('customer_rfm_segments')}) en {QUERY_RESULTS_DIR}: ejecuta el pipeline (python run_pipeline.py) para exportarlos")
+        return
+
+    # Métricas de recompra a partir de las cohortes
+    col1, col2, col3 = st.columns(3)
+    sizes = cohorts_df[cohorts_df['period'] == 0]
+    total_customers = sizes['cohort_size'].sum()
+    month_1 = cohorts_df[cohorts_df['period'] == 1]
+
+    with col1:
+        st.metric("👤 Clientes únicos", f"{total_customers:,}")
+    with col2:
+        st.metric("🔁 Retención al mes 1", f"{month_1['customers'].sum() / max(month_1['cohort_size'].sum(), 1) * 100:.2f}%",
+                  "promedio ponderado de las cohortes")
+    with col3:
+        st.metric("🏆 Champions", f"{segments_df.set_index('segment')['share'].get('Champions', 0) * 100:.1f}%",
+                  "de los clientes")
+
+    st.subheader("📅 Retención por Cohorte")
+    fig = cached_build(build_cohort_retention_figure, ("customer_cohorts",), filters)
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.subheader("🎯 Segmentos RFM")
+    col1, col2 = st.columns([3, 2])
+    with col1:
+        fig = cached_build(build_rfm_segments_figure, ("customer_rfm_segments",), filters)
+        st.plotly_chart(fig, use_container_width=True)
+    with col2:
+        table = segments_df.copy()
+        table['share'] = (table['share'] * 100).round(1)
+        table['recency'] = table['recency'].round(0)
+        table['frequency'] = table['frequency'].round(2)
+        table['monetary'] = table['monetary'].apply(lambda x: f"${x:,.0f}")
+        table['monetary_total'] = table['monetary_total'].apply(lambda x: f"${x:,.0f}")
+        st.dataframe(table.rename(columns={
+            'segment': 'Segmento',
+            'customers': 'Clientes',
+            'share': 'Participación %',
+            'recency': 'Recencia (días)',
+            'frequency': 'Pedidos',
+            'monetary': 'Gasto promedio',
+            'monetary_total': 'Gasto total',
+        }), hide_index=True)
+
+# ===================================================================================
+# PÁGINA 6: SCORECARD DE VENDEDORES
+# ===================================================================================
+# Columnas del scorecard por las que se puede ordenar, con su etiqueta
+SCORECARD_SORT_LABELS = {
+    'revenue': 'Ingresos',
+    'order_count': 'Pedidos',
+    'item_count': 'Ítems',
+    'on_time_rate': 'Entregas a tiempo %',
+    'avg_review_score': 'Reseña promedio',
+    'avg_freight': 'Flete promedio',
+    'avg_distance_km': 'Distancia promedio (km)',
+}
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _seller_states_cached(db_path, version):
+    """Estados de los vendedores del scorecard; la versión de la tabla es la clave"""
+    from src.load import get_engine
+    from src.sellers import read_seller_states
+
+    return read_seller_states(get_engine(db_path, read_only=True))
+
+
+def show_seller_scorecard(options):
+    """
+    Página del scorecard de vendedores (tabla seller_scorecard de la BD)
+
+    El orden y la paginación se resuelven en SQL: en cada rerun sólo se leen
+    las filas de la página visible, no el scorecard completo
+    """
+    st.header("🏪 Scorecard de Vendedores")
+
+    # Se importan aquí: SQLAlchemy y src.sellers sólo se cargan en esta página
+    from sqlalchemy.exc import OperationalError
+    from src.config import SQLITE_BD_ABSOLUTE_PATH
+    from src.cache import get_table_versions
+    from src.load import get_engine
+    from src.sellers import SELLER_SCORECARD_TABLE, read_scorecard_page
+
+    if not Path(SQLITE_BD_ABSOLUTE_PATH).exists():
+        st.warning("⚠️ No se encontró la base de datos: ejecuta primero el pipeline (run_pipeline.py)")
+        return
+
+    engine = get_engine(SQLITE_BD_ABSOLUTE_PATH, read_only=True)
+    versions = get_table_versions(engine, [SELLER_SCORECARD_TABLE])
+    if versions is None:
+        st.warning("⚠️ La base de datos no tiene el scorecard de vendedores: vuelve a ejecutar el pipeline")
+        return
+    # Los estados de los vendedores (no los de clientes de los filtros del sidebar)
+    seller_states = _seller_states_cached(SQLITE_BD_ABSOLUTE_PATH, versions[SELLER_SCORECARD_TABLE])
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        sort_label = st.selectbox("Ordenar por", options=list(SCORECARD_SORT_LABELS.values()))
+        sort_by = {label: column for column, label in SCORECARD_SORT_LABELS.items()}[sort_label]
+    with col2:
+        descending = st.radio("Orden", options=["Descendente", "Ascendente"], horizontal=True) == "Descendente"
+    with col3:
+        state = st.selectbox("Estado del vendedor", options=["Todos"] + seller_states)
+    with col4:
+        page_size = st.selectbox("Filas por página", options=[25, 50, 100])
+
+    page = st.number_input("Página", min_value=1, value=1, step=1)
+    try:
+        rows, total = read_scorecard_page(
+            engine,
+            page=page - 1,
+            page_size=page_size,
+            sort_by=sort_by,
+            descending=descending,
+            state=None if state == "Todos" else state,
+        )
+    except OperationalError:
+        st.warning("⚠️ La base de datos no tiene el scorecard de vendedores: vuelve a ejecutar el pipeline")
+        return
+
+    pages = max((total + page_size - 1) // page_size, 1)
+    if rows.empty:
+        st.info(f"Sin vendedores en esta página (hay {pages} páginas)")
+        return
+
+    st.caption(f"Página {page} de {pages} · {total:,} vendedores")
+    rows['on_time_rate'] = (rows['on_time_rate'] * 100).round(1)
+    st.dataframe(
+        rows.rename(columns={'seller_id': 'Vendedor', 'seller_state': 'Estado', **SCORECARD_SORT_LABELS}),
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            'Ingresos': st.column_config.NumberColumn(format="$%.2f"),
+            'Reseña promedio': st.column_config.NumberColumn(format="%.2f ⭐"),
+            'Flete promedio': st.column_config.NumberColumn(format="$%.2f"),
+            'Distancia promedio (km)': st.column_config.NumberColumn(format="%.0f"),
+        },
+    )
+
+# ===================================================================================
+# PÁGINA 7: BÚSQUEDA DE RESEÑAS
+# ===================================================================================
+# Máximo de reseñas que devuelve cada búsqueda
+REVIEW_SEARCH_LIMIT = 100
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _review_filters_cached(db_path, versions):
+    """Estados y categorías del índice de reseñas; las versiones de sus tablas origen son la clave"""
+    from src.load import get_engine
+    from src.transform import read_review_filters
+
+    return read_review_filters(get_engine(db_path, read_only=True))
+
+
+def show_review_search(options):
+    """
+    Página de búsqueda de texto en los comentarios de las reseñas
+
+    A diferencia del resto de páginas no lee los JSON exportados: consulta el
+    índice FTS5 de la BD (construido en la carga) con src.transform.search_reviews
+    """
+    st.header("🔎 Búsqueda de Reseñas")
+
+    # Se importan aquí: SQLAlchemy y src.transform sólo se cargan en esta página
+    from sqlalchemy.exc import OperationalError
+    from src.config import SQLITE_BD_ABSOLUTE_PATH
+    from src.cache import get_table_versions
+    from src.load import REVIEWS_FTS_SOURCE_TABLES, get_engine
+    from src.transform import read_review_filters, search_reviews
+
+    if not Path(SQLITE_BD_ABSOLUTE_PATH).exists():
+        st.warning("⚠️ No se encontró la base de datos: ejecuta primero el pipeline (run_pipeline.py)")
+        return
+
+    engine = get_engine(SQLITE_BD_ABSOLUTE_PATH, read_only=True)
+    versions = get_table_versions(engine, REVIEWS_FTS_SOURCE_TABLES)
+    try:
+        # Todos los estados y categorías con reseñas, no sólo el top 10 del
+        # sidebar; sin versiones de las tablas no hay clave y se leen siempre
+        if versions is None:
+            states, categories = read_review_filters(engine)
+        else:
+            states, categories = _review_filters_cached(SQLITE_BD_ABSOLUTE_PATH, tuple(sorted(versions.items())))
+    except OperationalError:
+        st.warning("⚠️ La base de datos no tiene el índice de reseñas: vuelve a ejecutar la carga")
+        return
+
+    search = st.text_input(
+        "Buscar en los comentarios",
+        placeholder="ej.: produto não chegou, entrega atrasada...",
+        help="No distingue mayúsculas ni tildes; cada palabra se busca como prefijo",
+    )
+    col1, col2 = st.columns(2)
+    with col1:
+        state = st.selectbox("Estado", options=["Todos"] + states)
+    with col2:
+        category = st.selectbox("Categoría", options=["Todas"] + categories)
+
+    if not search.strip():
+        st.info("💡 Escribe una o más palabras para buscar entre las reseñas")
+        return
+
+    try:
+        results = search_reviews(
+            engine,
+            search,
+            limit=REVIEW_SEARCH_LIMIT,
+            state=None if state == "Todos" else state,
+            category=None if category == "Todas" else category,
+        )
+    except OperationalError:
+        st.warning("⚠️ La base de datos no tiene el índice de reseñas: vuelve a ejecutar la carga")
+        return
+
+    if results.empty:
+        st.info("Sin resultados para esta búsqueda")
+        return
+
+    st.caption(f"{len(results)} reseñas (máximo {REVIEW_SEARCH_LIMIT}), de más a menos relevante")
+    st.dataframe(
+        results.drop(columns=["rank"]).rename(columns={
+            'review_score': 'Puntuación',
+            'review_comment_title': 'Título',
+            'snippet': 'Comentario',
+            'order_purchase_timestamp': 'Fecha de compra',
+            'order_status': 'Estado del pedido',
+            'customer_state': 'Estado',
+            'categories': 'Categorías',
+        }),
+        hide_index=True,
+        use_container_width=True,
+    )
+
 # Footer
 def show_footer():
     st.markdown("---")
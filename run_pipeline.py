@@ -2,15 +2,34 @@
 """
 Runner end-to-end para el pipeline:
 - Verifica dependencias clave (NumPy/Pandas) y te da un mensaje claro si hay incompatibilidades.
-- Ejecuta extract(...) leyendo la carpeta dataset/ (fuera de src) según src.config.
-- Carga todo a SQLite usando src.load (crea índices y respeta el orden).
+- Ejecuta el pipeline por etapas (src.pipeline): extract por tabla -> stage ->
+  load (publicación atómica) -> index (ANALYZE + tablas resumen) -> transform
+  por consulta -> export a query_results/.
+- Antes de publicar, la etapa validate revisa esquemas, claves, claves foráneas
+  y rangos de las tablas extraídas (informe en artifacts/pipeline/validation.json);
+  si encuentra errores, la carga no se ejecuta.
+- Guarda un checkpoint por etapa en artifacts/pipeline/state.json; si algo
+  falla, volver a ejecutarlo reanuda desde la etapa fallida. Cada checkpoint
+  guarda una huella de sus entradas (tamaño y fecha del CSV) y opciones
+  (--approximate, --partition-by, --backend): si cambian, la etapa y todo lo
+  que depende de ella se vuelve a ejecutar.
+- Las etapas stage:* (tablas de staging) se repiten siempre junto con load,
+  que las publica y las hace desaparecer.
+- Las etapas independientes corren en paralelo (--workers).
 - Lista las tablas creadas al final.
 
 Colócalo en la raíz del repo (donde están /src y /dataset).
 Ejecuta con: python run_pipeline.py
+             python run_pipeline.py --from-stage transform
+             python run_pipeline.py --only extract:public_holidays stage:public_holidays
+             python run_pipeline.py --list
+             python run_pipeline.py --approximate --from-stage index
+             python run_pipeline.py --partition-by year --from-stage load
+             python run_pipeline.py --backend polars --from-stage transform
 """
 
 from __future__ import annotations
+import argparse
 import sys
 import os
 from pathlib import Path
@@ -43,52 +62,106 @@ def _check_dependencies() -> None:
               "  pip install --no-cache-dir pandas==1.5.2 matplotlib==3.6.2 seaborn==0.11.2")
         sys.exit(1)
 
-def main() -> int:
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Pipeline ELT por etapas con checkpoints (reanudable)."
+    )
+    parser.add_argument(
+        "--from-stage",
+        nargs="+",
+        metavar="ETAPA",
+        help="Vuelve a ejecutar estas etapas y todo lo que depende de ellas "
+             "(nombre, prefijo como 'transform' o patrón como 'extract:olist_*').",
+    )
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        metavar="ETAPA",
+        help="Ejecuta solo estas etapas (sus dependencias deben estar completas).",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Etapas en paralelo (por defecto 4)."
+    )
+    parser.add_argument(
+        "--list", action="store_true", help="Muestra las etapas y su estado, sin ejecutar."
+    )
+    parser.add_argument(
+        "--approximate",
+        action="store_true",
+        help="Calcula el top de categorías con sketches (HyperLogLog + top-K) en lugar "
+             "del conteo exacto; error acotado, mucho más rápido con datos grandes.",
+    )
+    parser.add_argument(
+        "--partition-by",
+        choices=("year", "month"),
+        help="Además de las tablas base, guarda pedidos, ítems, pagos y reseñas en una "
+             "tabla por periodo de compra; las consultas por rango leen sólo las suyas.",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=("pandas", "polars", "partitioned"),
+        default="pandas",
+        help="Motor de las consultas en pandas (flete vs. peso, pedidos por día): 'polars' "
+             "las ejecuta como planes lazy multihilo (requiere pip install polars); "
+             "'partitioned' reparte el join de flete por order_id entre varios procesos.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
     _check_dependencies()
 
     # Imports del proyecto (ya con deps validadas)
     try:
-        from src.config import (
-            DATASET_ROOT_PATH,
-            get_csv_to_table_mapping,
-            PUBLIC_HOLIDAYS_URL,
-            SQLITE_BD_ABSOLUTE_PATH,
+        from src.config import DATASET_ROOT_PATH, SQLITE_BD_ABSOLUTE_PATH
+        from src.pipeline import (
+            PIPELINE_STATE_PATH,
+            load_state,
+            build_stages,
+            plan_stages,
+            run_stages,
+            stage_fingerprint,
         )
-        from src.extract import extract
-        from src.load import get_engine, load_all
     except Exception as e:
         print("❌ Error importando módulos del proyecto:", e)
         return 1
 
+    stages = build_stages(
+        approximate=args.approximate, partition_by=args.partition_by, backend=args.backend
+    )
+    state = load_state(PIPELINE_STATE_PATH)
+
+    if args.list:
+        for name, stage in stages.items():
+            status = state.get(name, {}).get("status", "-")
+            # Completa, pero con otras entradas u opciones: se repetirá
+            if status == "done" and state[name].get("fingerprint") != stage_fingerprint(stage):
+                status = "stale"
+            print(f"   {status:8} {name}")
+        return 0
+
+    try:
+        plan = plan_stages(stages, state, from_stage=args.from_stage, only=args.only)
+    except ValueError as e:
+        print("❌", e)
+        return 1
+
+    if not plan:
+        print("✅ Nada que hacer: todas las etapas están completas (usa --from-stage para repetir).")
+        return 0
+
     print("▶ Iniciando pipeline ELT…")
     print(f"   Dataset dir : {DATASET_ROOT_PATH}")
     print(f"   DB (SQLite) : {SQLITE_BD_ABSOLUTE_PATH}")
+    print(f"   Etapas      : {len(plan)} de {len(stages)} (checkpoints en {PIPELINE_STATE_PATH})")
 
     t0 = perf_counter()
-    try:
-        mapping = get_csv_to_table_mapping()
-        dfs = extract(
-            csv_folder=DATASET_ROOT_PATH,
-            csv_table_mapping=mapping,
-            public_holidays_url=PUBLIC_HOLIDAYS_URL,
-        )
-    except SystemExit as e:
-        print("❌ Falló la obtención de festivos (SystemExit):", e)
-        return 1
-    except Exception as e:
-        print("❌ Error en extracción:", e)
-        return 1
-    t1 = perf_counter()
-    print(f"✓ Extracción lista ({len(dfs)} tablas) en {t1 - t0:0.2f}s")
-
-    try:
-        engine = get_engine(SQLITE_BD_ABSOLUTE_PATH)
-        load_all(dfs, engine, if_exists="replace")
-    except Exception as e:
-        print("❌ Error en carga a SQLite:", e)
+    ok = run_stages(stages, plan, PIPELINE_STATE_PATH, workers=args.workers)
+    if not ok:
+        print(f"❌ Pipeline detenido tras {perf_counter() - t0:0.2f}s. "
+              "Vuelve a ejecutarlo para reanudar desde la etapa fallida.")
         return 1
-    t2 = perf_counter()
-    print(f"✓ Carga completada en {t2 - t1:0.2f}s")
 
     # Comprobación rápida de tablas creadas
     try:
@@ -104,7 +177,7 @@ def main() -> int:
     except Exception as e:
         print("⚠ No pude listar tablas, pero la carga terminó. Detalle:", e)
 
-    print("✅ Pipeline finalizado.")
+    print(f"✅ Pipeline finalizado en {perf_counter() - t0:0.2f}s.")
     return 0
 
 if __name__ == "__main__":
@@ -0,0 +1,355 @@
+from collections import namedtuple
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+import pandas as pd
+from pandas import DataFrame, read_sql
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.engine.base import Engine
+
+from src.delivery import AGG_DELIVERY_HIST_TABLE, refresh_delivery_histograms
+from src.load import PARTITIONS_TABLE, load_dataframe, record_table_version
+from src.partitions import partition_range_join, refresh_partitions
+from src.sellers import SELLER_SCORECARD_TABLE, refresh_seller_scorecard, sellers_for_orders
+from src.sketches import SKETCH_REVENUE_TABLE, refresh_category_sketches
+
+AGG_REVENUE_MONTH_TABLE = "agg_revenue_month"
+AGG_DELIVERY_MONTH_TABLE = "agg_delivery_month"
+AGG_ORDERS_DAY_TABLE = "agg_orders_day"
+
+# Base tables the summaries are computed from.
+AGGREGATE_SOURCE_TABLES = ("olist_orders", "olist_order_payments")
+
+# Years shown as columns by the pivoted monthly queries, like the .sql files.
+PIVOT_YEARS = (2016, 2017, 2018)
+MONTHS = (
+    ("01", "Jan"), ("02", "Feb"), ("03", "Mar"), ("04", "Apr"),
+    ("05", "May"), ("06", "Jun"), ("07", "Jul"), ("08", "Aug"),
+    ("09", "Sep"), ("10", "Oct"), ("11", "Nov"), ("12", "Dec"),
+)
+
+# Partitions of each summary table touched by a set of orders: "YYYY-MM" for
+# the monthly tables and "YYYY-MM-DD" for the daily one.
+AggregatePartitions = namedtuple(
+    "AggregatePartitions", ["revenue_months", "delivery_months", "days"]
+)
+
+_SUMMARY_TABLES_DDL = (
+    f"""CREATE TABLE IF NOT EXISTS {AGG_REVENUE_MONTH_TABLE} (
+        year TEXT NOT NULL,
+        month_no TEXT NOT NULL,
+        revenue_sum REAL NOT NULL,
+        order_count INTEGER NOT NULL,
+        PRIMARY KEY (year, month_no)
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS {AGG_DELIVERY_MONTH_TABLE} (
+        year TEXT NOT NULL,
+        month_no TEXT NOT NULL,
+        real_time_sum REAL NOT NULL,
+        real_time_count INTEGER NOT NULL,
+        estimated_time_sum REAL NOT NULL,
+        estimated_time_count INTEGER NOT NULL,
+        PRIMARY KEY (year, month_no)
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS {AGG_ORDERS_DAY_TABLE} (
+        day TEXT PRIMARY KEY,
+        order_count INTEGER NOT NULL
+    )""",
+)
+
+# Each refresh statement aggregates the orders whose partition column falls in
+# one of the ranges of src.partitions.partition_range_join (or every order when
+# {range_join} is empty), so the timestamp indexes drive the scan.
+_REFRESH_REVENUE_MONTH = f"""
+INSERT INTO {AGG_REVENUE_MONTH_TABLE} (year, month_no, revenue_sum, order_count)
+SELECT
+    STRFTIME('%Y', ppo.order_delivered_customer_date),
+    STRFTIME('%m', ppo.order_delivered_customer_date),
+    TOTAL(ppo.total_price),
+    COUNT(*)
+FROM (
+    SELECT o.order_id, o.order_delivered_customer_date, MIN(op.payment_value) AS total_price
+    FROM olist_orders o
+    {{range_join}}
+    INNER JOIN olist_order_payments op ON o.order_id = op.order_id
+    WHERE o.order_status = 'delivered' AND o.order_delivered_customer_date IS NOT NULL
+    GROUP BY o.order_id, o.order_delivered_customer_date
+) ppo
+GROUP BY 1, 2
+"""
+
+_REFRESH_DELIVERY_MONTH = f"""
+INSERT INTO {AGG_DELIVERY_MONTH_TABLE} (
+    year, month_no, real_time_sum, real_time_count, estimated_time_sum, estimated_time_count
+)
+SELECT
+    STRFTIME('%Y', dt.order_purchase_timestamp),
+    STRFTIME('%m', dt.order_purchase_timestamp),
+    TOTAL(dt.real_time),
+    COUNT(dt.real_time),
+    TOTAL(dt.estimated_time),
+    COUNT(dt.estimated_time)
+FROM (
+    SELECT DISTINCT
+        o.order_id,
+        o.order_purchase_timestamp,
+        julianday(o.order_delivered_customer_date) - julianday(o.order_purchase_timestamp) AS real_time,
+        julianday(o.order_estimated_delivery_date) - julianday(o.order_purchase_timestamp) AS estimated_time
+    FROM olist_orders o
+    {{range_join}}
+    WHERE o.order_status = 'delivered'
+        AND o.order_delivered_customer_date IS NOT NULL
+        AND o.order_purchase_timestamp IS NOT NULL
+) dt
+GROUP BY 1, 2
+"""
+
+_REFRESH_ORDERS_DAY = f"""
+INSERT INTO {AGG_ORDERS_DAY_TABLE} (day, order_count)
+SELECT DATE(o.order_purchase_timestamp), COUNT(*)
+FROM olist_orders o
+{{range_join}}
+WHERE o.order_purchase_timestamp IS NOT NULL
+GROUP BY 1
+"""
+
+# (summary table, refresh statement, partitioning column, partition field)
+_REFRESH_PLAN = (
+    (AGG_REVENUE_MONTH_TABLE, _REFRESH_REVENUE_MONTH, "order_delivered_customer_date", "revenue_months"),
+    (AGG_DELIVERY_MONTH_TABLE, _REFRESH_DELIVERY_MONTH, "order_purchase_timestamp", "delivery_months"),
+    (AGG_ORDERS_DAY_TABLE, _REFRESH_ORDERS_DAY, "order_purchase_timestamp", "days"),
+)
+
+
+def _delete_partitions(conn: Connection, table: str, partitions: List[str]) -> None:
+    """Delete the summary rows of the given partitions.
+
+    Args:
+        conn (Connection): Open connection inside a transaction.
+        table (str): The summary table.
+        partitions (List[str]): The partition keys.
+    """
+    key = "day" if table == AGG_ORDERS_DAY_TABLE else "year || '-' || month_no"
+    statement = text(f"DELETE FROM {table} WHERE {key} IN :partitions").bindparams(
+        bindparam("partitions", expanding=True)
+    )
+    conn.execute(statement, {"partitions": partitions})
+
+
+def refresh_aggregates(
+    database: Engine, partitions: Optional[AggregatePartitions] = None
+) -> None:
+    """Recompute the summary tables behind the incremental monthly queries.
+
+    The summary tables keep sums and counts (never averages) per (year, month)
+    and per day, so any partition can be recomputed on its own and the pivots
+    rebuilt from them. Without partitions every summary is rebuilt.
+
+    Args:
+        database (Engine): Database connection.
+        partitions (AggregatePartitions, optional): Partitions to recompute,
+            usually from partitions_for_orders.
+    """
+    with database.begin() as conn:
+        for ddl in _SUMMARY_TABLES_DDL:
+            conn.execute(text(ddl))
+        for table, statement, column, field in _REFRESH_PLAN:
+            if partitions is None:
+                conn.execute(text(f"DELETE FROM {table}"))
+                conn.execute(text(statement.format(range_join="")))
+                continue
+            keys = sorted(getattr(partitions, field))
+            if not keys:
+                continue
+            _delete_partitions(conn, table, keys)
+            with partition_range_join(conn, keys, column) as range_join:
+                conn.execute(text(statement.format(range_join=range_join)))
+
+    # Versions let the query cache serve the pivots until a partition changes
+    for table, _, _, _ in _REFRESH_PLAN:
+        record_table_version(table, read_sql(f"SELECT * FROM {table}", database), database)
+
+
+def ensure_aggregates(database: Engine) -> None:
+    """Build the summary tables if they don't exist yet.
+
+    Args:
+        database (Engine): Database connection.
+    """
+    existing = set(inspect(database).get_table_names())
+    if any(table not in existing for table, _, _, _ in _REFRESH_PLAN):
+        refresh_aggregates(database)
+
+
+def partitions_for_orders(
+    database: Engine, order_ids: Iterable[str]
+) -> AggregatePartitions:
+    """Get the summary partitions the given orders currently fall in.
+
+    Args:
+        database (Engine): Database connection.
+        order_ids (Iterable[str]): The order ids.
+
+    Returns:
+        AggregatePartitions: The partitions of each summary table.
+    """
+    order_ids = list(set(order_ids))
+    if not order_ids or "olist_orders" not in inspect(database).get_table_names():
+        return AggregatePartitions(frozenset(), frozenset(), frozenset())
+    statement = text(
+        """
+        SELECT DISTINCT
+            STRFTIME('%Y-%m', order_delivered_customer_date) AS revenue_month,
+            STRFTIME('%Y-%m', order_purchase_timestamp) AS delivery_month,
+            DATE(order_purchase_timestamp) AS day
+        FROM olist_orders
+        WHERE order_id IN :order_ids
+        """
+    ).bindparams(bindparam("order_ids", expanding=True))
+    with database.connect() as conn:
+        rows = conn.execute(statement, {"order_ids": order_ids}).fetchall()
+
+    def keys(position: int) -> FrozenSet[str]:
+        return frozenset(row[position] for row in rows if row[position] is not None)
+
+    return AggregatePartitions(keys(0), keys(1), keys(2))
+
+
+def merge_partitions(*partitions: AggregatePartitions) -> AggregatePartitions:
+    """Union several partition sets.
+
+    Returns:
+        AggregatePartitions: Partitions present in any of the inputs.
+    """
+    return AggregatePartitions(
+        *(frozenset().union(*(getattr(p, f) for p in partitions)) for f in AggregatePartitions._fields)
+    )
+
+
+def append_and_refresh(tables: Dict[str, DataFrame], database: Engine) -> AggregatePartitions:
+    """Append new rows to the warehouse and refresh only the partitions they touch.
+
+    Orders that already existed are looked up before and after the append, so
+    the partitions they move out of are recomputed too. If the seller
+    scorecard, the delivery histograms, the category sketches or the period
+    partitions exist, the sellers and months of the affected orders are
+    recomputed too.
+
+    Args:
+        tables (Dict[str, DataFrame]): New rows by table name.
+        database (Engine): Database connection.
+
+    Returns:
+        AggregatePartitions: The partitions that were recomputed.
+    """
+    order_ids = set()
+    for name in ("olist_orders", "olist_order_payments"):
+        if name in tables:
+            order_ids.update(tables[name]["order_id"].dropna())
+
+    scorecard_order_ids = set(order_ids)
+    for name in ("olist_order_items", "olist_order_reviews"):
+        if name in tables:
+            scorecard_order_ids.update(tables[name]["order_id"].dropna())
+
+    before = partitions_for_orders(database, order_ids)
+    sellers_before = sellers_for_orders(database, scorecard_order_ids)
+    for name, df in tables.items():
+        # The partitions and sketches of the affected months are rebuilt below
+        load_dataframe(name, df, database, if_exists="append", keep_derived=True)
+    affected = merge_partitions(before, partitions_for_orders(database, order_ids))
+    ensure_aggregates(database)
+    refresh_aggregates(database, affected)
+    if SELLER_SCORECARD_TABLE in inspect(database).get_table_names():
+        sellers = sellers_before | sellers_for_orders(database, scorecard_order_ids)
+        refresh_seller_scorecard(database, sellers)
+    existing = set(inspect(database).get_table_names())
+    if existing & {AGG_DELIVERY_HIST_TABLE, SKETCH_REVENUE_TABLE, PARTITIONS_TABLE}:
+        # New items change the categories of their orders, not their months
+        item_partitions = partitions_for_orders(database, scorecard_order_ids)
+        if PARTITIONS_TABLE in existing:
+            refresh_partitions(database, affected.delivery_months | item_partitions.delivery_months)
+        if AGG_DELIVERY_HIST_TABLE in existing:
+            refresh_delivery_histograms(
+                database, affected.delivery_months | item_partitions.delivery_months
+            )
+        if SKETCH_REVENUE_TABLE in existing:
+            refresh_category_sketches(
+                database, affected.revenue_months | item_partitions.revenue_months
+            )
+    return affected
+
+
+def _months_frame() -> DataFrame:
+    """Get the month_no/month columns shared by the monthly pivots."""
+    return pd.DataFrame(MONTHS, columns=["month_no", "month"])
+
+
+def revenue_by_month_year_from_aggregates(database: Engine) -> DataFrame:
+    """Build the revenue_by_month_year result from its summary table.
+
+    Args:
+        database (Engine): Database connection.
+
+    Returns:
+        DataFrame: Same columns as queries/revenue_by_month_year.sql.
+    """
+    summary = read_sql(
+        f"SELECT year, month_no, revenue_sum FROM {AGG_REVENUE_MONTH_TABLE}", database
+    )
+    result = _months_frame()
+    for year in PIVOT_YEARS:
+        revenue = summary[summary["year"] == str(year)].set_index("month_no")["revenue_sum"]
+        result[f"Year{year}"] = result["month_no"].map(revenue).fillna(0.0)
+    return result
+
+
+def real_vs_estimated_delivered_time_from_aggregates(database: Engine) -> DataFrame:
+    """Build the real_vs_estimated_delivered_time result from its summary table.
+
+    Args:
+        database (Engine): Database connection.
+
+    Returns:
+        DataFrame: Same columns as queries/real_vs_estimated_delivered_time.sql.
+    """
+    summary = read_sql(f"SELECT * FROM {AGG_DELIVERY_MONTH_TABLE}", database)
+    result = _months_frame()
+    for kind in ("real_time", "estimated_time"):
+        averages = summary[f"{kind}_sum"] / summary[f"{kind}_count"].where(
+            summary[f"{kind}_count"] > 0
+        )
+        for year in PIVOT_YEARS:
+            in_year = summary["year"] == str(year)
+            by_month = pd.Series(averages[in_year].values, index=summary.loc[in_year, "month_no"])
+            result[f"Year{year}_{kind}"] = result["month_no"].map(by_month)
+    return result
+
+
+def orders_per_day_and_holidays_from_aggregates(database: Engine, year: int = 2017) -> DataFrame:
+    """Build the orders_per_day_and_holidays result from the daily summary table.
+
+    Args:
+        database (Engine): Database connection.
+        year (int): The year to report. Defaults to 2017.
+
+    Returns:
+        DataFrame: order_count, date (epoch milliseconds) and holiday columns.
+    """
+    days = read_sql(
+        text(
+            f"SELECT day, order_count FROM {AGG_ORDERS_DAY_TABLE} "
+            "WHERE day >= :start AND day < :end ORDER BY day"
+        ),
+        database,
+        params={"start": f"{year}-01-01", "end": f"{year + 1}-01-01"},
+    )
+    holidays = read_sql("SELECT date FROM public_holidays", database)
+    dates = pd.to_datetime(days["day"])
+    return pd.DataFrame(
+        {
+            "order_count": days["order_count"].astype("int64"),
+            "date": dates.astype("int64") // 10**6,
+            "holiday": dates.isin(pd.to_datetime(holidays["date"]).dt.normalize()),
+        }
+    )
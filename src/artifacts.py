@@ -0,0 +1,166 @@
+import json
+import os
+import re
+from typing import Dict, Iterable, Optional
+
+import pandas as pd
+from pandas import DataFrame
+
+from src.config import ARTIFACTS_ROOT_PATH
+
+RESULT_PREFIX = "qry_"
+
+# Small metadata file with the dashboard filter options, exported with the results
+FILTER_OPTIONS_FILE = "filter_options.json"
+
+
+def artifact_dir(run_id: Optional[str] = None, root: str = ARTIFACTS_ROOT_PATH) -> str:
+    """Get the folder where the artifacts of a run are written.
+
+    Args:
+        run_id (str, optional): Id of the run (e.g. the Airflow run_id). Runs
+            without id share the "latest" folder.
+        root (str): Root folder of the artifacts.
+
+    Returns:
+        str: The folder path.
+    """
+    # Airflow run ids contain ":" and "+", keep only file-system safe characters
+    safe_run_id = re.sub(r"[^\w.-]", "_", run_id) if run_id else "latest"
+    return os.path.join(root, safe_run_id)
+
+
+def write_result_artifact(
+    query_name: str,
+    result: DataFrame,
+    run_id: Optional[str] = None,
+    root: str = ARTIFACTS_ROOT_PATH,
+) -> str:
+    """Write a query result as a typed Parquet file.
+
+    The file is written next to its final path and renamed, so a reader never
+    sees a partial artifact.
+
+    Args:
+        query_name (str): The name of the query.
+        result (DataFrame): The query result.
+        run_id (str, optional): Id of the run.
+        root (str): Root folder of the artifacts.
+
+    Returns:
+        str: Path of the Parquet file, small enough to pass through XCom.
+    """
+    directory = artifact_dir(run_id, root)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{RESULT_PREFIX}{query_name}.parquet")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    result.to_parquet(tmp_path, engine="pyarrow", index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_result_artifact(path: str) -> DataFrame:
+    """Read a query result written by write_result_artifact.
+
+    Args:
+        path (str): Path of the Parquet file.
+
+    Returns:
+        DataFrame: The query result with its original dtypes.
+    """
+    return pd.read_parquet(path, engine="pyarrow")
+
+
+def result_json_name(query_name: str) -> str:
+    """Name of the exported JSON file of a query, as the dashboard reads it.
+
+    Args:
+        query_name (str): The query name.
+
+    Returns:
+        str: The file name, e.g. qry_revenue_per_state.json.
+    """
+    return f"{RESULT_PREFIX}{query_name}.json"
+
+
+def export_artifact_json(path: str, outdir: str) -> str:
+    """Convert a result artifact to the JSON records file read by the dashboard.
+
+    Args:
+        path (str): Path of the Parquet file.
+        outdir (str): Output folder.
+
+    Returns:
+        str: Path of the JSON file, named like the artifact.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(path))[0]
+    outpath = os.path.join(outdir, f"{name}.json")
+    read_result_artifact(path).to_json(outpath, orient="records", force_ascii=False)
+    return outpath
+
+
+def build_filter_options(
+    revenue_df: Optional[DataFrame],
+    states_df: Optional[DataFrame],
+    categories_df: Optional[DataFrame],
+) -> Dict[str, list]:
+    """Build the option lists of the dashboard sidebar filters.
+
+    Args:
+        revenue_df (DataFrame, optional): revenue_by_month_year result.
+        states_df (DataFrame, optional): revenue_per_state result.
+        categories_df (DataFrame, optional): top_10_revenue_categories result.
+
+    Returns:
+        Dict[str, list]: Years, months (in calendar order), states and categories.
+    """
+
+    def unique(df: Optional[DataFrame], column: str) -> list:
+        if df is None or column not in df.columns:
+            return []
+        return [str(value) for value in df[column].dropna().unique()]
+
+    years = []
+    if revenue_df is not None:
+        years = sorted(
+            int(c[len("Year"):]) for c in revenue_df.columns if re.fullmatch(r"Year\d+", c)
+        )
+    return {
+        "years": years,
+        "months": unique(revenue_df, "month"),
+        "states": sorted(unique(states_df, "customer_state")),
+        "categories": sorted(unique(categories_df, "Category")),
+    }
+
+
+def export_filter_options(paths: Iterable[str], outdir: str) -> str:
+    """Write the filter options metadata file next to the exported results.
+
+    Args:
+        paths (Iterable[str]): Result artifacts of the run (the ones not
+            needed for the filters are ignored).
+        outdir (str): Output folder.
+
+    Returns:
+        str: Path of the metadata file.
+    """
+    artifacts = {}
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        artifacts[name[len(RESULT_PREFIX):] if name.startswith(RESULT_PREFIX) else name] = path
+
+    def read(query_name: str) -> Optional[DataFrame]:
+        path = artifacts.get(query_name)
+        return read_result_artifact(path) if path else None
+
+    options = build_filter_options(
+        read("revenue_by_month_year"), read("revenue_per_state"), read("top_10_revenue_categories")
+    )
+    os.makedirs(outdir, exist_ok=True)
+    outpath = os.path.join(outdir, FILTER_OPTIONS_FILE)
+    tmp_path = f"{outpath}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(options, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, outpath)
+    return outpath
@@ -0,0 +1,146 @@
+import hashlib
+import pickle
+import warnings
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+import pandas as pd
+from pandas import DataFrame
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.load import TABLE_VERSIONS_TABLE
+
+QUERY_CACHE_TABLE = "_etl_query_cache"
+
+
+def get_table_versions(
+    database: Engine, tables: Iterable[str]
+) -> Optional[Dict[str, str]]:
+    """Get the content version recorded by the load stage for each table.
+
+    Args:
+        database (Engine): Database connection.
+        tables (Iterable[str]): The table names.
+
+    Returns:
+        Optional[Dict[str, str]]: Version by table name, or None when any of the
+        tables has no recorded version (then its data can't be fingerprinted).
+    """
+    tables = sorted(set(tables))
+    statement = text(
+        f"SELECT table_name, version FROM {TABLE_VERSIONS_TABLE} "
+        "WHERE table_name IN :tables"
+    ).bindparams(bindparam("tables", expanding=True))
+    try:
+        with database.connect() as conn:
+            versions = dict(conn.execute(statement, {"tables": tables}).fetchall())
+    except SQLAlchemyError:
+        # No table has been loaded through load_dataframe yet
+        return None
+    if len(versions) != len(tables):
+        return None
+    return versions
+
+
+def query_cache_key(query_name: str, code: str, table_versions: Dict[str, str]) -> str:
+    """Build the cache key of a query result.
+
+    Args:
+        query_name (str): The name of the query.
+        code (str): The SQL text or source code of the query.
+        table_versions (Dict[str, str]): Version of each table the query reads.
+
+    Returns:
+        str: A hex digest that changes whenever the code or the data changes.
+    """
+    digest = hashlib.sha256()
+    # The payload is a pickled DataFrame, so it is only valid for this pandas
+    for part in (query_name, pd.__version__, code):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    for table, version in sorted(table_versions.items()):
+        digest.update(f"{table}={version}\0".encode())
+    return digest.hexdigest()
+
+
+def read_cached_result(
+    database: Engine, query_name: str, cache_key: str
+) -> Optional[DataFrame]:
+    """Read a query result from the cache.
+
+    Args:
+        database (Engine): Database connection.
+        query_name (str): The name of the query.
+        cache_key (str): Key built with query_cache_key.
+
+    Returns:
+        Optional[DataFrame]: The cached result, or None on a cache miss.
+    """
+    statement = text(
+        f"SELECT payload FROM {QUERY_CACHE_TABLE} "
+        "WHERE query_name = :query_name AND cache_key = :cache_key"
+    )
+    try:
+        with database.connect() as conn:
+            row = conn.execute(
+                statement, {"query_name": query_name, "cache_key": cache_key}
+            ).fetchone()
+    except SQLAlchemyError:
+        return None
+    if row is None:
+        return None
+    return pickle.loads(zlib.decompress(row[0]))
+
+
+def write_cached_result(
+    database: Engine, query_name: str, cache_key: str, result: DataFrame
+) -> None:
+    """Store a query result in the cache, replacing the previous one.
+
+    Only the latest result of each query is kept. Writing is best effort: a
+    read-only or locked database only produces a warning.
+
+    Args:
+        database (Engine): Database connection.
+        query_name (str): The name of the query.
+        cache_key (str): Key built with query_cache_key.
+        result (DataFrame): The query result.
+    """
+    payload = zlib.compress(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+    try:
+        with database.begin() as conn:
+            conn.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {QUERY_CACHE_TABLE} ("
+                    "query_name TEXT PRIMARY KEY, cache_key TEXT NOT NULL, "
+                    "payload BLOB NOT NULL, created_at TEXT NOT NULL)"
+                )
+            )
+            conn.execute(
+                text(
+                    f"INSERT OR REPLACE INTO {QUERY_CACHE_TABLE} "
+                    "(query_name, cache_key, payload, created_at) "
+                    "VALUES (:query_name, :cache_key, :payload, :created_at)"
+                ),
+                {
+                    "query_name": query_name,
+                    "cache_key": cache_key,
+                    "payload": payload,
+                    "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                },
+            )
+    except SQLAlchemyError as e:
+        warnings.warn(f"Could not cache the result of {query_name}: {e}")
+
+
+def clear_query_cache(database: Engine) -> None:
+    """Remove every cached query result.
+
+    Args:
+        database (Engine): Database connection.
+    """
+    with database.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {QUERY_CACHE_TABLE}"))
@@ -4,8 +4,10 @@ from typing import Dict
 DATASET_ROOT_PATH = str(Path(__file__).parent.parent / "dataset")
 QUERIES_ROOT_PATH = str(Path(__file__).parent.parent / "queries")
 QUERY_RESULTS_ROOT_PATH = str(Path(__file__).parent.parent / "tests/query_results")
+QUERY_RESULTS_EXPORT_PATH = str(Path(__file__).parent.parent / "query_results")
 PUBLIC_HOLIDAYS_URL = "https://date.nager.at/api/v3/publicholidays"
 SQLITE_BD_ABSOLUTE_PATH = str(Path(__file__).parent.parent / "olist.db")
+ARTIFACTS_ROOT_PATH = str(Path(__file__).parent.parent / "artifacts")
 
 
 def get_csv_to_table_mapping() -> Dict[str, str]:
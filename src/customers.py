@@ -0,0 +1,232 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, read_sql
+from sqlalchemy.engine.base import Engine
+
+# Tables read by the customer analytics.
+CUSTOMER_SOURCE_TABLES = ("olist_orders", "olist_customers", "olist_order_payments")
+
+# Orders that never became a purchase are left out of cohorts and RFM.
+EXCLUDED_ORDER_STATUSES = ("canceled", "unavailable")
+
+# Number of score buckets of each RFM dimension (quintiles).
+RFM_BUCKETS = 5
+
+# RFM segments, in the order the summary lists them.
+RFM_SEGMENTS = ("Champions", "Loyal", "Recent", "Needs attention", "At risk", "Hibernating")
+
+_CUSTOMER_ORDERS_SQL = f"""
+SELECT
+    c.customer_unique_id,
+    o.order_id,
+    o.order_purchase_timestamp,
+    COALESCE(p.payment_value, 0) AS payment_value
+FROM olist_orders o
+INNER JOIN olist_customers c ON c.customer_id = o.customer_id
+LEFT JOIN (
+    SELECT order_id, SUM(payment_value) AS payment_value
+    FROM olist_order_payments
+    GROUP BY order_id
+) p ON p.order_id = o.order_id
+WHERE o.order_status NOT IN ({", ".join(f"'{s}'" for s in EXCLUDED_ORDER_STATUSES)})
+  AND o.order_purchase_timestamp IS NOT NULL
+"""
+
+
+def read_customer_orders(database: Engine) -> DataFrame:
+    """Read one row per purchase with its customer and total payment.
+
+    Customers are identified by customer_unique_id: Olist gives every order a
+    new customer_id, so it cannot track repeat buyers.
+
+    Args:
+        database (Engine): Database connection.
+
+    Returns:
+        DataFrame: customer_unique_id, order_id, order_purchase_timestamp
+        (datetime) and payment_value.
+    """
+    orders = read_sql(_CUSTOMER_ORDERS_SQL, database)
+    orders["order_purchase_timestamp"] = pd.to_datetime(orders["order_purchase_timestamp"])
+    return orders
+
+
+def _month_index(timestamps: pd.Series) -> np.ndarray:
+    """Months since year 0 of each timestamp, as integers (2017-01 -> 24204)."""
+    return (timestamps.dt.year.to_numpy() * 12 + timestamps.dt.month.to_numpy() - 1).astype(np.int64)
+
+
+def _month_label(month_index: np.ndarray) -> np.ndarray:
+    """Format integer month indexes as "YYYY-MM" strings."""
+    years, months = np.divmod(month_index, 12)
+    return np.char.add(
+        np.char.add(years.astype(str), "-"), np.char.zfill((months + 1).astype(str), 2)
+    )
+
+
+def customer_cohorts(orders: DataFrame) -> DataFrame:
+    """Count the active customers of every monthly acquisition cohort.
+
+    A customer belongs to the cohort of the month of their first purchase and
+    is active in period N if they bought N months after that month. Customers
+    are integer-coded and the (customer, period) pairs deduplicated with NumPy,
+    so the cost is a few sorts regardless of the number of customers.
+
+    Args:
+        orders (DataFrame): Purchases, as returned by read_customer_orders.
+
+    Returns:
+        DataFrame: One row per cohort and period with cohort_month ("YYYY-MM"),
+        period (months since acquisition), customers, cohort_size and
+        retention (customers / cohort_size).
+    """
+    columns = ["cohort_month", "period", "customers", "cohort_size", "retention"]
+    if orders.empty:
+        return DataFrame(columns=columns)
+
+    codes, uniques = pd.factorize(orders["customer_unique_id"])
+    month = _month_index(orders["order_purchase_timestamp"])
+
+    # First purchase month of each customer
+    first_month = np.full(len(uniques), np.iinfo(np.int64).max)
+    np.minimum.at(first_month, codes, month)
+    period = month - first_month[codes]
+
+    # Active customers per (cohort, period): unique (customer, period) pairs
+    n_periods = int(period.max()) + 1
+    active = np.unique(codes.astype(np.int64) * n_periods + period)
+    active_codes, active_periods = np.divmod(active, n_periods)
+
+    base_month = int(first_month.min())
+    cohort = first_month[active_codes] - base_month
+    n_cohorts = int(cohort.max()) + 1
+    counts = np.bincount(cohort * n_periods + active_periods, minlength=n_cohorts * n_periods)
+    counts = counts.reshape(n_cohorts, n_periods)
+
+    cohort_idx, period_idx = np.nonzero(counts)
+    cohort_size = counts[:, 0]
+    return DataFrame(
+        {
+            "cohort_month": _month_label(cohort_idx + base_month),
+            "period": period_idx,
+            "customers": counts[cohort_idx, period_idx],
+            "cohort_size": cohort_size[cohort_idx],
+            "retention": counts[cohort_idx, period_idx] / cohort_size[cohort_idx],
+        }
+    )
+
+
+def retention_matrix(cohorts: DataFrame) -> DataFrame:
+    """Pivot customer_cohorts into a cohort x period retention matrix.
+
+    Args:
+        cohorts (DataFrame): The result of customer_cohorts.
+
+    Returns:
+        DataFrame: Retention with one row per cohort_month and one column per
+        period; NaN where the period is not observed yet.
+    """
+    return cohorts.pivot(index="cohort_month", columns="period", values="retention").sort_index()
+
+
+def _score(values: np.ndarray, higher_is_better: bool = True) -> np.ndarray:
+    """Quintile score (1-5) of each value by its percentile rank.
+
+    Ties get the same score (average rank), so the many single-purchase
+    customers are not split arbitrarily between buckets.
+    """
+    pct = pd.Series(values if higher_is_better else -values).rank(method="average", pct=True)
+    return np.ceil(pct.to_numpy() * RFM_BUCKETS).astype(np.int8)
+
+
+def rfm_scores(orders: DataFrame, as_of: Optional[pd.Timestamp] = None) -> DataFrame:
+    """Compute recency, frequency and monetary value and their scores per customer.
+
+    Args:
+        orders (DataFrame): Purchases, as returned by read_customer_orders.
+        as_of (pd.Timestamp, optional): Date recency is measured from. Defaults
+            to the day after the last purchase.
+
+    Returns:
+        DataFrame: One row per customer_unique_id with recency (days since the
+        last purchase), frequency (orders), monetary (total paid), r_score,
+        f_score, m_score (1-5, 5 is best), rfm ("555") and segment.
+    """
+    columns = ["customer_unique_id", "recency", "frequency", "monetary"]
+    columns += ["r_score", "f_score", "m_score", "rfm", "segment"]
+    if orders.empty:
+        return DataFrame(columns=columns)
+
+    codes, uniques = pd.factorize(orders["customer_unique_id"])
+    timestamps = orders["order_purchase_timestamp"].to_numpy(dtype="datetime64[ns]")
+    if as_of is None:
+        as_of = pd.Timestamp(timestamps.max()).normalize() + pd.Timedelta(days=1)
+
+    n_customers = len(uniques)
+    last = np.full(n_customers, np.iinfo(np.int64).min)
+    np.maximum.at(last, codes, timestamps.view(np.int64))
+    last = last.view("datetime64[ns]")
+
+    recency = (np.datetime64(as_of, "ns") - last).astype("timedelta64[D]").astype(np.int64)
+    # read_customer_orders has one row per order
+    frequency = np.bincount(codes, minlength=n_customers)
+    monetary = np.bincount(codes, weights=orders["payment_value"].to_numpy(dtype=float), minlength=n_customers)
+
+    r_score = _score(recency, higher_is_better=False)
+    f_score = _score(frequency)
+    m_score = _score(monetary)
+    segment = np.select(
+        [
+            (r_score >= 4) & (f_score >= 4),
+            (r_score >= 3) & (f_score >= 4),
+            r_score >= 4,
+            r_score == 3,
+            f_score >= 4,
+        ],
+        list(RFM_SEGMENTS[:5]),
+        default=RFM_SEGMENTS[5],
+    )
+    return DataFrame(
+        {
+            "customer_unique_id": uniques,
+            "recency": recency,
+            "frequency": frequency,
+            "monetary": monetary.round(2),
+            "r_score": r_score,
+            "f_score": f_score,
+            "m_score": m_score,
+            "rfm": np.char.add(
+                np.char.add(r_score.astype(str), f_score.astype(str)), m_score.astype(str)
+            ),
+            "segment": segment,
+        }
+    )
+
+
+def rfm_segments(scores: DataFrame) -> DataFrame:
+    """Summarize rfm_scores per segment.
+
+    Args:
+        scores (DataFrame): The result of rfm_scores.
+
+    Returns:
+        DataFrame: segment, customers, share of customers, mean recency,
+        frequency and monetary, and total monetary, in RFM_SEGMENTS order.
+    """
+    summary = (
+        scores.groupby("segment")
+        .agg(
+            customers=("customer_unique_id", "size"),
+            recency=("recency", "mean"),
+            frequency=("frequency", "mean"),
+            monetary=("monetary", "mean"),
+            monetary_total=("monetary", "sum"),
+        )
+        .reindex([s for s in RFM_SEGMENTS if s in set(scores["segment"])])
+        .rename_axis("segment")
+        .reset_index()
+    )
+    summary.insert(2, "share", summary["customers"] / summary["customers"].sum())
+    return summary
@@ -0,0 +1,295 @@
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+from pandas import DataFrame, concat, read_sql
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.engine.base import Engine
+
+from src.load import record_table_version
+from src.partitions import partition_range_join
+
+AGG_DELIVERY_HIST_TABLE = "agg_delivery_hist"
+
+# Base tables the histograms are computed from.
+DELIVERY_HIST_SOURCE_TABLES = (
+    "olist_orders",
+    "olist_customers",
+    "olist_order_items",
+    "olist_products",
+    "product_category_name_translation",
+)
+
+# delivery_days: whole days from purchase to delivery.
+# lateness_days: delivery date minus estimated date (> 0 is late).
+DELIVERY_METRICS = ("delivery_days", "lateness_days")
+
+# Dimensions the histograms can be merged by.
+DELIVERY_DIMENSIONS = ("month", "customer_state", "category")
+
+DEFAULT_PERCENTILES = (50, 90, 99)
+
+# Every order is counted once under this category, plus once under each
+# category it contains, so rollups that ignore the category never count an
+# order twice.
+ALL_CATEGORIES = "*"
+
+_HIST_TABLE_DDL = f"""CREATE TABLE IF NOT EXISTS {AGG_DELIVERY_HIST_TABLE} (
+    year TEXT NOT NULL,
+    month_no TEXT NOT NULL,
+    customer_state TEXT NOT NULL,
+    category TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    days INTEGER NOT NULL,
+    order_count INTEGER NOT NULL,
+    PRIMARY KEY (year, month_no, customer_state, category, metric, days)
+)"""
+
+# Order counts per (purchase month, state, category, metric, day): 1-day
+# histograms that add up across partitions. {range_join} limits the orders to
+# some purchase months (src.partitions.partition_range_join), like the refreshes
+# of src.aggregates.
+_HIST_SELECT = f"""
+WITH delivered AS (
+    SELECT
+        o.order_id,
+        STRFTIME('%Y', o.order_purchase_timestamp) AS year,
+        STRFTIME('%m', o.order_purchase_timestamp) AS month_no,
+        COALESCE(c.customer_state, 'unknown') AS customer_state,
+        CAST(julianday(o.order_delivered_customer_date) - julianday(o.order_purchase_timestamp) AS INTEGER)
+            AS delivery_days,
+        CAST(julianday(DATE(o.order_delivered_customer_date)) - julianday(DATE(o.order_estimated_delivery_date)) AS INTEGER)
+            AS lateness_days
+    FROM olist_orders o
+    {{range_join}}
+    LEFT JOIN olist_customers c ON c.customer_id = o.customer_id
+    WHERE o.order_status = 'delivered'
+        AND o.order_delivered_customer_date IS NOT NULL
+        AND o.order_purchase_timestamp IS NOT NULL
+        AND o.order_estimated_delivery_date IS NOT NULL
+),
+order_categories AS (
+    SELECT d.*, '{ALL_CATEGORIES}' AS category FROM delivered d
+    UNION ALL
+    SELECT DISTINCT d.*, COALESCE(t.product_category_name_english, p.product_category_name, 'unknown')
+    FROM delivered d
+    INNER JOIN olist_order_items i ON i.order_id = d.order_id
+    LEFT JOIN olist_products p ON p.product_id = i.product_id
+    LEFT JOIN product_category_name_translation t ON t.product_category_name = p.product_category_name
+)
+SELECT year, month_no, customer_state, category, 'delivery_days' AS metric, delivery_days AS days, COUNT(*) AS order_count
+FROM order_categories
+GROUP BY 1, 2, 3, 4, 6
+UNION ALL
+SELECT year, month_no, customer_state, category, 'lateness_days', lateness_days, COUNT(*)
+FROM order_categories
+GROUP BY 1, 2, 3, 4, 6
+"""
+
+
+def compute_delivery_histograms(database: Engine) -> DataFrame:
+    """Compute the 1-day delivery histograms straight from the base tables.
+
+    Args:
+        database (Engine): Database connection.
+
+    Returns:
+        DataFrame: year, month_no, customer_state, category, metric, days and
+        order_count, one row per non-empty bin.
+    """
+    return read_sql(text(_HIST_SELECT.format(range_join="")), database)
+
+
+def read_delivery_histograms(database: Engine) -> DataFrame:
+    """Read the 1-day delivery histograms from their summary table.
+
+    Args:
+        database (Engine): Database connection.
+
+    Returns:
+        DataFrame: Same columns as compute_delivery_histograms.
+    """
+    return read_sql(f"SELECT * FROM {AGG_DELIVERY_HIST_TABLE}", database)
+
+
+def refresh_delivery_histograms(database: Engine, months: Optional[Iterable[str]] = None) -> None:
+    """Recompute the histogram summary table, fully or for some purchase months.
+
+    Args:
+        database (Engine): Database connection.
+        months (Iterable[str], optional): "YYYY-MM" purchase months to
+            recompute, e.g. AggregatePartitions.delivery_months. Without them
+            the table is rebuilt.
+    """
+    insert = (
+        f"INSERT INTO {AGG_DELIVERY_HIST_TABLE} "
+        "(year, month_no, customer_state, category, metric, days, order_count)"
+    )
+    with database.begin() as conn:
+        conn.execute(text(_HIST_TABLE_DDL))
+        if months is None:
+            conn.execute(text(f"DELETE FROM {AGG_DELIVERY_HIST_TABLE}"))
+            conn.execute(text(insert + _HIST_SELECT.format(range_join="")))
+        else:
+            months = sorted(set(months))
+            if not months:
+                return
+            conn.execute(
+                text(
+                    f"DELETE FROM {AGG_DELIVERY_HIST_TABLE} WHERE year || '-' || month_no IN :months"
+                ).bindparams(bindparam("months", expanding=True)),
+                {"months": months},
+            )
+            with partition_range_join(conn, months, "order_purchase_timestamp") as range_join:
+                conn.execute(text(insert + _HIST_SELECT.format(range_join=range_join)))
+
+    record_table_version(
+        AGG_DELIVERY_HIST_TABLE,
+        read_sql(
+            f"SELECT * FROM {AGG_DELIVERY_HIST_TABLE} "
+            "ORDER BY year, month_no, customer_state, category, metric, days",
+            database,
+        ),
+        database,
+    )
+
+
+def ensure_delivery_histograms(database: Engine) -> None:
+    """Build the histogram summary table if it doesn't exist yet.
+
+    Args:
+        database (Engine): Database connection.
+    """
+    if AGG_DELIVERY_HIST_TABLE not in inspect(database).get_table_names():
+        refresh_delivery_histograms(database)
+
+
+def merge_histograms(
+    histograms: DataFrame, by: Sequence[str] = (), metric: str = "delivery_days"
+) -> DataFrame:
+    """Add up the partition histograms of a metric into one histogram per group.
+
+    Args:
+        histograms (DataFrame): Partition histograms, from
+            compute_delivery_histograms or read_delivery_histograms.
+        by (Sequence[str]): Dimensions of DELIVERY_DIMENSIONS to keep; the
+            others are summed over.
+        metric (str): One of DELIVERY_METRICS.
+
+    Raises:
+        ValueError: If a dimension or the metric is unknown.
+
+    Returns:
+        DataFrame: The `by` columns, days and order_count, sorted by group
+        and day.
+    """
+    by = list(by)
+    unknown = [d for d in by if d not in DELIVERY_DIMENSIONS]
+    if unknown or metric not in DELIVERY_METRICS:
+        raise ValueError(f"Unknown dimension or metric: {unknown or metric}")
+
+    hist = histograms[histograms["metric"] == metric]
+    if "category" in by:
+        hist = hist[hist["category"] != ALL_CATEGORIES]
+    else:
+        hist = hist[hist["category"] == ALL_CATEGORIES]
+    if "month" in by:
+        hist = hist.assign(month=hist["year"] + "-" + hist["month_no"])
+    merged = hist.groupby(by + ["days"], sort=True)["order_count"].sum().reset_index()
+    merged["order_count"] = merged["order_count"].astype("int64")
+    return merged
+
+
+def histogram_percentiles(
+    histogram: DataFrame,
+    by: Sequence[str] = (),
+    percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+) -> DataFrame:
+    """Get percentiles, mean and late share of merged 1-day histograms.
+
+    The percentile p is the smallest day whose cumulative count reaches p% of
+    the group, the same as np.percentile(method="inverted_cdf") on the
+    per-order values.
+
+    Args:
+        histogram (DataFrame): The result of merge_histograms.
+        by (Sequence[str]): Its group columns.
+        percentiles (Sequence[float]): Percentiles to compute (0-100).
+
+    Returns:
+        DataFrame: The `by` columns, order_count, p<N> for every percentile,
+        mean and late_share (share of orders with days > 0).
+    """
+    by = list(by)
+    hist = histogram.sort_values(by + ["days"], kind="stable").reset_index(drop=True)
+    # A constant key stands in for the groups when there are none
+    keys = [hist[c] for c in by] if by else [np.zeros(len(hist), dtype=np.int8)]
+    groups = hist.groupby(keys, sort=False)
+    counts = hist["order_count"].to_numpy(dtype=np.int64)
+    total = groups["order_count"].transform("sum").to_numpy(dtype=np.int64)
+    cumulative = groups["order_count"].cumsum().to_numpy(dtype=np.int64)
+
+    weighted = hist.assign(
+        weighted_days=hist["days"] * counts, late=np.where(hist["days"] > 0, counts, 0)
+    ).groupby(keys, sort=False)
+    result = DataFrame({"order_count": groups["order_count"].sum()})
+    for p in percentiles:
+        # Integer comparison: no float rounding at the exact boundaries
+        reached = cumulative * 100 >= total * p
+        result[f"p{p:g}"] = hist.loc[reached].groupby([k[reached] for k in keys], sort=False)["days"].first()
+    result["mean"] = weighted["weighted_days"].sum() / result["order_count"]
+    result["late_share"] = weighted["late"].sum() / result["order_count"]
+    return result.reset_index(drop=not by)
+
+
+def delivery_percentiles(histograms: DataFrame) -> DataFrame:
+    """Percentiles of both metrics by every dimension, in one long table.
+
+    Args:
+        histograms (DataFrame): Partition histograms, from
+            compute_delivery_histograms or read_delivery_histograms.
+
+    Returns:
+        DataFrame: dimension (one of DELIVERY_DIMENSIONS), value, order_count
+        and, per metric, <metric>_p50, _p90, _p99 and _mean, plus late_share.
+    """
+    tables = []
+    for dimension in DELIVERY_DIMENSIONS:
+        delivery = histogram_percentiles(
+            merge_histograms(histograms, [dimension], "delivery_days"), [dimension]
+        ).set_index(dimension)
+        lateness = histogram_percentiles(
+            merge_histograms(histograms, [dimension], "lateness_days"), [dimension]
+        ).set_index(dimension)
+        table = DataFrame({"order_count": delivery["order_count"]})
+        for metric, stats in (("delivery_days", delivery), ("lateness_days", lateness)):
+            for column in [f"p{p:g}" for p in DEFAULT_PERCENTILES] + ["mean"]:
+                table[f"{metric}_{column}"] = stats[column]
+        table["late_share"] = lateness["late_share"]
+        tables.append(table.rename_axis("value").reset_index().assign(dimension=dimension))
+    result = concat(tables, ignore_index=True)
+    return result[["dimension"] + [c for c in result.columns if c != "dimension"]]
+
+
+def lateness_histogram(histograms: DataFrame) -> DataFrame:
+    """Per-state histogram of the days between estimated and actual delivery.
+
+    Args:
+        histograms (DataFrame): Partition histograms, from
+            compute_delivery_histograms or read_delivery_histograms.
+
+    Returns:
+        DataFrame: customer_state, days and order_count.
+    """
+    return merge_histograms(histograms, ["customer_state"], "lateness_days")
+
+
+def delivery_percentiles_from_aggregates(database: Engine) -> DataFrame:
+    """delivery_percentiles, read from the histogram summary table."""
+    ensure_delivery_histograms(database)
+    return delivery_percentiles(read_delivery_histograms(database))
+
+
+def lateness_histogram_from_aggregates(database: Engine) -> DataFrame:
+    """lateness_histogram, read from the histogram summary table."""
+    ensure_delivery_histograms(database)
+    return lateness_histogram(read_delivery_histograms(database))
@@ -1,4 +1,5 @@
 from typing import Dict
+import numpy as np
 import requests
 import pandas as pd
 from src.config import (
@@ -7,6 +8,65 @@ from src.config import (
     get_csv_to_table_mapping,
 )
 
+# Columnas de baja cardinalidad (estados, ciudades, estados de pedido, tipos de
+# pago, categorías) que en modo compacto se guardan como pd.Categorical
+_CATEGORICAL_COLUMNS = {
+    "olist_customers": ["customer_city", "customer_state"],
+    "olist_geolocation": ["geolocation_city", "geolocation_state"],
+    "olist_orders": ["order_status"],
+    "olist_order_payments": ["payment_type"],
+    "olist_products": ["product_category_name"],
+    "olist_sellers": ["seller_city", "seller_state"],
+}
+
+# Resto de columnas de texto en modo compacto: strings respaldados por Arrow
+COMPACT_STRING_DTYPE = "string[pyarrow]"
+
+
+def table_nbytes(df: pd.DataFrame) -> int:
+    """Get the memory used by a table, including the string payloads.
+
+    Args:
+        df (pd.DataFrame): The table.
+
+    Returns:
+        int: Size in bytes.
+    """
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def compact_dataframe(table_name: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Shrink a table's in-memory representation without changing its values.
+
+    Low-cardinality columns become categoricals, the other text columns
+    Arrow-backed strings, integers are downcast to the smallest type that
+    holds them, and floats become float32 only when no value changes.
+
+    Args:
+        table_name (str): The table name, to pick its categorical columns.
+        df (pd.DataFrame): The table, as read from the csv.
+
+    Returns:
+        pd.DataFrame: The compact table (the input is not modified).
+    """
+    categorical = set(_CATEGORICAL_COLUMNS.get(table_name, []))
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if col in categorical:
+            series = series.astype("category")
+        elif series.dtype == object:
+            series = series.astype(COMPACT_STRING_DTYPE)
+        elif pd.api.types.is_integer_dtype(series):
+            series = pd.to_numeric(series, downcast="integer")
+        elif pd.api.types.is_float_dtype(series):
+            as_float32 = series.astype(np.float32)
+            # Sólo si es exacto (p. ej. medidas enteras con NaN, no precios)
+            if np.array_equal(as_float32.to_numpy(np.float64), series.to_numpy(), equal_nan=True):
+                series = as_float32
+        columns[col] = series
+    return pd.DataFrame(columns, index=df.index)
+
 def temp() -> pd.DataFrame:
     """Get the temperature data."""
     return pd.read_csv("data/temperature.csv")
@@ -35,12 +95,48 @@ def get_public_holidays(public_holidays_url: str, year: str) -> pd.DataFrame:
     df = df.drop(columns=["types", "counties"], errors="ignore")
     return df
 
+def extract_table(
+    table_name: str,
+    csv_folder: str | None = None,
+    csv_table_mapping: Dict[str, str] | None = None,
+    public_holidays_url: str = PUBLIC_HOLIDAYS_URL,
+    compact: bool = False,
+) -> pd.DataFrame:
+    """Extract a single table, so each table can be extracted on its own task.
+
+    Args:
+        table_name (str): A table of the csv mapping or "public_holidays".
+        csv_folder (str, optional): Folder with the csv files.
+        csv_table_mapping (Dict[str, str], optional): csv file -> table name.
+        public_holidays_url (str): Base url of the public holidays API.
+        compact (bool): Return the table in the compact_dataframe representation.
+
+    Returns:
+        pd.DataFrame: The table.
+    """
+    if table_name == "public_holidays":
+        df = get_public_holidays(public_holidays_url, "2017")
+        return compact_dataframe(table_name, df) if compact else df
+    if csv_folder is None:
+        csv_folder = DATASET_ROOT_PATH
+    if csv_table_mapping is None:
+        csv_table_mapping = get_csv_to_table_mapping()
+    files = {table: csv_file for csv_file, table in csv_table_mapping.items()}
+    if table_name not in files:
+        raise KeyError(f"Tabla desconocida: {table_name}")
+    df = pd.read_csv(f"{csv_folder}/{files[table_name]}")
+    return compact_dataframe(table_name, df) if compact else df
+
 def extract(
     csv_folder: str | None = None,
     csv_table_mapping: Dict[str, str] | None = None,
     public_holidays_url: str = PUBLIC_HOLIDAYS_URL,
+    compact: bool = False,
 ) -> Dict[str, pd.DataFrame]:
-    """Extract the data from the csv files and return a dict of DataFrames."""
+    """Extract the data from the csv files and return a dict of DataFrames.
+
+    With compact=True every table goes through compact_dataframe.
+    """
     # Defaults: usar la carpeta dataset fuera de src y el mapeo del config
     if csv_folder is None:
         csv_folder = DATASET_ROOT_PATH
@@ -55,4 +151,6 @@ def extract(
 
     # Añadir festivos de 2017 (ajusta si tu prueba requiere otro año)
     dataframes["public_holidays"] = get_public_holidays(public_holidays_url, "2017")
+    if compact:
+        dataframes = {name: compact_dataframe(name, df) for name, df in dataframes.items()}
     return dataframes
@@ -0,0 +1,180 @@
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas import DataFrame, read_sql
+from sqlalchemy import text
+from sqlalchemy.engine.base import Engine
+
+from src.load import database_path, get_engine
+
+FREIGHT_TABLES = ("olist_order_items", "olist_orders", "olist_products")
+
+# Rowid range read by one map task: workers never hold more than one chunk of
+# a table, whatever the size of the data.
+CHUNK_ROWS = 200_000
+
+# Partitions per worker: more partitions than workers keep the pool busy when
+# partitions are uneven, and make each one smaller.
+PARTITIONS_PER_WORKER = 4
+
+_ITEMS_SCHEMA = pa.schema([("order_id", pa.string()), ("product_id", pa.string()), ("freight_value", pa.float64())])
+_ORDERS_SCHEMA = pa.schema([("order_id", pa.string())])
+_PRODUCTS_SCHEMA = pa.schema([("product_id", pa.string()), ("product_weight_g", pa.float64())])
+
+FREIGHT_COLUMNS = ["order_id", "freight_value", "product_weight_g"]
+
+
+def partition_ids(keys: pd.Series, partitions: int) -> np.ndarray:
+    """Hash partition of each key.
+
+    pandas hashing is deterministic (Python's str hash is salted per process),
+    so every process sends a key to the same partition.
+
+    Args:
+        keys (pd.Series): The join keys.
+        partitions (int): Number of partitions.
+
+    Returns:
+        np.ndarray: Partition number of every key.
+    """
+    return pd.util.hash_array(keys.astype(object).to_numpy()) % np.uint64(partitions)
+
+
+# Inputs of the freight join that are hash-partitioned on order_id: table,
+# columns, filter and Parquet schema. Orders are limited to the delivered ones
+# before the join, which is the same as filtering the joined rows.
+_FREIGHT_SOURCES = {
+    "items": ("olist_order_items", "order_id, product_id, freight_value", None, _ITEMS_SCHEMA),
+    "orders": ("olist_orders", "order_id", "order_status = 'delivered'", _ORDERS_SCHEMA),
+}
+
+
+def _partition_rows(
+    database: Engine, source: str, lo: int, hi: int, partitions: int, folder: str
+) -> Dict[int, str]:
+    """Map task: read the rows of a source with rowid in [lo, hi) and write one
+    Parquet file per partition they hash to."""
+    table, columns, where, schema = _FREIGHT_SOURCES[source]
+    sql = f"SELECT {columns} FROM {table} WHERE rowid >= :lo AND rowid < :hi" + (f" AND {where}" if where else "")
+    chunk = read_sql(text(sql), database, params={"lo": lo, "hi": hi})
+    files = {}
+    for partition, rows in chunk.groupby(partition_ids(chunk["order_id"], partitions), sort=False):
+        path = os.path.join(folder, f"{source}-p{int(partition):04d}-r{lo:012d}.parquet")
+        pq.write_table(pa.Table.from_pandas(rows, schema=schema, preserve_index=False), path)
+        files[int(partition)] = path
+    return files
+
+
+def _partition_range(db_path: str, source: str, lo: int, hi: int, partitions: int, folder: str) -> Dict[int, str]:
+    # Runs in a worker process, on its own read-only connection
+    return _partition_rows(get_engine(db_path, read_only=True), source, lo, hi, partitions, folder)
+
+
+def _rowid_ranges(database: Engine, table: str, chunk_rows: int) -> List[Tuple[int, int]]:
+    with database.connect() as conn:
+        first, last = conn.execute(text(f"SELECT MIN(rowid), MAX(rowid) FROM {table}")).one()
+    if first is None:
+        return []
+    return [(lo, lo + chunk_rows) for lo in range(first, last + 1, chunk_rows)]
+
+
+def _read_files(paths: List[str], schema: pa.Schema) -> DataFrame:
+    return pa.concat_tables([pq.read_table(path, schema=schema) for path in paths]).to_pandas()
+
+
+def _join_freight_partition(item_files: List[str], order_files: List[str], products_file: str) -> DataFrame:
+    """Freight and weight per delivered order of one partition, in a worker.
+
+    Same steps as query_freight_value_weight_relationship; orders are already
+    limited to the delivered ones.
+    """
+    items = _read_files(item_files, _ITEMS_SCHEMA)
+    orders = _read_files(order_files, _ORDERS_SCHEMA)
+    products = pq.read_table(products_file).to_pandas()
+    data = items.merge(orders, on="order_id").merge(products, on="product_id")
+    return data.groupby("order_id").agg({"freight_value": "sum", "product_weight_g": "sum"}).reset_index()
+
+
+def freight_value_weight_relationship(
+    database: Engine,
+    workers: Optional[int] = None,
+    partitions: Optional[int] = None,
+    chunk_rows: int = CHUNK_ROWS,
+) -> DataFrame:
+    """Partitioned version of query_freight_value_weight_relationship.
+
+    Map: worker processes read items and delivered orders from the database in
+    rowid ranges of `chunk_rows` and hash-partition them on order_id into
+    Parquet files, so all the rows of an order land in the same partition.
+    Reduce: each partition is joined with the products (small, sent whole to
+    every worker) and summed per order. A worker holds one chunk or one
+    partition at a time, and the parent only the per-order results.
+
+    Args:
+        database (Engine): Database connection.
+        workers (int, optional): Worker processes, the number of CPUs by
+            default.
+        partitions (int, optional): Number of partitions, PARTITIONS_PER_WORKER
+            per worker by default; raise it to lower the memory of each worker.
+        chunk_rows (int): Rows of a table read by one map task.
+
+    Returns:
+        DataFrame: Same result as the pandas query, sorted by order_id. The
+        sums may differ from it in the last bit: pandas adds the values of a
+        group with compensated summation, in its merge order.
+    """
+    workers = workers or os.cpu_count() or 1
+    partitions = partitions or workers * PARTITIONS_PER_WORKER
+    # Workers open the file themselves (by path, also for a read-only engine);
+    # an in-memory database is read here
+    path = database_path(database)
+    in_memory = path is None
+
+    with tempfile.TemporaryDirectory(prefix="hash_join_") as folder:
+        products_file = os.path.join(folder, "products.parquet")
+        products = read_sql("SELECT product_id, product_weight_g FROM olist_products", database)
+        pq.write_table(pa.Table.from_pandas(products, schema=_PRODUCTS_SCHEMA, preserve_index=False), products_file)
+
+        # spawn: forking a process with pipeline or service threads can deadlock
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            # Map: every rowid range of every source is split by partition
+            ranges = [
+                (source, lo, hi)
+                for source, (table, _, _, _) in _FREIGHT_SOURCES.items()
+                for lo, hi in _rowid_ranges(database, table, chunk_rows)
+            ]
+            if in_memory:
+                written = [_partition_rows(database, s, lo, hi, partitions, folder) for s, lo, hi in ranges]
+            else:
+                futures = [pool.submit(_partition_range, path, s, lo, hi, partitions, folder) for s, lo, hi in ranges]
+                written = [future.result() for future in futures]
+            files: Dict[Tuple[str, int], List[str]] = {}
+            for (source, _, _), partition_files in zip(ranges, written):
+                for partition, file in partition_files.items():
+                    files.setdefault((source, partition), []).append(file)
+
+            # Reduce: partitions without items or without orders join to nothing.
+            # File names sort by rowid, so rows keep the order of the tables.
+            reduces = [
+                pool.submit(
+                    _join_freight_partition,
+                    sorted(files[("items", partition)]),
+                    sorted(files[("orders", partition)]),
+                    products_file,
+                )
+                for partition in range(partitions)
+                if ("items", partition) in files and ("orders", partition) in files
+            ]
+            results = [future.result() for future in reduces]
+
+    if not results:
+        return DataFrame(columns=FREIGHT_COLUMNS)
+    return pd.concat(results, ignore_index=True).sort_values("order_id").reset_index(drop=True)
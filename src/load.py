@@ -1,17 +1,176 @@
 # src/load.py
-from typing import Dict
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, Optional, Tuple
 import pandas as pd
 from pandas import DataFrame
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine.base import Engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine.base import Connection, Engine
+from sqlalchemy.pool import QueuePool, StaticPool
 from src.config import SQLITE_BD_ABSOLUTE_PATH  # usa la ruta del config
 
 # Ruta por defecto del DW (SQLite) desde config
 DEFAULT_DB_PATH = SQLITE_BD_ABSOLUTE_PATH
 
-def get_engine(db_path: str = DEFAULT_DB_PATH) -> Engine:
-    """Crea/retorna un Engine de SQLAlchemy para SQLite."""
-    return create_engine(f"sqlite:///{db_path}")
+# PRAGMAs aplicados a cada conexión nueva. Los de escritura sólo se aplican al
+# pool de escritura: una conexión read-only no puede cambiar el journal_mode.
+_SQLITE_PRAGMAS = {
+    "mmap_size": 268_435_456,  # 256 MiB mapeados: lecturas sin copiar a la page cache
+    "cache_size": -65_536,  # 64 MiB de page cache por conexión (negativo = KiB)
+    "temp_store": "MEMORY",  # ORDER BY / GROUP BY temporales en RAM
+    "busy_timeout": 300_000,  # espera (ms) al lock de escritura en lugar de fallar
+}
+_SQLITE_WRITE_PRAGMAS = {
+    "journal_mode": "WAL",  # lectores no bloquean al escritor (y viceversa)
+    "synchronous": "NORMAL",  # seguro con WAL y mucho más rápido que FULL
+}
+_SQLITE_READ_PRAGMAS = {
+    "query_only": "ON",
+}
+
+# Tabla con la versión (hash de contenido) de cada tabla cargada por load_dataframe
+TABLE_VERSIONS_TABLE = "_etl_table_versions"
+
+# Catálogo de particiones por periodo de las tablas de hechos (src.partitions)
+PARTITIONS_TABLE = "_etl_partitions"
+
+# Sketches del top de categorías (src.sketches) y tablas base de las que salen,
+# las mismas que top_10_revenue_categories.sql
+SKETCH_ORDERS_TABLE = "sketch_category_orders"
+SKETCH_REVENUE_TABLE = "sketch_category_revenue"
+SKETCH_TABLES = (SKETCH_ORDERS_TABLE, SKETCH_REVENUE_TABLE)
+SKETCH_SOURCE_TABLES = (
+    "olist_orders",
+    "olist_order_payments",
+    "olist_order_items",
+    "olist_products",
+    "product_category_name_translation",
+)
+
+# Sufijo de las tablas sombra que usa load_all para publicar cargas atómicamente
+STAGING_SUFFIX = "__staging"
+
+# Registro de engines del proceso: uno por (ruta absoluta, modo)
+_ENGINES: Dict[Tuple[str, bool], Engine] = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def _apply_pragmas(engine: Engine, pragmas: Dict[str, object]) -> None:
+    """Registra un listener que aplica los PRAGMAs al abrir cada conexión DBAPI."""
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def _create_engine(db_path: str, read_only: bool) -> Engine:
+    """Construye un Engine SQLite con su pool y PRAGMAs según el modo."""
+    if db_path == ":memory:":
+        # Una única conexión compartida: cada conexión nueva sería otra BD vacía
+        engine = create_engine(
+            "sqlite://",
+            poolclass=StaticPool,
+            connect_args={"check_same_thread": False},
+        )
+        _apply_pragmas(engine, {"temp_store": "MEMORY"})
+        return engine
+
+    if read_only:
+        # Pool de lectura: varias conexiones concurrentes sobre la BD en modo ro
+        engine = create_engine(
+            f"sqlite:///file:{db_path}?mode=ro&uri=true",
+            poolclass=QueuePool,
+            pool_size=4,
+            max_overflow=4,
+            connect_args={"check_same_thread": False},
+        )
+        _apply_pragmas(engine, {**_SQLITE_PRAGMAS, **_SQLITE_READ_PRAGMAS})
+    else:
+        # Pool de escritura: SQLite admite un único escritor, el resto espera
+        # por busy_timeout; el overflow cubre lecturas anidadas del mismo hilo
+        engine = create_engine(
+            f"sqlite:///{db_path}",
+            poolclass=QueuePool,
+            pool_size=1,
+            max_overflow=4,
+            connect_args={"check_same_thread": False},
+        )
+        _apply_pragmas(engine, {**_SQLITE_WRITE_PRAGMAS, **_SQLITE_PRAGMAS})
+    return engine
+
+
+def get_engine(db_path: str = DEFAULT_DB_PATH, read_only: bool = False) -> Engine:
+    """Retorna el Engine de SQLAlchemy para SQLite registrado para `db_path`.
+
+    Los engines se reutilizan durante toda la vida del proceso (uno por ruta y
+    modo), así que las conexiones del pool y su page cache sobreviven entre
+    tareas y consultas. Con `read_only=True` se obtiene un pool separado de
+    conexiones de sólo lectura.
+    """
+    key_path = db_path if db_path == ":memory:" else os.path.abspath(db_path)
+    key = (key_path, read_only)
+    engine = _ENGINES.get(key)
+    if engine is None:
+        with _ENGINES_LOCK:
+            engine = _ENGINES.get(key)
+            if engine is None:
+                engine = _create_engine(key_path, read_only)
+                _ENGINES[key] = engine
+    return engine
+
+
+def database_path(engine: Engine) -> Optional[str]:
+    """Ruta absoluta del archivo de la BD de `engine`, None si está en memoria.
+
+    Sirve tanto para engines de escritura como de sólo lectura: en estos la URL
+    es "file:<ruta>?mode=ro", así que la ruta se toma del registro de
+    get_engine y no de la URL.
+    """
+    for (path, _), registered in list(_ENGINES.items()):
+        if registered is engine:
+            return None if path == ":memory:" else path
+    path = engine.url.database
+    if not path or path == ":memory:":
+        return None
+    if engine.url.query.get("uri") and path.startswith("file:"):
+        path = path[len("file:"):]
+    return os.path.abspath(path)
+
+
+def read_only_engine_for(engine: Engine) -> Engine:
+    """Pool de sólo lectura de la BD de `engine`; el propio engine si está en memoria."""
+    path = database_path(engine)
+    return engine if path is None else get_engine(path, read_only=True)
+
+
+def dispose_engines() -> None:
+    """Cierra todas las conexiones y vacía el registro de engines."""
+    with _ENGINES_LOCK:
+        for engine in _ENGINES.values():
+            engine.dispose()
+        _ENGINES.clear()
+
+
+def _reset_engines_after_fork() -> None:
+    """En el hijo de un fork, descarta los pools heredados sin cerrar las
+    conexiones del padre (Airflow LocalExecutor y los pools de procesos hacen fork)."""
+    global _ENGINES_LOCK
+    _ENGINES_LOCK = threading.Lock()
+    for engine in _ENGINES.values():
+        engine.dispose(close=False)
+    _ENGINES.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_engines_after_fork)
 
 # Columnas datetime por tabla (según Olist + festivos)
 _DATETIME_COLUMNS = {
@@ -28,61 +187,333 @@ _DATETIME_COLUMNS = {
 }
 
 def _ensure_datetime_serializable(name: str, df: DataFrame) -> DataFrame:
-    """Convierte a datetime las columnas conocidas para evitar problemas en SQLite."""
-    out = df.copy()
+    """Convierte a datetime las columnas conocidas para evitar problemas en SQLite.
+
+    Devuelve una copia superficial: las columnas convertidas se reemplazan en
+    la copia y el resto comparte memoria con `df` (que no se modifica).
+    """
+    out = df.copy(deep=False)
     for col in _DATETIME_COLUMNS.get(name, []):
         if col in out.columns:
             out[col] = pd.to_datetime(out[col], errors="coerce")
     return out
 
-def load_dataframe(
+def _write_table(
     name: str,
+    table_name: str,
     df: DataFrame,
     engine: Engine,
-    if_exists: str = "replace",
-    index: bool = False,
+    if_exists: str,
+    index: bool,
+    keep_derived: bool = False,
 ) -> None:
-    """Carga un DataFrame a SQLite usando su nombre de tabla."""
+    """Normaliza el DataFrame según la tabla `name` y lo escribe en `table_name`.
+
+    Escribir una tabla visible deja obsoletas sus particiones por periodo y
+    los sketches calculados a partir de ella: se eliminan antes de escribir
+    (las consultas leen entonces la tabla base y los sketches se reconstruyen
+    al usarse), salvo con keep_derived, cuando quien escribe recalcula lo
+    afectado (append_and_refresh).
+    """
     if not isinstance(df, pd.DataFrame):
         raise TypeError(f"df debe ser DataFrame, recibido: {type(df)}")
+    if table_name == name and not keep_derived:
+        with engine.begin() as conn:
+            _drop_partitions(conn, [name])
+            _drop_sketches(conn, [name])
 
     df = _ensure_datetime_serializable(name, df)
 
-    # Normaliza objetos a string para evitar tipos mixtos en SQLite
+    # Normaliza objetos a string para evitar tipos mixtos en SQLite (las tablas
+    # de extract(compact=True) ya traen string/category y no se copian)
     for col in df.select_dtypes(include=["object"]).columns:
         df[col] = df[col].astype("string")
 
-    df.to_sql(name=name, con=engine, if_exists=if_exists, index=index)
+    df.to_sql(name=table_name, con=engine, if_exists=if_exists, index=index)
+    record_table_version(table_name, df, engine, appended=(if_exists == "append"))
+
+def load_dataframe(
+    name: str,
+    df: DataFrame,
+    engine: Engine,
+    if_exists: str = "replace",
+    index: bool = False,
+    keep_derived: bool = False,
+) -> None:
+    """Carga un DataFrame a SQLite usando su nombre de tabla.
+
+    Con keep_derived no se eliminan las particiones por periodo ni los
+    sketches que dependen de la tabla: quien llama debe recalcular los que
+    cambian (refresh_partitions, refresh_category_sketches).
+    """
+    _write_table(name, name, df, engine, if_exists=if_exists, index=index, keep_derived=keep_derived)
+
+def staging_table_name(name: str) -> str:
+    """Nombre de la tabla sombra donde se prepara la nueva versión de `name`."""
+    return f"{name}{STAGING_SUFFIX}"
+
+def load_staging(name: str, df: DataFrame, engine: Engine, index: bool = False) -> None:
+    """Carga un DataFrame en la tabla sombra de `name`, sin tocar la tabla visible.
+
+    La tabla sólo pasa a ser visible al llamar a publish_staging.
+    """
+    _write_table(name, staging_table_name(name), df, engine, if_exists="replace", index=index)
+
+def _dataframe_fingerprint(df: DataFrame) -> str:
+    """Hash vectorizado del contenido (columnas, dtypes y valores) de un DataFrame."""
+    digest = hashlib.sha1()
+    digest.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+def record_table_version(
+    name: str,
+    df: DataFrame,
+    engine: Engine,
+    appended: bool = False,
+    row_count: Optional[int] = None,
+) -> None:
+    """Guarda en TABLE_VERSIONS_TABLE la versión (hash de contenido) de la tabla cargada.
+
+    Recargar los mismos datos deja la misma versión, de modo que los resultados
+    cacheados que dependen de la tabla siguen siendo válidos. Con appended, df
+    son sólo las filas nuevas y su hash se encadena con la versión anterior;
+    row_count da el total de filas cuando df sólo reescribe parte de la tabla.
+    """
+    version = _dataframe_fingerprint(df)
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {TABLE_VERSIONS_TABLE} ("
+            "table_name TEXT PRIMARY KEY, version TEXT NOT NULL, "
+            "row_count INTEGER NOT NULL, loaded_at TEXT NOT NULL)"
+        ))
+        rows = len(df)
+        if appended:
+            previous = conn.execute(
+                text(f"SELECT version, row_count FROM {TABLE_VERSIONS_TABLE} WHERE table_name = :name"),
+                {"name": name},
+            ).fetchone()
+            if previous is not None:
+                version = hashlib.sha1(f"{previous[0]}:{version}".encode()).hexdigest()
+                rows += previous[1]
+        conn.execute(
+            text(
+                f"INSERT OR REPLACE INTO {TABLE_VERSIONS_TABLE} "
+                "(table_name, version, row_count, loaded_at) VALUES (:name, :version, :rows, :at)"
+            ),
+            {
+                "name": name,
+                "version": version,
+                "rows": rows if row_count is None else row_count,
+                "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            },
+        )
+
+# Índices útiles para acelerar joins y filtros comunes
+_BASIC_INDEXES = [
+    # Orders & relacionados
+    "CREATE INDEX IF NOT EXISTS idx_olist_orders_order_id ON olist_orders(order_id)",
+    "CREATE INDEX IF NOT EXISTS idx_olist_orders_customer_id ON olist_orders(customer_id)",
+    "CREATE INDEX IF NOT EXISTS idx_olist_orders_purchase_ts ON olist_orders(order_purchase_timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_olist_orders_delivered_ts ON olist_orders(order_delivered_customer_date)",
+
+    "CREATE INDEX IF NOT EXISTS idx_olist_order_items_order_id ON olist_order_items(order_id)",
+    "CREATE INDEX IF NOT EXISTS idx_olist_order_items_product_id ON olist_order_items(product_id)",
+    "CREATE INDEX IF NOT EXISTS idx_olist_order_items_seller_id ON olist_order_items(seller_id)",
+
+    "CREATE INDEX IF NOT EXISTS idx_olist_order_payments_order_id ON olist_order_payments(order_id)",
+    "CREATE INDEX IF NOT EXISTS idx_olist_order_reviews_order_id ON olist_order_reviews(order_id)",
+
+    # Dimensiones
+    "CREATE INDEX IF NOT EXISTS idx_olist_customers_customer_id ON olist_customers(customer_id)",
+    "CREATE INDEX IF NOT EXISTS idx_olist_products_product_id ON olist_products(product_id)",
+    "CREATE INDEX IF NOT EXISTS idx_olist_sellers_seller_id ON olist_sellers(seller_id)",
+    "CREATE INDEX IF NOT EXISTS idx_olist_geolocation_zip ON olist_geolocation(geolocation_zip_code_prefix)",
+
+    # Festivos
+    "CREATE INDEX IF NOT EXISTS idx_public_holidays_date ON public_holidays(date)",
+]
+
+# Índice de texto completo (FTS5) sobre los comentarios de las reseñas. unicode61
+# con remove_diacritics 2 ignora mayúsculas y tildes ("não" = "nao"), y los
+# índices de prefijos de 2 y 3 letras abaratan las búsquedas "termo*" con las que
+# search_reviews cubre plurales y flexiones del portugués. El estado del cliente
+# y las categorías del pedido se guardan desnormalizados (UNINDEXED) para
+# filtrar los resultados sin joins por cada coincidencia.
+REVIEWS_FTS_TABLE = "olist_order_reviews_fts"
+REVIEWS_FTS_SOURCE_TABLES = (
+    "olist_order_reviews",
+    "olist_orders",
+    "olist_customers",
+    "olist_order_items",
+    "olist_products",
+    "product_category_name_translation",
+)
+_REVIEWS_FTS_STATEMENTS = [
+    f"DROP TABLE IF EXISTS {REVIEWS_FTS_TABLE}",
+    f"CREATE VIRTUAL TABLE {REVIEWS_FTS_TABLE} USING fts5("
+    "review_id UNINDEXED, order_id UNINDEXED, review_score UNINDEXED, "
+    "customer_state UNINDEXED, categories UNINDEXED, "
+    "review_comment_title, review_comment_message, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    f"""INSERT INTO {REVIEWS_FTS_TABLE} (
+        review_id, order_id, review_score, customer_state, categories,
+        review_comment_title, review_comment_message
+    )
+    SELECT
+        r.review_id,
+        r.order_id,
+        r.review_score,
+        c.customer_state,
+        (
+            SELECT GROUP_CONCAT(category, ', ')
+            FROM (
+                SELECT DISTINCT COALESCE(t.product_category_name_english, p.product_category_name) AS category
+                FROM olist_order_items AS i
+                JOIN olist_products AS p ON p.product_id = i.product_id
+                LEFT JOIN product_category_name_translation AS t
+                    ON t.product_category_name = p.product_category_name
+                WHERE i.order_id = r.order_id
+            )
+        ),
+        r.review_comment_title,
+        r.review_comment_message
+    FROM olist_order_reviews AS r
+    LEFT JOIN olist_orders AS o ON o.order_id = r.order_id
+    LEFT JOIN olist_customers AS c ON c.customer_id = o.customer_id
+    WHERE r.review_comment_title IS NOT NULL OR r.review_comment_message IS NOT NULL""",
+    f"INSERT INTO {REVIEWS_FTS_TABLE}({REVIEWS_FTS_TABLE}) VALUES ('optimize')",
+]
+
+def _build_review_index(conn: Connection) -> None:
+    """Reconstruye REVIEWS_FTS_TABLE, si ya están cargadas todas sus tablas origen."""
+    placeholders = ", ".join(f"'{name}'" for name in REVIEWS_FTS_SOURCE_TABLES)
+    found = conn.exec_driver_sql(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ({placeholders})"
+    ).scalar()
+    if found < len(REVIEWS_FTS_SOURCE_TABLES):
+        return
+    for s in _REVIEWS_FTS_STATEMENTS:
+        conn.exec_driver_sql(s)
 
 def _create_basic_indexes(engine: Engine) -> None:
     """Índices útiles para acelerar joins y filtros comunes."""
-    stmts = [
-        # Orders & relacionados
-        "CREATE INDEX IF NOT EXISTS idx_olist_orders_order_id ON olist_orders(order_id)",
-        "CREATE INDEX IF NOT EXISTS idx_olist_orders_customer_id ON olist_orders(customer_id)",
-        "CREATE INDEX IF NOT EXISTS idx_olist_orders_purchase_ts ON olist_orders(order_purchase_timestamp)",
-
-        "CREATE INDEX IF NOT EXISTS idx_olist_order_items_order_id ON olist_order_items(order_id)",
-        "CREATE INDEX IF NOT EXISTS idx_olist_order_items_product_id ON olist_order_items(product_id)",
-        "CREATE INDEX IF NOT EXISTS idx_olist_order_items_seller_id ON olist_order_items(seller_id)",
-
-        "CREATE INDEX IF NOT EXISTS idx_olist_order_payments_order_id ON olist_order_payments(order_id)",
-        "CREATE INDEX IF NOT EXISTS idx_olist_order_reviews_order_id ON olist_order_reviews(order_id)",
-
-        # Dimensiones
-        "CREATE INDEX IF NOT EXISTS idx_olist_customers_customer_id ON olist_customers(customer_id)",
-        "CREATE INDEX IF NOT EXISTS idx_olist_products_product_id ON olist_products(product_id)",
-        "CREATE INDEX IF NOT EXISTS idx_olist_sellers_seller_id ON olist_sellers(seller_id)",
-
-        # Festivos
-        "CREATE INDEX IF NOT EXISTS idx_public_holidays_date ON public_holidays(date)",
-    ]
     with engine.begin() as conn:
-        for s in stmts:
+        for s in _BASIC_INDEXES:
+            conn.execute(text(s))
+        _build_review_index(conn)
+
+def _drop_partitions(conn: Connection, names: Iterable[str]) -> None:
+    """Elimina todas las particiones si alguna de las tablas `names` está particionada.
+
+    Las particiones de los ítems, pagos y reseñas siguen a la fecha de su
+    pedido, así que publicar cualquiera de las tablas las invalida todas.
+    """
+    exists = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": PARTITIONS_TABLE},
+    ).fetchone()
+    if exists is None:
+        return
+    published = set(names)
+    rows = conn.execute(text(f"SELECT table_name, partition_table FROM {PARTITIONS_TABLE}")).fetchall()
+    if not any(table_name in published for table_name, _ in rows):
+        return
+    for _, partition_table in rows:
+        conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{partition_table}"')
+    conn.execute(text(f"DELETE FROM {PARTITIONS_TABLE}"))
+
+def _drop_sketches(conn: Connection, names: Iterable[str]) -> None:
+    """Elimina los sketches de categorías si alguna de `names` es una de sus tablas origen.
+
+    También se borran sus versiones, así que la caché no sirve resultados
+    calculados con ellos; se reconstruyen con los datos nuevos la próxima vez
+    que se usan (src.sketches.ensure_category_sketches).
+    """
+    if not set(names) & set(SKETCH_SOURCE_TABLES):
+        return
+    for table in SKETCH_TABLES:
+        conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{table}"')
+    versions = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": TABLE_VERSIONS_TABLE},
+    ).fetchone()
+    if versions is not None:
+        for table in SKETCH_TABLES:
+            conn.execute(text(f"DELETE FROM {TABLE_VERSIONS_TABLE} WHERE table_name = :name"), {"name": table})
+
+def publish_staging(engine: Engine, names: Iterable[str]) -> None:
+    """Reemplaza atómicamente cada tabla de `names` por su tabla sombra.
+
+    Todo ocurre en una única transacción (BEGIN IMMEDIATE): se borran las tablas
+    visibles, se renombran las sombras, se mueven sus versiones y se recrean sus
+    índices. Con WAL, los lectores siguen viendo la versión anterior completa
+    hasta el COMMIT y nunca ven tablas a medio escribir ni ausentes. Si se
+    publica alguna tabla de REVIEWS_FTS_SOURCE_TABLES, el índice de texto
+    completo de las reseñas se reconstruye también dentro de la misma transacción.
+    La consistencia entre tablas sólo abarca las que se publican juntas: quien
+    carga varias tablas (load_all, el DAG) debe publicarlas en una sola llamada.
+    Si se publica alguna tabla particionada por periodo (src.partitions), sus
+    particiones quedan obsoletas y se eliminan en la misma transacción; lo
+    mismo ocurre con los sketches de categorías (src.sketches) si se publica
+    alguna de sus tablas origen.
+    """
+    names = list(names)
+    index_stmts = [s for s in _BASIC_INDEXES if any(f" ON {n}(" in s for n in names)]
+    with engine.begin() as conn:
+        # pysqlite no abre transacción antes de DDL: se abre a mano para que
+        # DROP/ALTER/CREATE INDEX formen parte del mismo COMMIT
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        for name in names:
+            staging = staging_table_name(name)
+            conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{name}"')
+            conn.exec_driver_sql(f'ALTER TABLE "{staging}" RENAME TO "{name}"')
+            conn.execute(
+                text(f"DELETE FROM {TABLE_VERSIONS_TABLE} WHERE table_name = :name"),
+                {"name": name},
+            )
+            conn.execute(
+                text(f"UPDATE {TABLE_VERSIONS_TABLE} SET table_name = :name WHERE table_name = :staging"),
+                {"name": name, "staging": staging},
+            )
+        for s in index_stmts:
             conn.execute(text(s))
+        _drop_partitions(conn, names)
+        _drop_sketches(conn, names)
+        if any(name in REVIEWS_FTS_SOURCE_TABLES for name in names):
+            _build_review_index(conn)
+
+@contextmanager
+def read_snapshot(engine: Engine) -> Iterator[Connection]:
+    """Conexión con una transacción de lectura abierta sobre un snapshot fijo.
 
-def load_all(tables: Dict[str, DataFrame], engine: Engine, if_exists: str = "replace") -> None:
-    """Carga todas las tablas y crea índices."""
+    Todas las consultas hechas con la conexión ven la misma versión de la BD,
+    aunque una carga publique tablas nuevas mientras tanto (requiere WAL). La
+    usan las lecturas de varias sentencias que deben cuadrar entre sí, como el
+    total y la página del scorecard (src.sellers.read_scorecard_page).
+    """
+    with engine.connect() as conn:
+        conn.exec_driver_sql("BEGIN")
+        # En SQLite el snapshot se fija con la primera lectura, no con BEGIN
+        conn.exec_driver_sql("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        try:
+            yield conn
+        finally:
+            conn.exec_driver_sql("ROLLBACK")
+
+def load_all(
+    tables: Dict[str, DataFrame],
+    engine: Engine,
+    if_exists: str = "replace",
+    atomic: bool = True,
+) -> None:
+    """Carga todas las tablas y crea índices.
+
+    Con if_exists="replace" y atomic=True (por defecto) las tablas se cargan en
+    tablas sombra y se publican todas juntas con publish_staging, de modo que
+    quien lea la BD durante la carga ve siempre un conjunto completo y
+    consistente de tablas.
+    """
     # Orden sugerido: dimensiones -> hechos -> extras
     preferred_order = [
         "product_category_name_translation",
@@ -96,14 +527,18 @@ def load_all(tables: Dict[str, DataFrame], engine: Engine, if_exists: str = "rep
         "olist_order_reviews",
         "public_holidays",
     ]
-    for name in preferred_order:
-        if name in tables:
-            load_dataframe(name, tables[name], engine, if_exists=if_exists, index=False)
+    # Carga cualquier otra tabla no contemplada explícitamente al final
+    names = [n for n in preferred_order if n in tables]
+    names += [n for n in tables if n not in preferred_order]
+
+    if atomic and if_exists == "replace":
+        for name in names:
+            load_staging(name, tables[name], engine)
+        publish_staging(engine, names)
+        return
 
-    # Carga cualquier otra tabla no contemplada explícitamente
-    for name, df in tables.items():
-        if name not in preferred_order:
-            load_dataframe(name, df, engine, if_exists=if_exists, index=False)
+    for name in names:
+        load_dataframe(name, tables[name], engine, if_exists=if_exists, index=False)
 
     _create_basic_indexes(engine)
 
@@ -112,13 +547,12 @@ def load(data_frames: Dict[str, DataFrame], database: Engine):
     """
     Por cada DataFrame en el diccionario, usa pandas.DataFrame.to_sql()
     para cargar el DataFrame como una tabla cuyo nombre es la clave.
-    (Cumple exactamente el TODO del enunciado.)
+    (Cumple exactamente el TODO del enunciado.) Pasa por _write_table, así
+    que la versión de la tabla se actualiza y la caché de resultados no
+    sirve resultados de los datos anteriores.
     """
     for table_name, df in data_frames.items():
-        df = _ensure_datetime_serializable(table_name, df)
-        for col in df.select_dtypes(include=["object"]).columns:
-            df[col] = df[col].astype("string")
-        df.to_sql(name=table_name, con=database, if_exists="replace", index=False)
+        _write_table(table_name, table_name, df, database, if_exists="replace", index=False)
 
 if __name__ == "__main__":
     # Ejecución e2e: extract -> load_all
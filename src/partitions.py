@@ -0,0 +1,350 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+from pandas import DataFrame, read_sql
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.engine.base import Engine
+
+from src.load import PARTITIONS_TABLE, read_only_engine_for
+
+# Orders are partitioned by purchase date; their items, payments and reviews
+# follow the partition of their order, so joins stay inside one partition.
+PARTITION_COLUMN = "order_purchase_timestamp"
+PARENT_TABLE = "olist_orders"
+CHILD_TABLES = ("olist_order_items", "olist_order_payments", "olist_order_reviews")
+PARTITIONED_TABLES = (PARENT_TABLE,) + CHILD_TABLES
+
+GRANULARITIES = ("year", "month")
+
+# Partition of orders without a purchase date (and of rows without an order).
+# It has no range, so only unbounded queries read it.
+UNDATED_PARTITION = "undated"
+
+# One partition of one table: its key ("2017" or "2017-03"), the table that
+# holds it and its [start, end) purchase date range ("YYYY-MM-DD").
+Partition = namedtuple("Partition", ["table", "key", "partition_table", "start", "end"])
+
+_CATALOG_DDL = f"""CREATE TABLE IF NOT EXISTS {PARTITIONS_TABLE} (
+    table_name TEXT NOT NULL,
+    partition_key TEXT NOT NULL,
+    partition_table TEXT NOT NULL,
+    granularity TEXT NOT NULL,
+    start TEXT,
+    end TEXT,
+    row_count INTEGER NOT NULL,
+    PRIMARY KEY (table_name, partition_key)
+)"""
+
+
+def partition_table_name(table: str, key: str) -> str:
+    """Name of the table holding one partition, e.g. olist_orders__p2017_03."""
+    return f"{table}__p{key.replace('-', '_')}"
+
+
+def partition_range(key: str) -> tuple:
+    """[start, end) dates of a "YYYY", "YYYY-MM" or "YYYY-MM-DD" partition key."""
+    if key == UNDATED_PARTITION:
+        return None, None
+    if len(key) == 4:
+        return f"{key}-01-01", f"{int(key) + 1}-01-01"
+    if len(key) == 7:
+        year, month = int(key[:4]), int(key[5:])
+        return f"{key}-01", date(year + month // 12, month % 12 + 1, 1).isoformat()
+    start = date.fromisoformat(key)
+    return start.isoformat(), (start + timedelta(days=1)).isoformat()
+
+
+_RANGES_TABLE = "_partition_ranges"
+
+
+@contextmanager
+def partition_range_join(conn: Connection, keys: Iterable[str], column: str) -> Iterator[str]:
+    """Limit a refresh of summary rows to some partitions.
+
+    The [start, end) ranges of the keys go to a temp table; the join yielded
+    keeps the rows of `o` (the orders) whose `column` falls in one of them,
+    so the refresh statement runs once for every partition.
+
+    Args:
+        conn (Connection): Open connection inside a transaction.
+        keys (Iterable[str]): Partition keys, see partition_range.
+        column (str): Timestamp column of the orders to match.
+
+    Yields:
+        str: The INNER JOIN clause, to put right after FROM olist_orders o.
+    """
+    conn.execute(text(f"DROP TABLE IF EXISTS temp.{_RANGES_TABLE}"))
+    conn.execute(text(f"CREATE TEMP TABLE {_RANGES_TABLE} (start TEXT, end TEXT)"))
+    conn.execute(
+        text(f"INSERT INTO temp.{_RANGES_TABLE} (start, end) VALUES (:start, :end)"),
+        [dict(zip(("start", "end"), partition_range(key))) for key in keys],
+    )
+    yield f"INNER JOIN temp.{_RANGES_TABLE} r ON o.{column} >= r.start AND o.{column} < r.end"
+    conn.execute(text(f"DROP TABLE IF EXISTS temp.{_RANGES_TABLE}"))
+
+
+def partition_key(month: str, granularity: str) -> str:
+    """Key of the partition a "YYYY-MM" month falls in."""
+    return month[:4] if granularity == "year" else month
+
+
+def _validate_granularity(granularity: str) -> None:
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity '{granularity}', use one of {GRANULARITIES}")
+
+
+def read_partitions(database: Engine) -> Dict[str, List[Partition]]:
+    """Read the partition catalog.
+
+    Args:
+        database (Engine): Database connection.
+
+    Returns:
+        Dict[str, List[Partition]]: Partitions of every partitioned table,
+        sorted by start date (the undated one last); empty if the tables are
+        not partitioned.
+    """
+    if PARTITIONS_TABLE not in inspect(database).get_table_names():
+        return {}
+    catalog = read_sql(
+        f"SELECT table_name, partition_key, partition_table, start, end FROM {PARTITIONS_TABLE} "
+        "ORDER BY table_name, start IS NULL, start",
+        database,
+    )
+    partitions: Dict[str, List[Partition]] = {}
+    for row in catalog.itertuples(index=False):
+        partitions.setdefault(row.table_name, []).append(
+            Partition(row.table_name, row.partition_key, row.partition_table, row.start, row.end)
+        )
+    return partitions
+
+
+def partition_granularity(database: Engine) -> Optional[str]:
+    """Granularity of the current partitions, None if there are none."""
+    if PARTITIONS_TABLE not in inspect(database).get_table_names():
+        return None
+    with database.connect() as conn:
+        return conn.execute(text(f"SELECT MIN(granularity) FROM {PARTITIONS_TABLE}")).scalar()
+
+
+def build_partitions(
+    database: Engine, granularity: str = "year", keys: Optional[Iterable[str]] = None
+) -> List[str]:
+    """Copy the fact tables into one table per purchase period.
+
+    The base tables are kept, so every query that does not know about
+    partitions keeps working. publish_staging drops the partitions whenever
+    one of the tables is reloaded.
+
+    Args:
+        database (Engine): Database connection.
+        granularity (str): "year" or "month".
+        keys (Iterable[str], optional): Partition keys to rebuild, e.g. after
+            appending orders. Without them every partition is rebuilt.
+
+    Raises:
+        ValueError: If the granularity is unknown or differs from the one of
+            the partitions being rebuilt.
+
+    Returns:
+        List[str]: The partition keys written.
+    """
+    _validate_granularity(granularity)
+    if keys is not None and partition_granularity(database) not in (None, granularity):
+        raise ValueError("Partial rebuilds must keep the granularity of the existing partitions")
+    key_expr = "STRFTIME('%Y', o.{0})" if granularity == "year" else "STRFTIME('%Y-%m', o.{0})"
+    key_expr = key_expr.format(PARTITION_COLUMN)
+    existing = set(inspect(database).get_table_names())
+
+    with database.begin() as conn:
+        conn.execute(text(_CATALOG_DDL))
+        if keys is None:
+            for (partition_table,) in conn.execute(text(f"SELECT partition_table FROM {PARTITIONS_TABLE}")):
+                conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{partition_table}"')
+            conn.execute(text(f"DELETE FROM {PARTITIONS_TABLE}"))
+            keys = [
+                row[0]
+                for row in conn.execute(
+                    text(f"SELECT DISTINCT {key_expr} FROM {PARENT_TABLE} o WHERE o.{PARTITION_COLUMN} IS NOT NULL")
+                )
+            ] + [UNDATED_PARTITION]
+        keys = sorted(set(keys))
+
+        for key in keys:
+            start, end = partition_range(key)
+            if start is None:
+                where = f"o.{PARTITION_COLUMN} IS NULL"
+            else:
+                where = f"o.{PARTITION_COLUMN} >= :start AND o.{PARTITION_COLUMN} < :end"
+            for table in PARTITIONED_TABLES:
+                if table not in existing:
+                    continue
+                partition_table = partition_table_name(table, key)
+                conn.exec_driver_sql(f'DROP TABLE IF EXISTS "{partition_table}"')
+                if table == PARENT_TABLE:
+                    select = f"SELECT o.* FROM {PARENT_TABLE} o WHERE {where}"
+                else:
+                    # Rows without an order end up in the undated partition
+                    select = (
+                        f"SELECT c.* FROM {table} c "
+                        f"LEFT JOIN {PARENT_TABLE} o ON o.order_id = c.order_id WHERE {where}"
+                    )
+                conn.execute(text(f'CREATE TABLE "{partition_table}" AS {select}'), {"start": start, "end": end})
+                conn.exec_driver_sql(
+                    f'CREATE INDEX "idx_{partition_table}_order_id" ON "{partition_table}"(order_id)'
+                )
+                if table == PARENT_TABLE:
+                    conn.exec_driver_sql(
+                        f'CREATE INDEX "idx_{partition_table}_purchase_ts" '
+                        f'ON "{partition_table}"({PARTITION_COLUMN})'
+                    )
+                row_count = conn.exec_driver_sql(f'SELECT COUNT(*) FROM "{partition_table}"').scalar()
+                conn.execute(
+                    text(
+                        f"INSERT OR REPLACE INTO {PARTITIONS_TABLE} "
+                        "(table_name, partition_key, partition_table, granularity, start, end, row_count) "
+                        "VALUES (:table, :key, :partition_table, :granularity, :start, :end, :rows)"
+                    ),
+                    {
+                        "table": table,
+                        "key": key,
+                        "partition_table": partition_table,
+                        "granularity": granularity,
+                        "start": start,
+                        "end": end,
+                        "rows": row_count,
+                    },
+                )
+    return keys
+
+
+def refresh_partitions(database: Engine, months: Iterable[str]) -> List[str]:
+    """Rebuild the partitions of some purchase months, if the tables are partitioned.
+
+    Args:
+        database (Engine): Database connection.
+        months (Iterable[str]): "YYYY-MM" purchase months that changed, e.g.
+            AggregatePartitions.delivery_months.
+
+    Returns:
+        List[str]: The partition keys rebuilt.
+    """
+    granularity = partition_granularity(database)
+    keys = {partition_key(m, granularity) for m in months} if granularity else set()
+    if not keys:
+        return []
+    return build_partitions(database, granularity, keys)
+
+
+def prune_partitions(
+    partitions: List[Partition], start: Optional[str] = None, end: Optional[str] = None
+) -> List[Partition]:
+    """Keep the partitions that can hold purchases in [start, end).
+
+    Args:
+        partitions (List[Partition]): Partitions of one table.
+        start (str, optional): First purchase date ("YYYY-MM-DD"), inclusive.
+        end (str, optional): Last purchase date, exclusive.
+
+    Returns:
+        List[Partition]: The partitions to scan. The undated one is only kept
+        when the range is unbounded on both sides.
+    """
+    kept = []
+    for partition in partitions:
+        if partition.start is None:
+            if start is None and end is None:
+                kept.append(partition)
+            continue
+        if (end is None or partition.start < end) and (start is None or partition.end > start):
+            kept.append(partition)
+    return kept
+
+
+def run_partitioned(
+    database: Engine,
+    sql: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    params: Optional[dict] = None,
+    workers: int = 4,
+) -> DataFrame:
+    """Run a query on every partition of the purchase range, in parallel.
+
+    `sql` names the fact tables as format fields ({olist_orders},
+    {olist_order_items}, ...) and gets :start and :end (None when unbounded)
+    as parameters, to filter the rows of the partitions that only overlap the
+    range. Every pruned partition runs on its own read-only connection and the
+    results are concatenated in partition order, so the query has to return
+    rows that can be combined afterwards (e.g. counts per day). Without
+    partitions it runs once on the base tables.
+
+    Args:
+        database (Engine): Database connection.
+        sql (str): The query template.
+        start (str, optional): First purchase date ("YYYY-MM-DD"), inclusive.
+        end (str, optional): Last purchase date, exclusive.
+        params (dict, optional): More bind parameters.
+        workers (int): Maximum number of partitions queried at the same time.
+
+    Returns:
+        DataFrame: The concatenated results.
+    """
+    params = {**(params or {}), "start": start, "end": end}
+    catalog = read_partitions(database)
+    if not catalog:
+        plans = [{table: table for table in PARTITIONED_TABLES}]
+    else:
+        plans = [
+            {
+                table: partition_table_name(table, partition.key) if table in catalog else table
+                for table in PARTITIONED_TABLES
+            }
+            for partition in prune_partitions(catalog[PARENT_TABLE], start, end)
+        ]
+    if not plans:
+        # Nothing in range: run on an empty partition to keep the columns
+        plans = [{table: table for table in PARTITIONED_TABLES}]
+        params = {**params, "start": "9999-12-31", "end": "9999-12-31"}
+
+    # Parallel readers need their own connections: the read-only pool of the file
+    reader = read_only_engine_for(database)
+
+    def run(tables: Dict[str, str]) -> DataFrame:
+        return read_sql(text(sql.format(**tables)), reader, params=params)
+
+    if len(plans) == 1 or reader is database:
+        results = [run(tables) for tables in plans]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(run, plans))
+    return pd.concat(results, ignore_index=True)
+
+
+_ORDERS_IN_RANGE_SQL = f"""
+SELECT *
+FROM {{{PARENT_TABLE}}}
+WHERE (:start IS NULL OR {PARTITION_COLUMN} >= :start)
+  AND (:end IS NULL OR {PARTITION_COLUMN} < :end)
+"""
+
+
+def read_orders(
+    database: Engine, start: Optional[str] = None, end: Optional[str] = None
+) -> DataFrame:
+    """Read the orders purchased in [start, end), scanning only their partitions.
+
+    Args:
+        database (Engine): Database connection.
+        start (str, optional): First purchase date ("YYYY-MM-DD"), inclusive.
+        end (str, optional): Last purchase date, exclusive.
+
+    Returns:
+        DataFrame: The olist_orders rows.
+    """
+    return run_partitioned(database, _ORDERS_IN_RANGE_SQL, start, end)
@@ -0,0 +1,414 @@
+import fnmatch
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from src.config import (
+    ARTIFACTS_ROOT_PATH,
+    DATASET_ROOT_PATH,
+    PUBLIC_HOLIDAYS_URL,
+    QUERY_RESULTS_EXPORT_PATH,
+    SQLITE_BD_ABSOLUTE_PATH,
+    get_csv_to_table_mapping,
+)
+
+PIPELINE_ROOT_PATH = os.path.join(ARTIFACTS_ROOT_PATH, "pipeline")
+PIPELINE_STATE_PATH = os.path.join(PIPELINE_ROOT_PATH, "state.json")
+
+# A node of the pipeline graph: it runs `func` once every stage in `deps` is done.
+# `func` may return a short detail string, logged and checkpointed with the stage.
+# `fingerprint` returns a string describing the inputs and options of the stage;
+# it is saved with the checkpoint, which no longer counts as done once the
+# string changes. A `transient` stage leaves an output that its dependents
+# consume (e.g. the staging tables, renamed away by load), so it runs again
+# whenever they do, and running it also runs them.
+Stage = namedtuple("Stage", ["name", "deps", "func", "fingerprint", "transient"], defaults=(None, False))
+
+
+def _write_parquet_atomic(df: pd.DataFrame, path: str) -> None:
+    """Write a Parquet file under a temporary name and rename it into place.
+
+    Args:
+        df (pd.DataFrame): The data.
+        path (str): Final path.
+    """
+    tmp_path = f"{path}.tmp"
+    df.to_parquet(tmp_path, engine="pyarrow", index=False)
+    os.replace(tmp_path, path)
+
+
+def build_stages(
+    db_path: str = SQLITE_BD_ABSOLUTE_PATH,
+    workdir: str = PIPELINE_ROOT_PATH,
+    results_dir: str = QUERY_RESULTS_EXPORT_PATH,
+    approximate: bool = False,
+    partition_by: Optional[str] = None,
+    backend: str = "pandas",
+) -> Dict[str, Stage]:
+    """Build the stage graph of the local pipeline.
+
+    extract:<table> -> stage:<table> -> load -> index -> transform:<query> -> export
+    extract:<table> -> validate -> load
+
+    Every stage leaves its output on disk (Parquet files or warehouse tables),
+    so a later run can start from any stage whose inputs are checkpointed.
+
+    Args:
+        db_path (str): Path of the SQLite warehouse.
+        workdir (str): Folder for the extracted tables and query artifacts.
+        results_dir (str): Folder where the JSON results are exported.
+        approximate (bool): Whether the index stage also builds the sketches
+            of src.sketches and the queries with an approximate variant use
+            them (see run_query).
+        partition_by (str, optional): "year" or "month" to also copy the fact
+            tables into one table per purchase period in the load stage (see
+            src.partitions).
+        backend (str): Backend of the queries computed from the base tables,
+            "pandas", "polars" or "partitioned" (see run_query).
+
+    Returns:
+        Dict[str, Stage]: Stages by name, in topological order.
+    """
+    # Imported here, not at module level, so importing src.pipeline stays light;
+    # building the graph (also for --list) pays for them once
+    from src.aggregates import refresh_aggregates
+    from src.artifacts import export_artifact_json, export_filter_options, write_result_artifact
+    from src.delivery import refresh_delivery_histograms
+    from src.extract import compact_dataframe, extract_table, table_nbytes
+    from src.load import get_engine, load_staging, publish_staging
+    from src.partitions import build_partitions
+    from src.sellers import refresh_seller_scorecard
+    from src.sketches import refresh_category_sketches
+    from src.transform import get_query_functions, query_code_version, run_query
+    from src.validation import errors, format_report, iter_parquet, validate_tables, write_report
+
+    staged_dir = os.path.join(workdir, "staged")
+    tables = list(get_csv_to_table_mapping().values()) + ["public_holidays"]
+    queries = list(get_query_functions())
+    stages: Dict[str, Stage] = {}
+
+    def staged_path(table: str) -> str:
+        return os.path.join(staged_dir, f"{table}.parquet")
+
+    csv_files = {table: csv_file for csv_file, table in get_csv_to_table_mapping().items()}
+
+    def source_fingerprint(table: str) -> Callable[[], str]:
+        # Size and modification time of the CSV: replacing it re-runs the
+        # extract and everything downstream
+        def fingerprint() -> str:
+            if table not in csv_files:
+                return f"{PUBLIC_HOLIDAYS_URL}/2017/BR"
+            path = os.path.join(DATASET_ROOT_PATH, csv_files[table])
+            if not os.path.exists(path):
+                return f"{path}:missing"
+            info = os.stat(path)
+            return f"{path}:{info.st_size}:{info.st_mtime_ns}"
+
+        return fingerprint
+
+    def options_fingerprint(**options) -> Callable[[], str]:
+        return lambda: json.dumps(options, sort_keys=True)
+
+    def transform_fingerprint(query_name: str) -> Callable[[], str]:
+        # Options and code of the query: editing its .sql file or a src helper
+        # it uses re-runs the transform and the export
+        def fingerprint() -> str:
+            code = query_code_version(query_name, incremental=True, approximate=approximate, backend=backend)
+            return json.dumps({"approximate": approximate, "backend": backend, "code": code}, sort_keys=True)
+
+        return fingerprint
+
+    def extract_stage(table: str) -> Callable[[], str]:
+        def run() -> str:
+            os.makedirs(staged_dir, exist_ok=True)
+            raw = extract_table(table)
+            raw_bytes = table_nbytes(raw)
+            df = compact_dataframe(table, raw)
+            del raw
+            _write_parquet_atomic(df, staged_path(table))
+            return f"{raw_bytes / 2**20:0.1f} MiB -> {table_nbytes(df) / 2**20:0.1f} MiB"
+
+        return run
+
+    def stage_stage(table: str) -> Callable[[], None]:
+        def run() -> None:
+            df = pd.read_parquet(staged_path(table), engine="pyarrow")
+            load_staging(table, df, get_engine(db_path))
+
+        return run
+
+    def validate_stage() -> str:
+        # Schemas, keys, foreign keys and ranges of the extracted tables, read
+        # back in chunks; errors stop the pipeline before anything is published
+        report = validate_tables({table: iter_parquet(staged_path(table)) for table in tables})
+        write_report(report, os.path.join(workdir, "validation.json"))
+        if errors(report):
+            raise ValueError(format_report(report))
+        return format_report(report).splitlines()[0]
+
+    def load_stage() -> Optional[str]:
+        publish_staging(get_engine(db_path), tables)
+        if partition_by:
+            keys = build_partitions(get_engine(db_path), partition_by)
+            return f"{len(keys)} partitions by {partition_by}"
+        return None
+
+    def index_stage() -> None:
+        # Indexes are rebuilt by publish_staging in the same transaction as the
+        # swap; here the planner statistics, the summary tables, the seller
+        # scorecard and the delivery histograms catch up
+        engine = get_engine(db_path)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+        refresh_aggregates(engine)
+        refresh_seller_scorecard(engine)
+        refresh_delivery_histograms(engine)
+        if approximate:
+            refresh_category_sketches(engine)
+
+    def transform_stage(query_name: str) -> Callable[[], None]:
+        def run() -> None:
+            result = run_query(
+                query_name,
+                get_engine(db_path),
+                use_cache=True,
+                incremental=True,
+                approximate=approximate,
+                backend=backend,
+            ).result
+            write_result_artifact(query_name, result, run_id="local", root=workdir)
+
+        return run
+
+    def export_stage() -> None:
+        artifacts = os.path.join(workdir, "local")
+        paths = [
+            os.path.join(artifacts, file_name)
+            for file_name in sorted(os.listdir(artifacts))
+            if file_name.endswith(".parquet")
+        ]
+        for path in paths:
+            export_artifact_json(path, results_dir)
+        export_filter_options(paths, results_dir)
+
+    for table in tables:
+        stages[f"extract:{table}"] = Stage(f"extract:{table}", (), extract_stage(table), source_fingerprint(table))
+    for table in tables:
+        # The staging tables only live until load publishes them
+        stages[f"stage:{table}"] = Stage(
+            f"stage:{table}", (f"extract:{table}",), stage_stage(table), transient=True
+        )
+    stages["validate"] = Stage("validate", tuple(f"extract:{t}" for t in tables), validate_stage)
+    stages["load"] = Stage(
+        "load",
+        tuple(f"stage:{t}" for t in tables) + ("validate",),
+        load_stage,
+        options_fingerprint(partition_by=partition_by),
+    )
+    stages["index"] = Stage("index", ("load",), index_stage, options_fingerprint(approximate=approximate))
+    for query_name in queries:
+        stages[f"transform:{query_name}"] = Stage(
+            f"transform:{query_name}",
+            ("index",),
+            transform_stage(query_name),
+            transform_fingerprint(query_name),
+        )
+    stages["export"] = Stage("export", tuple(f"transform:{q}" for q in queries), export_stage)
+    return stages
+
+
+def _match(stages: Dict[str, Stage], patterns: Iterable[str]) -> Set[str]:
+    """Get the stages matching names, globs ("transform:*") or a prefix ("extract").
+
+    Raises:
+        ValueError: If a pattern matches no stage.
+    """
+    matched = set()
+    for pattern in patterns:
+        names = {
+            name
+            for name in stages
+            if fnmatch.fnmatchcase(name, pattern) or name.split(":")[0] == pattern
+        }
+        if not names:
+            raise ValueError(f"No stage matches '{pattern}'")
+        matched |= names
+    return matched
+
+
+def _with_transient(stages: Dict[str, Stage], names: Set[str]) -> Set[str]:
+    """Add the transient dependencies of `names` and the dependents of their
+    transient stages, until nothing changes."""
+    result = set(names)
+    changed = True
+    while changed:
+        changed = False
+        for name, stage in stages.items():
+            if name in result:
+                continue
+            needed = stage.transient and any(name in stages[other].deps for other in result)
+            if needed or any(stages[dep].transient and dep in result for dep in stage.deps):
+                result.add(name)
+                changed = True
+    return result
+
+
+def stage_fingerprint(stage: Stage) -> Optional[str]:
+    """Current fingerprint of a stage, None if it doesn't declare one."""
+    return stage.fingerprint() if stage.fingerprint else None
+
+
+def _descendants(stages: Dict[str, Stage], names: Set[str]) -> Set[str]:
+    """Get the stages that depend, directly or not, on any of `names` (included)."""
+    result = set(names)
+    for name, stage in stages.items():  # stages are in topological order
+        if any(dep in result for dep in stage.deps):
+            result.add(name)
+    return result
+
+
+def load_state(state_path: str) -> Dict[str, dict]:
+    """Read the checkpoints of a previous run (empty on the first one)."""
+    if not os.path.exists(state_path):
+        return {}
+    with open(state_path, "r") as f:
+        return json.load(f)
+
+
+def _save_state(state_path: str, state: Dict[str, dict]) -> None:
+    """Write the checkpoints, replacing the file atomically."""
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, state_path)
+
+
+def plan_stages(
+    stages: Dict[str, Stage],
+    state: Dict[str, dict],
+    from_stage: Optional[List[str]] = None,
+    only: Optional[List[str]] = None,
+) -> List[str]:
+    """Decide which stages have to run.
+
+    By default, every stage without a "done" checkpoint runs, plus everything
+    downstream of it; a checkpoint whose fingerprint differs from the current
+    one (changed inputs or options) doesn't count as done. from_stage forces
+    the matched stages and their descendants to run again. only runs just the
+    matched stages, whose upstream stages must already be checkpointed.
+    Transient stages always run together with their dependents.
+
+    Args:
+        stages (Dict[str, Stage]): The stage graph.
+        state (Dict[str, dict]): Checkpoints by stage name.
+        from_stage (List[str], optional): Stage patterns to restart from.
+        only (List[str], optional): Stage patterns to run alone.
+
+    Raises:
+        ValueError: If a pattern matches nothing, or with `only` when an
+            upstream stage has no checkpoint.
+
+    Returns:
+        List[str]: Stage names in topological order.
+    """
+    fingerprints = {name: stage_fingerprint(stage) for name, stage in stages.items()}
+
+    def done(name: str) -> bool:
+        checkpoint = state.get(name, {})
+        return checkpoint.get("status") == "done" and checkpoint.get("fingerprint") == fingerprints[name]
+
+    if only:
+        selected = _with_transient(stages, _match(stages, only))
+        for name in selected:
+            missing = [d for d in stages[name].deps if d not in selected and not done(d)]
+            if missing:
+                raise ValueError(f"{name} needs {', '.join(missing)} to be done first")
+    else:
+        selected = {name for name in stages if not done(name)}
+        if from_stage:
+            selected |= _match(stages, from_stage)
+        # Running a transient stage may pull in siblings of a planned stage
+        selected = _descendants(stages, _with_transient(stages, _descendants(stages, selected)))
+    return [name for name in stages if name in selected]
+
+
+def run_stages(
+    stages: Dict[str, Stage],
+    plan: List[str],
+    state_path: str,
+    workers: int = 4,
+    log: Callable[[str], None] = print,
+) -> bool:
+    """Run the planned stages, in parallel whenever their dependencies allow.
+
+    The checkpoint of each stage is saved as soon as it finishes. On the first
+    failure no new stage is started; the running ones finish and are
+    checkpointed, so the next run resumes from the failed stage.
+
+    Args:
+        stages (Dict[str, Stage]): The stage graph.
+        plan (List[str]): Stages to run, from plan_stages.
+        state_path (str): Path of the JSON checkpoint file.
+        workers (int): Maximum number of stages running at the same time.
+        log (Callable[[str], None]): Progress reporter.
+
+    Returns:
+        bool: True if every planned stage finished.
+    """
+    state = load_state(state_path)
+    for name in plan:
+        state[name] = {"status": "pending"}
+    _save_state(state_path, state)
+
+    pending = list(plan)
+    running = {}
+    failed = False
+
+    def ready(name: str) -> bool:
+        return all(state.get(dep, {}).get("status") == "done" for dep in stages[name].deps)
+
+    def run(name: str) -> Tuple[float, Optional[str], Optional[str]]:
+        # Taken before running: inputs that change meanwhile run it again
+        fingerprint = stage_fingerprint(stages[name])
+        start = perf_counter()
+        detail = stages[name].func()
+        return perf_counter() - start, detail, fingerprint
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            if not failed:
+                for name in [n for n in pending if ready(n)]:
+                    pending.remove(name)
+                    running[executor.submit(run, name)] = name
+                    log(f"▶ {name}")
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    elapsed, detail, fingerprint = future.result()
+                except BaseException as e:  # includes SystemExit from the holidays fetch
+                    failed = True
+                    state[name] = {"status": "failed", "error": str(e)}
+                    log(f"❌ {name}: {e}")
+                else:
+                    state[name] = {
+                        "status": "done",
+                        "seconds": round(elapsed, 3),
+                        "finished_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    }
+                    if detail:
+                        state[name]["detail"] = detail
+                    if fingerprint is not None:
+                        state[name]["fingerprint"] = fingerprint
+                    log(f"✓ {name} ({elapsed:0.2f}s)" + (f" {detail}" if detail else ""))
+                _save_state(state_path, state)
+    return not failed and not pending
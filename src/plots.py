@@ -1,19 +1,44 @@
-import matplotlib
-import matplotlib.pyplot as plt
+# matplotlib, seaborn and plotly take seconds to import, so each chart imports
+# only the backend it draws with: importing this module stays cheap for the
+# pipeline, the report workers and the dashboard
+from pandas import DataFrame
 
-import plotly.express as px
-import seaborn as sns
 
-from pandas import DataFrame
+def _finish(fig, show: bool):
+    """Show a figure interactively, or hand it back to the caller.
+
+    Args:
+        fig: A matplotlib or plotly figure.
+        show (bool): Show it (notebook use) instead of returning it.
 
+    Returns:
+        The figure when show is False, otherwise None so notebook cells do
+        not display it twice.
+    """
+    if not show:
+        return fig
+    if hasattr(fig, "savefig"):
+        import matplotlib.pyplot as plt
+
+        plt.show()
+    else:
+        fig.show()
+    return None
 
-def plot_revenue_by_month_year(df: DataFrame, year: int):
+
+def plot_revenue_by_month_year(df: DataFrame, year: int, show: bool = True):
     """Plot revenue by month in a given year
 
     Args:
         df (DataFrame): Dataframe with revenue by month and year query result
         year (int): It could be 2016, 2017 or 2018
+        show (bool): Show the chart instead of returning it
+
+    Returns:
+        Figure: The matplotlib figure when show is False, else None
     """
+    import matplotlib.pyplot as plt
+
     # Usar matplotlib directamente para evitar problemas con seaborn/pandas
     fig, ax1 = plt.subplots(figsize=(12, 6))
 
@@ -41,21 +66,29 @@ def plot_revenue_by_month_year(df: DataFrame, year: int):
     ax1.grid(True, which="both", axis="y", linestyle="--", alpha=0.5)
 
     fig.tight_layout()
-    plt.show()
+    return _finish(fig, show)
 
 
-def plot_real_vs_predicted_delivered_time(df: DataFrame, year: int):
+def plot_real_vs_predicted_delivered_time(df: DataFrame, year: int, show: bool = True):
     """Plot real vs predicted delivered time by month in a given year
 
     Args:
         df (DataFrame): Dataframe with real vs predicted delivered time by month and
                         year query result
         year (int): It could be 2016, 2017 or 2018
+        show (bool): Show the chart instead of returning it
+
+    Returns:
+        Figure: The matplotlib figure when show is False, else None
     """
+    import matplotlib
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     matplotlib.rc_file_defaults()
     sns.set_style(style=None, rc=None)
 
-    _, ax1 = plt.subplots(figsize=(12, 6))
+    fig, ax1 = plt.subplots(figsize=(12, 6))
 
     sns.lineplot(data=df[f"Year{year}_real_time"], marker="o", sort=False, ax=ax1)
     ax1.twinx()
@@ -68,16 +101,22 @@ def plot_real_vs_predicted_delivered_time(df: DataFrame, year: int):
     ax1.set_title(f"Average days delivery time by month in {year}")
     ax1.legend(["Real time", "Estimated time"])
 
-    plt.show()
+    return _finish(fig, show)
 
 
-def plot_global_amount_order_status(df: DataFrame):
+def plot_global_amount_order_status(df: DataFrame, show: bool = True):
     """Plot global amount of order status
 
     Args:
         df (DataFrame): Dataframe with global amount of order status query result
+        show (bool): Show the chart instead of returning it
+
+    Returns:
+        Figure: The matplotlib figure when show is False, else None
     """
-    _, ax = plt.subplots(figsize=(6, 3), subplot_kw=dict(aspect="equal"))
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(6, 3), subplot_kw=dict(aspect="equal"))
 
     elements = [x.split()[-1] for x in df["order_status"]]
 
@@ -99,29 +138,41 @@ def plot_global_amount_order_status(df: DataFrame):
     p = plt.gcf()
     p.gca().add_artist(my_circle)
 
-    plt.show()
+    return _finish(fig, show)
 
 
-def plot_revenue_per_state(df: DataFrame):
+def plot_revenue_per_state(df: DataFrame, show: bool = True):
     """Plot revenue per state
 
     Args:
         df (DataFrame): Dataframe with revenue per state query result
+        show (bool): Show the chart instead of returning it
+
+    Returns:
+        Figure: The plotly figure when show is False, else None
     """
+    import plotly.express as px
+
     fig = px.treemap(
         df, path=["customer_state"], values="Revenue", width=800, height=400
     )
     fig.update_layout(margin=dict(t=50, l=25, r=25, b=25))
-    fig.show()
+    return _finish(fig, show)
 
 
-def plot_top_10_least_revenue_categories(df: DataFrame):
+def plot_top_10_least_revenue_categories(df: DataFrame, show: bool = True):
     """Plot top 10 least revenue categories
 
     Args:
         df (DataFrame): Dataframe with top 10 least revenue categories query result
+        show (bool): Show the chart instead of returning it
+
+    Returns:
+        Figure: The matplotlib figure when show is False, else None
     """
-    _, ax = plt.subplots(figsize=(6, 3), subplot_kw=dict(aspect="equal"))
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(6, 3), subplot_kw=dict(aspect="equal"))
 
     elements = [x.split()[-1] for x in df["Category"]]
 
@@ -143,17 +194,23 @@ def plot_top_10_least_revenue_categories(df: DataFrame):
 
     ax.set_title("Top 10 Least Revenue Categories ammount")
 
-    plt.show()
+    return _finish(fig, show)
 
 
-def plot_top_10_revenue_categories_ammount(df: DataFrame):
+def plot_top_10_revenue_categories_ammount(df: DataFrame, show: bool = True):
     """Plot top 10 revenue categories
 
     Args:
         df (DataFrame): Dataframe with top 10 revenue categories query result
+        show (bool): Show the chart instead of returning it
+
+    Returns:
+        Figure: The matplotlib figure when show is False, else None
     """
+    import matplotlib.pyplot as plt
+
     # Plotting the top 10 revenue categories ammount
-    _, ax = plt.subplots(figsize=(6, 3), subplot_kw=dict(aspect="equal"))
+    fig, ax = plt.subplots(figsize=(6, 3), subplot_kw=dict(aspect="equal"))
 
     elements = [x.split()[-1] for x in df["Category"]]
 
@@ -175,86 +232,163 @@ def plot_top_10_revenue_categories_ammount(df: DataFrame):
 
     ax.set_title("Top 10 Revenue Categories ammount")
 
-    plt.show()
+    return _finish(fig, show)
 
 
-def plot_top_10_revenue_categories(df: DataFrame):
+def plot_top_10_revenue_categories(df: DataFrame, show: bool = True):
     """Plot top 10 revenue categories
 
     Args:
         df (DataFrame): Dataframe with top 10 revenue categories query result
+        show (bool): Show the chart instead of returning it
+
+    Returns:
+        Figure: The plotly figure when show is False, else None
     """
+    import plotly.express as px
+
     fig = px.treemap(df, path=["Category"], values="Num_order", width=800, height=400)
     fig.update_layout(margin=dict(t=50, l=25, r=25, b=25))
-    fig.show()
+    return _finish(fig, show)
+
 
+def _streaming_linear_fit(x, y, chunk_size: int = 1_000_000):
+    """Fit y = slope * x + intercept by least squares, one chunk at a time.
 
-def plot_freight_value_weight_relationship(df: DataFrame):
+    Each chunk contributes its count, means and centered sums of squares,
+    merged with the pairwise update of Chan et al., so memory stays
+    constant and the result matches np.polyfit(x, y, 1) on the full data.
+
+    Args:
+        x (np.ndarray): Independent variable, without NaNs.
+        y (np.ndarray): Dependent variable, without NaNs.
+        chunk_size (int): Points per chunk.
+
+    Returns:
+        Tuple[float, float]: slope and intercept, or None if there are
+            fewer than two points or x is constant.
+    """
+    if len(x) < 2:
+        return None
+
+    n, mean_x, mean_y, sxx, sxy = 0, 0.0, 0.0, 0.0, 0.0
+    for start in range(0, len(x), chunk_size):
+        cx = x[start : start + chunk_size]
+        cy = y[start : start + chunk_size]
+        m = len(cx)
+        cmean_x, cmean_y = cx.mean(), cy.mean()
+        dx = cx - cmean_x
+        csxx, csxy = dx @ dx, dx @ (cy - cmean_y)
+
+        total = n + m
+        delta_x, delta_y = cmean_x - mean_x, cmean_y - mean_y
+        sxx += csxx + delta_x * delta_x * n * m / total
+        sxy += csxy + delta_x * delta_y * n * m / total
+        mean_x += delta_x * m / total
+        mean_y += delta_y * m / total
+        n = total
+
+    if n < 2 or sxx == 0:
+        return None
+    slope = sxy / sxx
+    return slope, mean_y - slope * mean_x
+
+
+def plot_freight_value_weight_relationship(df: DataFrame, bins: int = 200, show: bool = True):
     """Plot freight value weight relationship
 
+    Every point is binned into a 2D density grid and the trend line is fitted
+    on the full data, so the cost of drawing does not grow with the rows.
+
     Args:
         df (DataFrame): Dataframe with freight value weight relationship query result
+        bins (int): Grid cells per axis
+        show (bool): Show the chart instead of returning it
+
+    Returns:
+        Figure: The matplotlib figure when show is False, else None
     """
+    import matplotlib
     import matplotlib.pyplot as plt
-    import seaborn as sns
     import numpy as np
-    
+    import seaborn as sns
+    from matplotlib.colors import LogNorm
+
     # Configurar el estilo
     matplotlib.rc_file_defaults()
     sns.set_style("whitegrid")
-    
+
+    x = df["product_weight_g"].to_numpy(dtype=float)
+    y = df["freight_value"].to_numpy(dtype=float)
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y = x[valid], y[valid]
+
     # Crear la figura
-    plt.figure(figsize=(12, 8))
-    
-    # Crear scatterplot con seaborn
-    # Usando una muestra para mejor rendimiento visual
-    sample_size = min(5000, len(df))  # Máximo 5000 puntos para mejor visualización
-    df_sample = df.sample(n=sample_size, random_state=42)
-    
-    sns.scatterplot(data=df_sample, 
-                   x='product_weight_g', 
-                   y='freight_value', 
-                   alpha=0.6, 
-                   s=30)
-    
+    fig, ax = plt.subplots(figsize=(12, 8))
+
+    # Densidad 2D con todos los puntos (escala log: pocos pedidos pesados se
+    # ven junto a la masa de productos livianos). Sin filas válidas la escala
+    # log no tiene rango: se dibujan sólo los ejes
+    if x.size:
+        counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins)
+        mesh = ax.pcolormesh(
+            x_edges,
+            y_edges,
+            np.ma.masked_equal(counts.T, 0),
+            norm=LogNorm(),
+            cmap="viridis",
+            shading="flat",
+        )
+        fig.colorbar(mesh, ax=ax, label="Orders per cell")
+
     # Configurar títulos y etiquetas
-    plt.title('Freight Value vs Product Weight Relationship', fontsize=16, fontweight='bold')
-    plt.xlabel('Product Weight (grams)', fontsize=12)
-    plt.ylabel('Freight Value (R$)', fontsize=12)
-    
-    # Agregar línea de tendencia
-    try:
-        z = np.polyfit(df_sample['product_weight_g'], df_sample['freight_value'], 1)
-        p = np.poly1d(z)
-        plt.plot(df_sample['product_weight_g'].sort_values(), 
-                p(df_sample['product_weight_g'].sort_values()), 
-                "r--", alpha=0.8, linewidth=2, label=f'Trend line')
-        plt.legend()
-    except:
-        pass  # Si hay error en la línea de tendencia, continuar sin ella
-    
+    ax.set_title("Freight Value vs Product Weight Relationship", fontsize=16, fontweight="bold")
+    ax.set_xlabel("Product Weight (grams)", fontsize=12)
+    ax.set_ylabel("Freight Value (R$)", fontsize=12)
+
+    # Línea de tendencia ajustada sobre todos los datos (None con menos de dos puntos)
+    fit = _streaming_linear_fit(x, y)
+    if fit is not None:
+        slope, intercept = fit
+        xs = np.array([x_edges[0], x_edges[-1]])
+        ax.plot(xs, slope * xs + intercept, "r--", alpha=0.8, linewidth=2, label="Trend line")
+        ax.legend()
+
     # Mejorar el layout
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
-    plt.show()
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+    return _finish(fig, show)
 
 
-def plot_delivery_date_difference(df: DataFrame):
+def plot_delivery_date_difference(df: DataFrame, show: bool = True):
     """Plot delivery date difference
 
     Args:
         df (DataFrame): Dataframe with delivery date difference query result
+        show (bool): Show the chart instead of returning it
+
+    Returns:
+        Figure: The matplotlib figure when show is False, else None
     """
-    sns.barplot(data=df, x="Delivery_Difference", y="State").set(
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    fig, ax = plt.subplots()
+    sns.barplot(data=df, x="Delivery_Difference", y="State", ax=ax).set(
         title="Difference Between Delivery Estimate Date and Delivery Date"
     )
+    return _finish(fig, show)
 
 
-def plot_order_amount_per_day_with_holidays(df: DataFrame):
+def plot_order_amount_per_day_with_holidays(df: DataFrame, show: bool = True):
     """Plot order amount per day with holidays
 
     Args:
         df (DataFrame): Dataframe with order amount per day with holidays query result
+        show (bool): Show the chart instead of returning it
+
+    Returns:
+        Figure: The matplotlib figure when show is False, else None
     """
     import pandas as pd
     import matplotlib.pyplot as plt
@@ -266,7 +400,7 @@ def plot_order_amount_per_day_with_holidays(df: DataFrame):
     df_copy['date'] = pd.to_datetime(df_copy['date'], unit='ms')
     
     # Crear la figura
-    plt.figure(figsize=(15, 8))
+    fig = plt.figure(figsize=(15, 8))
     
     # Graficar la línea principal de pedidos por día
     plt.plot(df_copy['date'], df_copy['order_count'], 
@@ -299,4 +433,4 @@ def plot_order_amount_per_day_with_holidays(df: DataFrame):
     # Mejorar el layout
     plt.grid(True, alpha=0.3)
     plt.tight_layout()
-    plt.show()
+    return _finish(fig, show)
@@ -0,0 +1,172 @@
+import os
+from typing import Dict, Optional, Union
+
+from pandas import DataFrame
+from sqlalchemy import text
+from sqlalchemy.engine.base import Engine
+
+# polars is optional: it is imported by the functions that use it, so the rest
+# of the pipeline runs without it.
+POLARS_INSTALL_HINT = "The polars backend needs polars >= 1.25: pip install polars"
+
+# Where a plan reads its tables from: the database, or a folder with one
+# <table>.parquet file per table (e.g. the staged/ folder of the pipeline).
+Source = Union[Engine, str]
+
+FREIGHT_TABLES = ("olist_order_items", "olist_orders", "olist_products")
+ORDERS_PER_DAY_TABLES = ("olist_orders", "public_holidays")
+
+
+def _polars():
+    try:
+        import polars
+    except ImportError as error:
+        raise ImportError(POLARS_INSTALL_HINT) from error
+    return polars
+
+
+def scan_table(
+    source: Source,
+    table: str,
+    schema: Dict[str, object],
+    where: Optional[str] = None,
+    params: Optional[dict] = None,
+):
+    """Lazily scan the columns of a table that a plan needs.
+
+    From a Parquet folder the scan is a polars scan_parquet, so the optimizer
+    pushes the projection and the filters of the plan into the reader. SQLite
+    has no polars scan: the columns and the `where` filter are sent in the SQL
+    instead, so only those rows and columns leave the database.
+
+    Args:
+        source (Source): Database connection or Parquet folder.
+        table (str): The table name.
+        schema (Dict[str, polars.DataType]): Columns to read and their types.
+            Values are cast to them, so both sources give the same frame.
+        where (str, optional): SQL filter, only used with the database.
+        params (dict, optional): Bind parameters of `where`.
+
+    Returns:
+        polars.LazyFrame: The scan.
+    """
+    pl = _polars()
+    if isinstance(source, Engine):
+        sql = f"SELECT {', '.join(schema)} FROM {table}" + (f" WHERE {where}" if where else "")
+        with source.connect() as conn:
+            frame = pl.read_database(text(sql).bindparams(**(params or {})), conn, schema_overrides=schema)
+        scan = frame.lazy()
+    else:
+        scan = pl.scan_parquet(os.path.join(source, f"{table}.parquet")).select(list(schema))
+    return scan.with_columns([pl.col(column).cast(dtype) for column, dtype in schema.items()])
+
+
+def collect(plan) -> DataFrame:
+    """Run a lazy plan on the streaming engine (multithreaded, in batches).
+
+    Args:
+        plan (polars.LazyFrame): The plan.
+
+    Returns:
+        DataFrame: The result as a pandas DataFrame.
+    """
+    return plan.collect(engine="streaming").to_pandas()
+
+
+def freight_value_weight_plan(source: Source):
+    """Lazy plan of query_freight_value_weight_relationship.
+
+    Args:
+        source (Source): Database connection or Parquet folder.
+
+    Returns:
+        polars.LazyFrame: Total freight value and product weight per delivered
+        order, sorted by order_id.
+    """
+    pl = _polars()
+    items = scan_table(
+        source,
+        "olist_order_items",
+        {"order_id": pl.String, "product_id": pl.String, "freight_value": pl.Float64},
+    )
+    orders = scan_table(
+        source,
+        "olist_orders",
+        {"order_id": pl.String, "order_status": pl.String},
+        where="order_status = 'delivered'",
+    ).filter(pl.col("order_status") == "delivered")
+    products = scan_table(source, "olist_products", {"product_id": pl.String, "product_weight_g": pl.Float64})
+    return (
+        items.join(orders, on="order_id")
+        .join(products, on="product_id")
+        .group_by("order_id")
+        .agg(pl.col("freight_value").sum(), pl.col("product_weight_g").sum())
+        .sort("order_id")
+    )
+
+
+def freight_value_weight_relationship(source: Source) -> DataFrame:
+    """Polars version of query_freight_value_weight_relationship.
+
+    Args:
+        source (Source): Database connection or Parquet folder.
+
+    Returns:
+        DataFrame: Same result as the pandas query. The sums may differ from it
+        in the last bit: pandas adds the values of a group with compensated
+        summation, in its merge order.
+    """
+    return collect(freight_value_weight_plan(source))
+
+
+def orders_per_day_and_holidays_plan(source: Source, year: int = 2017):
+    """Lazy plan of query_orders_per_day_and_holidays_2017.
+
+    Purchase timestamps are ISO text in the database, so the day and the year
+    are read from their first characters instead of parsing every value.
+
+    Args:
+        source (Source): Database connection or Parquet folder.
+        year (int): The purchase year.
+
+    Returns:
+        polars.LazyFrame: order_count, date (epoch milliseconds) and holiday
+        for every day of the year with orders, sorted by date.
+    """
+    pl = _polars()
+    start, end = f"{year}-01-01", f"{year + 1}-01-01"
+    orders = scan_table(
+        source,
+        "olist_orders",
+        {"order_purchase_timestamp": pl.String},
+        where="order_purchase_timestamp >= :start AND order_purchase_timestamp < :end",
+        params={"start": start, "end": end},
+    )
+    holidays = scan_table(source, "public_holidays", {"date": pl.String}).select(
+        pl.col("date").str.slice(0, 10).str.to_date("%Y-%m-%d").alias("day"), pl.lit(True).alias("holiday")
+    )
+    day = pl.col("order_purchase_timestamp").str.slice(0, 10).str.to_date("%Y-%m-%d")
+    return (
+        orders.filter(pl.col("order_purchase_timestamp").str.slice(0, 4) == str(year))
+        .group_by(day.alias("day"))
+        .agg(pl.len().cast(pl.Int64).alias("order_count"))
+        .join(holidays.unique("day"), on="day", how="left")
+        .sort("day")
+        .select(
+            "order_count",
+            pl.col("day").cast(pl.Datetime("ms")).cast(pl.Int64).alias("date"),
+            pl.col("holiday").fill_null(False),
+        )
+    )
+
+
+def orders_per_day_and_holidays_2017(source: Source) -> DataFrame:
+    """Polars version of query_orders_per_day_and_holidays_2017.
+
+    Args:
+        source (Source): Database connection or Parquet folder.
+
+    Returns:
+        DataFrame: Same result as the pandas query.
+    """
+    return collect(orders_per_day_and_holidays_plan(source, 2017))
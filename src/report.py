@@ -0,0 +1,216 @@
+import hashlib
+import inspect
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from pandas import DataFrame
+
+from src.config import ARTIFACTS_ROOT_PATH
+
+REPORT_ROOT_PATH = os.path.join(ARTIFACTS_ROOT_PATH, "report")
+MANIFEST_FILE = "manifest.json"
+
+# A chart of the report: src.plots.<plot>(results[query], **kwargs) saved as <name>.<ext>
+Chart = namedtuple("Chart", ["name", "query", "plot", "kwargs"])
+
+REPORT_CHARTS = [
+    *(
+        Chart(f"revenue_by_month_year_{year}", "revenue_by_month_year", "plot_revenue_by_month_year", {"year": year})
+        for year in (2016, 2017, 2018)
+    ),
+    *(
+        Chart(
+            f"real_vs_estimated_delivered_time_{year}",
+            "real_vs_estimated_delivered_time",
+            "plot_real_vs_predicted_delivered_time",
+            {"year": year},
+        )
+        for year in (2016, 2017, 2018)
+    ),
+    Chart("global_ammount_order_status", "global_ammount_order_status", "plot_global_amount_order_status", {}),
+    Chart("revenue_per_state", "revenue_per_state", "plot_revenue_per_state", {}),
+    Chart(
+        "top_10_least_revenue_categories",
+        "top_10_least_revenue_categories",
+        "plot_top_10_least_revenue_categories",
+        {},
+    ),
+    Chart(
+        "top_10_revenue_categories_ammount",
+        "top_10_revenue_categories",
+        "plot_top_10_revenue_categories_ammount",
+        {},
+    ),
+    Chart("top_10_revenue_categories", "top_10_revenue_categories", "plot_top_10_revenue_categories", {}),
+    Chart(
+        "freight_value_weight_relationship",
+        "get_freight_value_weight_relationship",
+        "plot_freight_value_weight_relationship",
+        {},
+    ),
+    Chart("delivery_date_difference", "delivery_date_difference", "plot_delivery_date_difference", {}),
+    Chart(
+        "orders_per_day_and_holidays_2017",
+        "orders_per_day_and_holidays_2017",
+        "plot_order_amount_per_day_with_holidays",
+        {},
+    ),
+]
+
+# matplotlib charts are saved in these formats; plotly charts always as HTML
+DEFAULT_FORMATS = ("png", "svg")
+
+
+def _plots_version() -> str:
+    """Hash of the src.plots source, so editing a chart re-renders it."""
+    from src import plots
+
+    return hashlib.sha256(inspect.getsource(plots).encode()).hexdigest()
+
+
+def chart_hash(chart: Chart, df: DataFrame, formats: Iterable[str], plots_version: str) -> str:
+    """Hash of everything a rendered chart depends on.
+
+    Args:
+        chart (Chart): The chart.
+        df (DataFrame): Its input query result.
+        formats (Iterable[str]): Output formats.
+        plots_version (str): Hash of the src.plots source.
+
+    Returns:
+        str: A hex digest that changes when the data, options or code change.
+    """
+    digest = hashlib.sha256()
+    digest.update(
+        json.dumps([chart.plot, chart.kwargs, sorted(formats), plots_version], sort_keys=True).encode()
+    )
+    digest.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+def _init_worker() -> None:
+    """Select the non-interactive Agg backend before any chart is drawn."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+
+def _render_chart(chart: Chart, df: DataFrame, outdir: str, formats: Tuple[str, ...]) -> List[str]:
+    """Draw one chart and save it, in a worker process.
+
+    Args:
+        chart (Chart): The chart.
+        df (DataFrame): Its input query result.
+        outdir (str): Output folder.
+        formats (Tuple[str, ...]): matplotlib output formats.
+
+    Returns:
+        List[str]: File names written, relative to outdir.
+    """
+    _init_worker()
+    import matplotlib.pyplot as plt
+
+    from src import plots
+
+    fig = getattr(plots, chart.plot)(df, show=False, **chart.kwargs)
+    files = []
+    if hasattr(fig, "write_html"):
+        files.append(f"{chart.name}.html")
+        fig.write_html(os.path.join(outdir, files[-1]), include_plotlyjs="cdn")
+    else:
+        for fmt in formats:
+            files.append(f"{chart.name}.{fmt}")
+            fig.savefig(os.path.join(outdir, files[-1]), format=fmt)
+        plt.close(fig)
+    return files
+
+
+def render_report(
+    results: Dict[str, DataFrame],
+    outdir: str = REPORT_ROOT_PATH,
+    formats: Iterable[str] = DEFAULT_FORMATS,
+    workers: Optional[int] = None,
+    charts: Iterable[Chart] = REPORT_CHARTS,
+    log: Callable[[str], None] = print,
+) -> Dict[str, dict]:
+    """Render the report charts to files, in parallel and headless.
+
+    Charts whose input hash matches the manifest of a previous render, and
+    whose files still exist, are skipped.
+
+    Args:
+        results (Dict[str, DataFrame]): Query results, as returned by run_queries.
+        outdir (str): Output folder; the manifest is written there too.
+        formats (Iterable[str]): matplotlib output formats (e.g. png, svg).
+        workers (int, optional): Size of the process pool (default: CPU count).
+        charts (Iterable[Chart]): Charts to render.
+        log (Callable[[str], None]): Progress reporter.
+
+    Returns:
+        Dict[str, dict]: The manifest, chart name -> {"hash", "files"}.
+
+    Raises:
+        RuntimeError: If any chart failed; the others are rendered and kept.
+    """
+    formats = tuple(formats)
+    os.makedirs(outdir, exist_ok=True)
+    manifest_path = os.path.join(outdir, MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+
+    plots_version = _plots_version()
+    pending = []
+    for chart in charts:
+        if chart.query not in results:
+            log(f"Skipping {chart.name}: no {chart.query} result")
+            continue
+        digest = chart_hash(chart, results[chart.query], formats, plots_version)
+        previous = manifest.get(chart.name, {})
+        if previous.get("hash") == digest and all(
+            os.path.exists(os.path.join(outdir, name)) for name in previous.get("files", [])
+        ):
+            continue
+        pending.append((chart, digest))
+
+    failed = []
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            futures = [
+                (chart, digest, executor.submit(_render_chart, chart, results[chart.query], outdir, formats))
+                for chart, digest in pending
+            ]
+            for chart, digest, future in futures:
+                try:
+                    files = future.result()
+                except Exception as e:
+                    failed.append(chart.name)
+                    manifest.pop(chart.name, None)
+                    log(f"Failed {chart.name}: {e}")
+                else:
+                    manifest[chart.name] = {"hash": digest, "files": files}
+                    log(f"Rendered {chart.name}")
+
+    # The manifest is saved even after a failure, so the next run only
+    # retries the charts that did not render
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    if failed:
+        raise RuntimeError(f"Charts failed to render: {', '.join(failed)}")
+    return manifest
+
+
+if __name__ == "__main__":
+    from src.config import SQLITE_BD_ABSOLUTE_PATH
+    from src.load import get_engine
+    from src.transform import run_queries
+
+    render_report(run_queries(get_engine(SQLITE_BD_ABSOLUTE_PATH), use_cache=True))
@@ -0,0 +1,341 @@
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, read_sql
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.engine.base import Engine
+
+from src.load import read_snapshot, record_table_version
+
+SELLER_SCORECARD_TABLE = "seller_scorecard"
+
+# Base tables the scorecard is computed from.
+SCORECARD_SOURCE_TABLES = (
+    "olist_order_items",
+    "olist_orders",
+    "olist_order_reviews",
+    "olist_customers",
+    "olist_sellers",
+    "olist_geolocation",
+)
+
+# Columns of the scorecard, in table order; read_scorecard_page sorts by any of them.
+SCORECARD_COLUMNS = (
+    "seller_id",
+    "seller_state",
+    "order_count",
+    "item_count",
+    "revenue",
+    "on_time_rate",
+    "avg_review_score",
+    "avg_freight",
+    "avg_distance_km",
+)
+
+EARTH_RADIUS_KM = 6371.0
+
+_SCORECARD_DDL = (
+    f"""CREATE TABLE IF NOT EXISTS {SELLER_SCORECARD_TABLE} (
+        seller_id TEXT PRIMARY KEY,
+        seller_state TEXT,
+        order_count INTEGER NOT NULL,
+        item_count INTEGER NOT NULL,
+        revenue REAL NOT NULL,
+        on_time_rate REAL,
+        avg_review_score REAL,
+        avg_freight REAL,
+        avg_distance_km REAL
+    )""",
+    f"CREATE INDEX IF NOT EXISTS idx_{SELLER_SCORECARD_TABLE}_revenue ON {SELLER_SCORECARD_TABLE}(revenue)",
+    f"CREATE INDEX IF NOT EXISTS idx_{SELLER_SCORECARD_TABLE}_state ON {SELLER_SCORECARD_TABLE}(seller_state)",
+)
+
+# One row per delivered order item, with everything the scorecard needs: the
+# review score of its order and the zip centroids of customer and seller.
+# {seller_filter} restricts it to the sellers of temp._scorecard_sellers; the
+# centroids are only computed for the zips of the selected items, so an
+# incremental refresh doesn't aggregate the whole geolocation table.
+_SCORECARD_ROWS_SQL = """
+WITH items AS (
+    SELECT
+        i.seller_id,
+        s.seller_state,
+        i.order_id,
+        i.price,
+        i.freight_value,
+        DATE(o.order_delivered_customer_date) <= DATE(o.order_estimated_delivery_date) AS on_time,
+        (SELECT AVG(r.review_score) FROM olist_order_reviews r WHERE r.order_id = i.order_id) AS review_score,
+        c.customer_zip_code_prefix AS customer_zip,
+        s.seller_zip_code_prefix AS seller_zip
+    FROM olist_order_items i
+    {seller_filter}
+    INNER JOIN olist_orders o ON o.order_id = i.order_id
+    LEFT JOIN olist_customers c ON c.customer_id = o.customer_id
+    LEFT JOIN olist_sellers s ON s.seller_id = i.seller_id
+    WHERE o.order_status = 'delivered' AND o.order_delivered_customer_date IS NOT NULL
+),
+zips AS (
+    SELECT
+        geolocation_zip_code_prefix AS zip,
+        AVG(geolocation_lat) AS lat,
+        AVG(geolocation_lng) AS lng
+    FROM olist_geolocation
+    WHERE geolocation_zip_code_prefix IN (
+        SELECT customer_zip FROM items UNION SELECT seller_zip FROM items
+    )
+    GROUP BY geolocation_zip_code_prefix
+)
+SELECT
+    t.seller_id,
+    t.seller_state,
+    t.order_id,
+    t.price,
+    t.freight_value,
+    t.on_time,
+    t.review_score,
+    cz.lat AS customer_lat,
+    cz.lng AS customer_lng,
+    sz.lat AS seller_lat,
+    sz.lng AS seller_lng
+FROM items t
+LEFT JOIN zips cz ON cz.zip = t.customer_zip
+LEFT JOIN zips sz ON sz.zip = t.seller_zip
+"""
+
+
+def haversine_km(
+    lat1: np.ndarray, lng1: np.ndarray, lat2: np.ndarray, lng2: np.ndarray
+) -> np.ndarray:
+    """Great-circle distance between two arrays of points, in kilometers.
+
+    Args:
+        lat1 (np.ndarray): Latitudes of the first points, in degrees.
+        lng1 (np.ndarray): Longitudes of the first points, in degrees.
+        lat2 (np.ndarray): Latitudes of the second points, in degrees.
+        lng2 (np.ndarray): Longitudes of the second points, in degrees.
+
+    Returns:
+        np.ndarray: The distances; NaN where any coordinate is missing.
+    """
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(a, dtype=float)) for a in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _mean(sums: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """sums / counts, NaN where the count is zero."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def compute_seller_scorecard(rows: DataFrame) -> DataFrame:
+    """Aggregate delivered order items into one scorecard row per seller.
+
+    Revenue, item count and freight are per item; order count, on-time rate,
+    review score and distance are per (seller, order), so an order with
+    several items of the same seller counts once.
+
+    Args:
+        rows (DataFrame): Delivered order items, as read by refresh_seller_scorecard.
+
+    Returns:
+        DataFrame: The scorecard, with SCORECARD_COLUMNS.
+    """
+    if rows.empty:
+        return DataFrame(columns=list(SCORECARD_COLUMNS))
+
+    seller_codes, sellers = pd.factorize(rows["seller_id"])
+    n = len(sellers)
+    item_count = np.bincount(seller_codes, minlength=n)
+    revenue = np.bincount(seller_codes, weights=rows["price"].fillna(0).to_numpy(dtype=float), minlength=n)
+    freight = rows["freight_value"].to_numpy(dtype=float)
+    has_freight = ~np.isnan(freight)
+    avg_freight = _mean(
+        np.bincount(seller_codes[has_freight], weights=freight[has_freight], minlength=n),
+        np.bincount(seller_codes[has_freight], minlength=n),
+    )
+
+    # Per (seller, order): first item of each pair
+    order_codes = pd.factorize(rows["order_id"])[0]
+    pair = seller_codes.astype(np.int64) * (int(order_codes.max()) + 1) + order_codes
+    _, first = np.unique(pair, return_index=True)
+    orders = rows.iloc[first]
+    order_sellers = seller_codes[first]
+    order_count = np.bincount(order_sellers, minlength=n)
+
+    def per_order_mean(values: np.ndarray) -> np.ndarray:
+        known = ~np.isnan(values)
+        return _mean(
+            np.bincount(order_sellers[known], weights=values[known], minlength=n),
+            np.bincount(order_sellers[known], minlength=n),
+        )
+
+    distance = haversine_km(
+        orders["customer_lat"], orders["customer_lng"], orders["seller_lat"], orders["seller_lng"]
+    )
+    state = rows["seller_state"].to_numpy()[np.unique(seller_codes, return_index=True)[1]]
+    return DataFrame(
+        {
+            "seller_id": sellers,
+            "seller_state": state,
+            "order_count": order_count,
+            "item_count": item_count,
+            "revenue": revenue.round(2),
+            "on_time_rate": per_order_mean(orders["on_time"].to_numpy(dtype=float)),
+            "avg_review_score": per_order_mean(orders["review_score"].to_numpy(dtype=float)),
+            "avg_freight": avg_freight,
+            "avg_distance_km": per_order_mean(distance),
+        }
+    )
+
+
+def refresh_seller_scorecard(database: Engine, seller_ids: Optional[Iterable[str]] = None) -> int:
+    """Recompute the seller scorecard table.
+
+    Every metric of a seller depends only on that seller's items, so a
+    refresh can be limited to the sellers whose orders changed.
+
+    Args:
+        database (Engine): Database connection.
+        seller_ids (Iterable[str], optional): Sellers to recompute, usually
+            from sellers_for_orders. Without them the table is rebuilt.
+
+    Returns:
+        int: Number of scorecard rows written.
+    """
+    seller_ids = None if seller_ids is None else sorted(set(seller_ids))
+    if seller_ids is not None and not seller_ids:
+        return 0
+    with database.begin() as conn:
+        for ddl in _SCORECARD_DDL:
+            conn.execute(text(ddl))
+        if seller_ids is None:
+            rows = read_sql(text(_SCORECARD_ROWS_SQL.format(seller_filter="")), conn)
+            conn.execute(text(f"DELETE FROM {SELLER_SCORECARD_TABLE}"))
+        else:
+            conn.execute(text("DROP TABLE IF EXISTS temp._scorecard_sellers"))
+            conn.execute(text("CREATE TEMP TABLE _scorecard_sellers (seller_id TEXT PRIMARY KEY)"))
+            conn.execute(
+                text("INSERT INTO temp._scorecard_sellers (seller_id) VALUES (:seller_id)"),
+                [{"seller_id": s} for s in seller_ids],
+            )
+            seller_filter = "INNER JOIN temp._scorecard_sellers f ON f.seller_id = i.seller_id"
+            rows = read_sql(text(_SCORECARD_ROWS_SQL.format(seller_filter=seller_filter)), conn)
+            conn.execute(
+                text(
+                    f"DELETE FROM {SELLER_SCORECARD_TABLE} "
+                    "WHERE seller_id IN (SELECT seller_id FROM temp._scorecard_sellers)"
+                )
+            )
+            conn.execute(text("DROP TABLE IF EXISTS temp._scorecard_sellers"))
+        scorecard = compute_seller_scorecard(rows)
+        scorecard.to_sql(SELLER_SCORECARD_TABLE, conn, if_exists="append", index=False)
+        total = conn.execute(text(f"SELECT COUNT(*) FROM {SELLER_SCORECARD_TABLE}")).scalar()
+
+    # The version lets the query cache and the dashboard notice the refresh.
+    # It is hashed from the rows just written, never from a read-back of the
+    # table: an incremental refresh chains its sellers onto the previous version.
+    record_table_version(
+        SELLER_SCORECARD_TABLE,
+        scorecard.sort_values("seller_id", ignore_index=True),
+        database,
+        appended=seller_ids is not None,
+        row_count=total,
+    )
+    return len(scorecard)
+
+
+def ensure_seller_scorecard(database: Engine) -> None:
+    """Build the seller scorecard if it doesn't exist yet.
+
+    Args:
+        database (Engine): Database connection.
+    """
+    if SELLER_SCORECARD_TABLE not in inspect(database).get_table_names():
+        refresh_seller_scorecard(database)
+
+
+def sellers_for_orders(database: Engine, order_ids: Iterable[str]) -> frozenset:
+    """Get the sellers with items in the given orders.
+
+    Args:
+        database (Engine): Database connection.
+        order_ids (Iterable[str]): The order ids.
+
+    Returns:
+        frozenset: The seller ids.
+    """
+    order_ids = list(set(order_ids))
+    if not order_ids or "olist_order_items" not in inspect(database).get_table_names():
+        return frozenset()
+    statement = text(
+        "SELECT DISTINCT seller_id FROM olist_order_items WHERE order_id IN :order_ids"
+    ).bindparams(bindparam("order_ids", expanding=True))
+    with database.connect() as conn:
+        return frozenset(row[0] for row in conn.execute(statement, {"order_ids": order_ids}))
+
+
+def read_seller_states(database: Engine) -> List[str]:
+    """Get the states of the sellers in the scorecard, for the state filter.
+
+    Args:
+        database (Engine): Database connection.
+
+    Returns:
+        List[str]: The distinct seller states, sorted.
+    """
+    statement = text(
+        f"SELECT DISTINCT seller_state FROM {SELLER_SCORECARD_TABLE} "
+        "WHERE seller_state IS NOT NULL ORDER BY seller_state"
+    )
+    with database.connect() as conn:
+        return [row[0] for row in conn.execute(statement)]
+
+
+def read_scorecard_page(
+    database: Engine,
+    page: int = 0,
+    page_size: int = 25,
+    sort_by: str = "revenue",
+    descending: bool = True,
+    state: Optional[str] = None,
+) -> Tuple[DataFrame, int]:
+    """Read one page of the seller scorecard, sorted in SQL.
+
+    Args:
+        database (Engine): Database connection.
+        page (int): Page number, from 0.
+        page_size (int): Rows per page.
+        sort_by (str): Column of SCORECARD_COLUMNS to sort by.
+        descending (bool): Whether the largest values come first.
+        state (str, optional): Only sellers from this state.
+
+    Raises:
+        ValueError: If sort_by is not a scorecard column.
+
+    Returns:
+        Tuple[DataFrame, int]: The page and the total number of sellers.
+    """
+    if sort_by not in SCORECARD_COLUMNS:
+        raise ValueError(f"Unknown scorecard column '{sort_by}'")
+    where = "WHERE seller_state = :state" if state else ""
+    params = {"state": state, "limit": page_size, "offset": page * page_size}
+    # NULLs (e.g. sellers without reviews) always go last; seller_id breaks
+    # ties so pages never overlap
+    order = f"{sort_by} IS NULL, {sort_by} {'DESC' if descending else 'ASC'}, seller_id"
+    # The count and the page come from the same snapshot, even if a refresh
+    # is published in between
+    with read_snapshot(database) as conn:
+        total = conn.execute(
+            text(f"SELECT COUNT(*) FROM {SELLER_SCORECARD_TABLE} {where}"), params
+        ).scalar()
+        rows = read_sql(
+            text(
+                f"SELECT * FROM {SELLER_SCORECARD_TABLE} {where} "
+                f"ORDER BY {order} LIMIT :limit OFFSET :offset"
+            ),
+            conn,
+            params=params,
+        )
+    return rows, total
@@ -0,0 +1,353 @@
+import argparse
+import asyncio
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import pyarrow as pa
+from pandas import DataFrame
+from sqlalchemy.exc import OperationalError
+
+from src.config import SQLITE_BD_ABSOLUTE_PATH
+from src.load import get_engine
+from src.transform import get_query_functions, get_query_tables, query_version, run_query
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Results kept in memory, one per query, mode and data version
+DEFAULT_CACHE_SIZE = 64
+
+FORMATS = {
+    "json": "application/json; charset=utf-8",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+_REASONS = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+# Longest request head accepted, the service only serves small GET requests
+_MAX_HEAD_BYTES = 16 * 1024
+
+
+def encode_result(result: DataFrame, fmt: str) -> bytes:
+    """Serialize a query result.
+
+    Args:
+        result (DataFrame): The query result.
+        fmt (str): "json" (records, like the exported query_results files) or
+            "arrow" (an Arrow IPC stream).
+
+    Returns:
+        bytes: The response body.
+    """
+    if fmt == "json":
+        return result.to_json(orient="records").encode()
+    table = pa.Table.from_pandas(result, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as If-None-Match requires
+    return "*" in candidates or any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates)
+
+
+class QueryService:
+    """Serve the results of src.transform over HTTP.
+
+    Queries run on a thread pool over the shared read-only engine of the
+    database, so the event loop keeps answering while they run and the file is
+    never written. Every result is versioned with query_version (query code and
+    table versions): it is the ETag of the response, so pollers that send it
+    back in If-None-Match get a 304 without a body, and the key of an in-memory
+    LRU cache, so a result is computed once per data version no matter how many
+    clients ask for it, even at the same time.
+
+    Args:
+        db_path (str): Path of the SQLite database.
+        incremental (bool): Whether to build the queries from the summary
+            tables, as the pipeline does (see run_query).
+        approximate (bool): Whether to build the queries that have an
+            approximate variant from the sketches (see run_query).
+        cache_size (int): Maximum number of results kept in memory.
+        workers (int): Maximum number of queries computed at the same time.
+    """
+
+    def __init__(
+        self,
+        db_path: str = SQLITE_BD_ABSOLUTE_PATH,
+        incremental: bool = True,
+        approximate: bool = False,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        workers: int = 4,
+    ):
+        self.engine = get_engine(db_path, read_only=True)
+        self.incremental = incremental
+        self.approximate = approximate
+        self.cache_size = cache_size
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0}
+        self._cache: "OrderedDict[Tuple[str, str], DataFrame]" = OrderedDict()
+        self._pending: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query-service")
+
+    def _cache_get(self, key: Tuple[str, str]) -> Optional[DataFrame]:
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+            return result
+
+    def _cache_put(self, key: Tuple[str, str], result: DataFrame) -> None:
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def version(self, query_name: str) -> Optional[str]:
+        """Get the current version of a query result, None if it can't be versioned."""
+        return await self._run(query_version, query_name, self.engine, self.incremental, self.approximate)
+
+    async def result(self, query_name: str, version: Optional[str]) -> DataFrame:
+        """Get a query result, from the LRU cache when it holds this version.
+
+        Args:
+            query_name (str): The name of the query.
+            version (str, optional): Its version, from `version`. Without one
+                the result is always computed and never cached.
+
+        Returns:
+            DataFrame: The query result.
+        """
+        if version is None:
+            self.stats["misses"] += 1
+            return await self._compute(query_name)
+        key = (query_name, version)
+        cached = self._cache_get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached
+
+        # Concurrent requests for the same version wait for the first one
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.stats["hits"] += 1
+            return await asyncio.shield(pending)
+        self.stats["misses"] += 1
+        pending = asyncio.get_running_loop().create_future()
+        self._pending[key] = pending
+        try:
+            result = await self._compute(query_name)
+        except Exception as error:
+            pending.set_exception(error)
+            # Retrieved here so an error nobody else awaited isn't logged
+            pending.exception()
+            raise
+        except BaseException:
+            # Cancelled (e.g. the first client went away): the other waiters
+            # get the cancellation instead of hanging on an unresolved future
+            pending.cancel()
+            raise
+        finally:
+            del self._pending[key]
+        self._cache_put(key, result)
+        pending.set_result(result)
+        return result
+
+    async def _compute(self, query_name: str) -> DataFrame:
+        query_result = await self._run(
+            lambda: run_query(
+                query_name, self.engine, incremental=self.incremental, approximate=self.approximate
+            )
+        )
+        return query_result.result
+
+    async def handle_request(
+        self, method: str, target: str, headers: Dict[str, str]
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """Answer one request.
+
+        Routes:
+            GET /health: {"status": "ok"}.
+            GET /queries: the queries and the tables each one reads.
+            GET /queries/<name>?format=json|arrow: the query result.
+
+        Args:
+            method (str): The HTTP method.
+            target (str): The request target (path and query string).
+            headers (Dict[str, str]): Request headers, with lowercase names.
+
+        Returns:
+            Tuple[int, Dict[str, str], bytes]: Status, response headers and body.
+        """
+        if method not in ("GET", "HEAD"):
+            return _error(405, f"Method {method} not allowed", {"Allow": "GET, HEAD"})
+        url = urlsplit(target)
+        path = unquote(url.path).rstrip("/")
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+
+        if path == "/health":
+            return _json(200, {"status": "ok"})
+        if path == "/queries":
+            return _json(
+                200,
+                {
+                    name: list(get_query_tables(name, self.incremental, self.approximate))
+                    for name in sorted(get_query_functions())
+                },
+            )
+        if not path.startswith("/queries/"):
+            return _error(404, f"No route for {path or '/'}")
+
+        query_name = path[len("/queries/"):]
+        fmt = params.get("format", "json")
+        if fmt not in FORMATS:
+            return _error(400, f"Unknown format '{fmt}', use one of {sorted(FORMATS)}")
+        if query_name not in get_query_functions():
+            return _error(404, f"Unknown query '{query_name}'")
+
+        try:
+            version = await self.version(query_name)
+            response_headers = {"Cache-Control": "no-cache"}
+            if version is not None:
+                etag = f'"{version[:32]}-{fmt}"'
+                response_headers["ETag"] = etag
+                if _etag_matches(headers.get("if-none-match"), etag):
+                    self.stats["not_modified"] += 1
+                    return 304, response_headers, b""
+            result = await self.result(query_name, version)
+        except OperationalError as error:
+            # e.g. the summary tables were never built: the service can't write them
+            return _error(503, f"Query '{query_name}' can't run on this database: {error.orig}")
+        body = await self._run(encode_result, result, fmt)
+        response_headers["Content-Type"] = FORMATS[fmt]
+        return 200, response_headers, body
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve the requests of one connection, keeping it open between them."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await _write(writer, *_error(400, "Request head too large"), close=True)
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ")
+                except ValueError:
+                    await _write(writer, *_error(400, "Malformed request line"), close=True)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                # Bodies are ignored, but have to be skipped to read the next request
+                length = int(headers.get("content-length", 0) or 0)
+                if length:
+                    await reader.readexactly(length)
+
+                try:
+                    status, response_headers, body = await self.handle_request(method, target, headers)
+                except Exception as error:
+                    status, response_headers, body = _error(500, f"{type(error).__name__}: {error}")
+                close = headers.get("connection", "").lower() == "close" or version == "HTTP/1.0"
+                await _write(writer, status, response_headers, body, close=close, head_only=method == "HEAD")
+                if close:
+                    break
+        finally:
+            writer.close()
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        """Start listening; port 0 picks a free port (see server.sockets)."""
+        return await asyncio.start_server(self.handle_connection, host, port, limit=_MAX_HEAD_BYTES)
+
+    async def serve_forever(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
+        """Start listening and serve until cancelled."""
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self) -> None:
+        """Stop the query threads."""
+        self._executor.shutdown(wait=True)
+
+
+def _json(status: int, payload, headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+    return status, {**(headers or {}), "Content-Type": FORMATS["json"]}, json.dumps(payload).encode()
+
+
+def _error(status: int, message: str, headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+    return _json(status, {"error": message}, headers)
+
+
+async def _write(
+    writer: asyncio.StreamWriter,
+    status: int,
+    headers: Dict[str, str],
+    body: bytes,
+    close: bool = False,
+    head_only: bool = False,
+) -> None:
+    headers = {**headers, "Content-Length": str(len(body))}
+    if close:
+        headers["Connection"] = "close"
+    head = f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+    head += "".join(f"{name}: {value}\r\n" for name, value in headers.items()) + "\r\n"
+    writer.write(head.encode("latin-1") + (b"" if head_only or status == 304 else body))
+    await writer.drain()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Serve the query results over HTTP, read-only.")
+    parser.add_argument("--db", default=SQLITE_BD_ABSOLUTE_PATH, help="Path of the SQLite database.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--exact",
+        action="store_true",
+        help="Compute every query from the base tables instead of the summary tables.",
+    )
+    parser.add_argument(
+        "--approximate", action="store_true", help="Use the sketches for the queries that have them."
+    )
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE)
+    args = parser.parse_args(argv)
+
+    service = QueryService(
+        args.db, incremental=not args.exact, approximate=args.approximate, cache_size=args.cache_size
+    )
+    print(f"Serving {args.db} on http://{args.host}:{args.port}/queries")
+    try:
+        asyncio.run(service.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+import zlib
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, read_sql
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.engine.base import Engine
+
+# The table names live in src.load, which drops the sketches when their base
+# tables are replaced; they are rebuilt by ensure_category_sketches.
+from src.load import (  # noqa: F401
+    SKETCH_ORDERS_TABLE,
+    SKETCH_REVENUE_TABLE,
+    SKETCH_SOURCE_TABLES,
+    SKETCH_TABLES,
+    record_table_version,
+)
+from src.partitions import partition_range_join
+
+# 2^12 registers per HyperLogLog: relative standard error 1.04 / sqrt(4096) ~ 1.6%.
+HLL_PRECISION = 12
+
+# Categories kept in the top-K summary of each partition.
+TOPK_CAPACITY = 20
+
+_SKETCH_TABLES_DDL = (
+    f"""CREATE TABLE IF NOT EXISTS {SKETCH_ORDERS_TABLE} (
+        year TEXT NOT NULL,
+        month_no TEXT NOT NULL,
+        category TEXT NOT NULL,
+        registers BLOB NOT NULL,
+        PRIMARY KEY (year, month_no, category)
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS {SKETCH_REVENUE_TABLE} (
+        year TEXT NOT NULL,
+        month_no TEXT NOT NULL,
+        category TEXT NOT NULL,
+        revenue REAL NOT NULL,
+        threshold REAL NOT NULL,
+        PRIMARY KEY (year, month_no, category)
+    )""",
+)
+
+# Revenue of every (order, category) pair with the fan-out of
+# top_10_revenue_categories.sql: every payment once per item of the category.
+# Partitioned by delivery month like agg_revenue_month; {range_join} limits it
+# to some delivery months (src.partitions.partition_range_join).
+_SKETCH_ROWS_SQL = """
+SELECT
+    STRFTIME('%Y', o.order_delivered_customer_date) AS year,
+    STRFTIME('%m', o.order_delivered_customer_date) AS month_no,
+    t.product_category_name_english AS category,
+    o.order_id,
+    SUM(op.payment_value) AS revenue
+FROM olist_orders o
+{range_join}
+INNER JOIN olist_order_payments op ON o.order_id = op.order_id
+INNER JOIN olist_order_items oi ON o.order_id = oi.order_id
+INNER JOIN olist_products p ON oi.product_id = p.product_id
+INNER JOIN product_category_name_translation t ON p.product_category_name = t.product_category_name
+WHERE o.order_status = 'delivered'
+    AND o.order_delivered_customer_date IS NOT NULL
+    AND t.product_category_name_english IS NOT NULL
+GROUP BY 1, 2, 3, 4
+"""
+
+
+def hash64(values: pd.Series) -> np.ndarray:
+    """Hash values to 64 bits, the same across runs and processes.
+
+    Args:
+        values (pd.Series): The values, e.g. order ids.
+
+    Returns:
+        np.ndarray: One uint64 hash per value.
+    """
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Number of significant bits of each uint64 (0 for 0).
+
+    The halves are converted separately so every float is exact.
+    """
+    high = np.frexp((values >> np.uint64(32)).astype(np.float64))[1]
+    low = np.frexp((values & np.uint64(0xFFFFFFFF)).astype(np.float64))[1]
+    return np.where(high > 0, high + 32, low)
+
+
+def hll_registers(
+    hashes: np.ndarray, groups: np.ndarray, n_groups: int, precision: int = HLL_PRECISION
+) -> np.ndarray:
+    """Build one HyperLogLog sketch per group.
+
+    The first `precision` bits of a hash pick a register, which keeps the
+    maximum position of the first 1 bit in the rest of the hash.
+
+    Args:
+        hashes (np.ndarray): uint64 hashes, from hash64.
+        groups (np.ndarray): Group of each hash, integers in [0, n_groups).
+        n_groups (int): Number of groups.
+        precision (int): log2 of the number of registers.
+
+    Returns:
+        np.ndarray: uint8 registers, shape (n_groups, 2**precision).
+    """
+    m = 1 << precision
+    index = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - precision)) - 1)
+    rank = (64 - precision + 1 - _bit_length(rest)).astype(np.uint8)
+    registers = np.zeros(n_groups * m, dtype=np.uint8)
+    np.maximum.at(registers, np.asarray(groups, dtype=np.int64) * m + index, rank)
+    return registers.reshape(n_groups, m)
+
+
+def hll_estimate(registers: np.ndarray) -> np.ndarray:
+    """Estimate the distinct count of HyperLogLog sketches.
+
+    Small cardinalities, with empty registers left, use linear counting, as in
+    the original HyperLogLog paper. 64-bit hashes need no large range
+    correction.
+
+    Args:
+        registers (np.ndarray): Registers, shape (n, m) or (m,).
+
+    Returns:
+        np.ndarray: The estimates, shape (n,) (a scalar array for one sketch).
+    """
+    registers = np.asarray(registers)
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.power(2.0, -registers.astype(np.float64)).sum(axis=-1)
+    zeros = (registers == 0).sum(axis=-1)
+    with np.errstate(divide="ignore"):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+def hll_to_bytes(registers: np.ndarray) -> bytes:
+    """Serialize a sketch; mostly empty registers compress to a few bytes."""
+    return zlib.compress(np.ascontiguousarray(registers, dtype=np.uint8).tobytes())
+
+
+def hll_from_bytes(data: bytes) -> np.ndarray:
+    """Deserialize a sketch written by hll_to_bytes."""
+    return np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+
+
+def top_k_summary(weights: DataFrame, capacity: int = TOPK_CAPACITY) -> DataFrame:
+    """Keep the `capacity` heaviest items of every partition.
+
+    Every partition also gets its threshold: the weight of its heaviest
+    dropped item (0 if none was dropped), which bounds the weight any missing
+    item can have there. This is the most accurate summary Space-Saving can
+    keep with `capacity` counters.
+
+    Args:
+        weights (DataFrame): partition, item and weight, one row per pair.
+        capacity (int): Items kept per partition.
+
+    Returns:
+        DataFrame: partition, item, weight and threshold of the kept items.
+    """
+    ranked = weights.sort_values(["partition", "weight", "item"], ascending=[True, False, True])
+    position = ranked.groupby("partition").cumcount()
+    threshold = ranked[position == capacity].set_index("partition")["weight"]
+    kept = ranked[position < capacity]
+    return kept.assign(
+        threshold=kept["partition"].map(threshold).fillna(0.0).to_numpy()
+    ).reset_index(drop=True)
+
+
+def merge_top_k(summary: DataFrame) -> DataFrame:
+    """Merge per-partition top-K summaries, Space-Saving style.
+
+    An item missing from a partition is counted with that partition's
+    threshold, so the estimate never falls below the true total and exceeds it
+    by at most the error.
+
+    Args:
+        summary (DataFrame): partition, item, weight and threshold, as from
+            top_k_summary.
+
+    Returns:
+        DataFrame: item, estimate and error, heaviest first.
+    """
+    thresholds = summary.drop_duplicates("partition")["threshold"].sum()
+    merged = summary.assign(excess=summary["weight"] - summary["threshold"]).groupby("item").agg(
+        excess=("excess", "sum"), covered=("threshold", "sum")
+    )
+    result = DataFrame(
+        {
+            "item": merged.index,
+            "estimate": thresholds + merged["excess"].to_numpy(),
+            "error": thresholds - merged["covered"].to_numpy(),
+        }
+    )
+    return result.sort_values(["estimate", "item"], ascending=[False, True]).reset_index(drop=True)
+
+
+def refresh_category_sketches(database: Engine, months: Optional[Iterable[str]] = None) -> None:
+    """Recompute the category sketches, fully or for some delivery months.
+
+    Every (month, category) gets a HyperLogLog of its orders, and every month
+    a top-K summary of the category revenue.
+
+    Args:
+        database (Engine): Database connection.
+        months (Iterable[str], optional): "YYYY-MM" delivery months to
+            recompute, e.g. AggregatePartitions.revenue_months. Without them
+            the sketches are rebuilt.
+    """
+    with database.begin() as conn:
+        for ddl in _SKETCH_TABLES_DDL:
+            conn.execute(text(ddl))
+        if months is None:
+            rows = read_sql(text(_SKETCH_ROWS_SQL.format(range_join="")), conn)
+            for table in SKETCH_TABLES:
+                conn.execute(text(f"DELETE FROM {table}"))
+        else:
+            months = sorted(set(months))
+            if not months:
+                return
+            with partition_range_join(conn, months, "order_delivered_customer_date") as range_join:
+                rows = read_sql(text(_SKETCH_ROWS_SQL.format(range_join=range_join)), conn)
+            for table in SKETCH_TABLES:
+                conn.execute(
+                    text(f"DELETE FROM {table} WHERE year || '-' || month_no IN :months").bindparams(
+                        bindparam("months", expanding=True)
+                    ),
+                    {"months": months},
+                )
+
+        partition = rows["year"] + "-" + rows["month_no"]
+        codes, keys = pd.factorize(partition + "|" + rows["category"])
+        registers = hll_registers(hash64(rows["order_id"]), codes, len(keys))
+        first = np.unique(codes, return_index=True)[1]
+        sketches = rows.iloc[first][["year", "month_no", "category"]].assign(
+            registers=[hll_to_bytes(r) for r in registers]
+        )
+        sketches.to_sql(SKETCH_ORDERS_TABLE, conn, if_exists="append", index=False)
+
+        weights = (
+            rows.assign(partition=partition)
+            .groupby(["partition", "category"], as_index=False)["revenue"]
+            .sum()
+            .rename(columns={"category": "item", "revenue": "weight"})
+        )
+        summary = top_k_summary(weights)
+        DataFrame(
+            {
+                "year": summary["partition"].str[:4],
+                "month_no": summary["partition"].str[5:],
+                "category": summary["item"],
+                "revenue": summary["weight"],
+                "threshold": summary["threshold"],
+            }
+        ).to_sql(SKETCH_REVENUE_TABLE, conn, if_exists="append", index=False)
+
+    # The HyperLogLog blobs are versioned through their hex form
+    record_table_version(
+        SKETCH_ORDERS_TABLE,
+        read_sql(
+            f"SELECT year, month_no, category, hex(registers) AS registers FROM {SKETCH_ORDERS_TABLE} "
+            "ORDER BY year, month_no, category",
+            database,
+        ),
+        database,
+    )
+    record_table_version(
+        SKETCH_REVENUE_TABLE,
+        read_sql(f"SELECT * FROM {SKETCH_REVENUE_TABLE} ORDER BY year, month_no, category", database),
+        database,
+    )
+
+
+def ensure_category_sketches(database: Engine) -> None:
+    """Build the category sketches if they don't exist yet.
+
+    Args:
+        database (Engine): Database connection.
+    """
+    existing = set(inspect(database).get_table_names())
+    if any(table not in existing for table in SKETCH_TABLES):
+        refresh_category_sketches(database)
+
+
+def top_revenue_categories_from_sketches(database: Engine, k: int = 10) -> DataFrame:
+    """Approximate top_10_revenue_categories from the category sketches.
+
+    Revenue comes from the merged top-K summaries (never below the true
+    revenue, and above it by at most Revenue_error) and Num_order from the
+    merged HyperLogLogs (about 1.6% standard error).
+
+    Args:
+        database (Engine): Database connection.
+        k (int): Number of categories.
+
+    Returns:
+        DataFrame: Category, Num_order, Revenue and Revenue_error, by revenue.
+    """
+    ensure_category_sketches(database)
+    summary = read_sql(
+        f"SELECT year || '-' || month_no AS partition, category AS item, revenue AS weight, threshold "
+        f"FROM {SKETCH_REVENUE_TABLE}",
+        database,
+    )
+    top = merge_top_k(summary).head(k)
+    sketches = read_sql(
+        text(f"SELECT category, registers FROM {SKETCH_ORDERS_TABLE} WHERE category IN :categories").bindparams(
+            bindparam("categories", expanding=True)
+        ),
+        database,
+        params={"categories": top["item"].tolist() or [""]},
+    )
+    # Union of the monthly sketches of each category: register-wise maximum
+    registers = np.stack([hll_from_bytes(b) for b in sketches["registers"]]) if len(sketches) else None
+    num_order = {}
+    for category, positions in sketches.groupby("category").indices.items():
+        num_order[category] = int(round(float(hll_estimate(registers[positions].max(axis=0)))))
+    return DataFrame(
+        {
+            "Category": top["item"],
+            "Num_order": top["item"].map(num_order).fillna(0).astype("int64"),
+            "Revenue": top["estimate"],
+            "Revenue_error": top["error"],
+        }
+    )
@@ -1,16 +1,59 @@
+import hashlib
+import inspect
+import os
+import re
+import sys
 from collections import namedtuple
 from enum import Enum
-from typing import Callable, Dict, List
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
 
 import pandas as pd
 from pandas import DataFrame, read_sql
 from sqlalchemy import text
 from sqlalchemy.engine.base import Engine
-
+from sqlalchemy.sql.elements import TextClause
+
+from src import hash_join, polars_backend
+from src.aggregates import (
+    AGG_DELIVERY_MONTH_TABLE,
+    AGG_ORDERS_DAY_TABLE,
+    AGG_REVENUE_MONTH_TABLE,
+    ensure_aggregates,
+    orders_per_day_and_holidays_from_aggregates,
+    real_vs_estimated_delivered_time_from_aggregates,
+    revenue_by_month_year_from_aggregates,
+)
+from src.cache import (
+    get_table_versions,
+    query_cache_key,
+    read_cached_result,
+    write_cached_result,
+)
 from src.config import QUERIES_ROOT_PATH
+from src.customers import (
+    CUSTOMER_SOURCE_TABLES,
+    customer_cohorts,
+    read_customer_orders,
+    rfm_scores,
+    rfm_segments,
+)
+from src.delivery import (
+    AGG_DELIVERY_HIST_TABLE,
+    DELIVERY_HIST_SOURCE_TABLES,
+    compute_delivery_histograms,
+    delivery_percentiles,
+    delivery_percentiles_from_aggregates,
+    lateness_histogram,
+    lateness_histogram_from_aggregates,
+)
+from src.load import REVIEWS_FTS_TABLE, read_snapshot
+from src.partitions import read_orders
+from src.sketches import SKETCH_TABLES, top_revenue_categories_from_sketches
 
 QueryResult = namedtuple("QueryResult", ["query", "result"])
 
+PreparedQuery = namedtuple("PreparedQuery", ["name", "sql", "tables", "params"])
+
 
 class QueryEnum(Enum):
     """This class enumerates all the queries that are available"""
@@ -24,21 +67,250 @@ class QueryEnum(Enum):
     REAL_VS_ESTIMATED_DELIVERED_TIME = "real_vs_estimated_delivered_time"
     ORDERS_PER_DAY_AND_HOLIDAYS_2017 = "orders_per_day_and_holidays_2017"
     GET_FREIGHT_VALUE_WEIGHT_RELATIONSHIP = "get_freight_value_weight_relationship"
+    CUSTOMER_COHORTS = "customer_cohorts"
+    CUSTOMER_RFM_SEGMENTS = "customer_rfm_segments"
+    DELIVERY_PERCENTILES = "delivery_percentiles"
+    DELIVERY_LATENESS_HISTOGRAM = "delivery_lateness_histogram"
+
+
+# Tables read by the queries implemented in pandas instead of a .sql file.
+_PANDAS_QUERY_TABLES: Dict[str, Tuple[str, ...]] = {
+    QueryEnum.ORDERS_PER_DAY_AND_HOLIDAYS_2017.value: ("olist_orders", "public_holidays"),
+    QueryEnum.GET_FREIGHT_VALUE_WEIGHT_RELATIONSHIP.value: (
+        "olist_order_items",
+        "olist_orders",
+        "olist_products",
+    ),
+    QueryEnum.CUSTOMER_COHORTS.value: CUSTOMER_SOURCE_TABLES,
+    QueryEnum.CUSTOMER_RFM_SEGMENTS.value: CUSTOMER_SOURCE_TABLES,
+    QueryEnum.DELIVERY_PERCENTILES.value: DELIVERY_HIST_SOURCE_TABLES,
+    QueryEnum.DELIVERY_LATENESS_HISTOGRAM.value: DELIVERY_HIST_SOURCE_TABLES,
+}
+
+# Queries that can be built from the summary tables of src.aggregates, with
+# the function that pivots them and the tables it reads.
+_INCREMENTAL_QUERIES: Dict[str, Tuple[Callable[[Engine], DataFrame], Tuple[str, ...]]] = {
+    QueryEnum.REVENUE_BY_MONTH_YEAR.value: (
+        revenue_by_month_year_from_aggregates,
+        (AGG_REVENUE_MONTH_TABLE,),
+    ),
+    QueryEnum.REAL_VS_ESTIMATED_DELIVERED_TIME.value: (
+        real_vs_estimated_delivered_time_from_aggregates,
+        (AGG_DELIVERY_MONTH_TABLE,),
+    ),
+    QueryEnum.ORDERS_PER_DAY_AND_HOLIDAYS_2017.value: (
+        orders_per_day_and_holidays_from_aggregates,
+        (AGG_ORDERS_DAY_TABLE, "public_holidays"),
+    ),
+    QueryEnum.DELIVERY_PERCENTILES.value: (
+        delivery_percentiles_from_aggregates,
+        (AGG_DELIVERY_HIST_TABLE,),
+    ),
+    QueryEnum.DELIVERY_LATENESS_HISTOGRAM.value: (
+        lateness_histogram_from_aggregates,
+        (AGG_DELIVERY_HIST_TABLE,),
+    ),
+}
+
+# Execution backends of the queries computed from the base tables. Each one
+# maps the queries it implements to the function and the tables it reads; the
+# rest run on the default pandas/SQL functions.
+BACKENDS = ("pandas", "polars", "partitioned")
+
+_BACKEND_QUERIES: Dict[str, Dict[str, Tuple[Callable[[Engine], DataFrame], Tuple[str, ...]]]] = {
+    "pandas": {},
+    "polars": {
+        QueryEnum.GET_FREIGHT_VALUE_WEIGHT_RELATIONSHIP.value: (
+            polars_backend.freight_value_weight_relationship,
+            polars_backend.FREIGHT_TABLES,
+        ),
+        QueryEnum.ORDERS_PER_DAY_AND_HOLIDAYS_2017.value: (
+            polars_backend.orders_per_day_and_holidays_2017,
+            polars_backend.ORDERS_PER_DAY_TABLES,
+        ),
+    },
+    "partitioned": {
+        QueryEnum.GET_FREIGHT_VALUE_WEIGHT_RELATIONSHIP.value: (
+            hash_join.freight_value_weight_relationship,
+            hash_join.FREIGHT_TABLES,
+        ),
+    },
+}
+
+# Queries with an approximate variant built from the sketches of src.sketches,
+# with the function that builds it and the tables it reads.
+_APPROXIMATE_QUERIES: Dict[str, Tuple[Callable[[Engine], DataFrame], Tuple[str, ...]]] = {
+    QueryEnum.TOP_10_REVENUE_CATEGORIES.value: (top_revenue_categories_from_sketches, SKETCH_TABLES),
+}
+
+_TABLE_REFERENCE_RE = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)", re.IGNORECASE)
+_CTE_NAME_RE = re.compile(r"\b([A-Za-z_]\w*)\s+AS\s*\(", re.IGNORECASE)
+_SQL_COMMENT_RE = re.compile(r"--[^\n]*")
+# Same pattern SQLAlchemy uses to find ":name" bind parameters in text().
+_BIND_PARAM_RE = re.compile(r"(?<![:\w\x5c]):(\w+)(?!:)", re.UNICODE)
+
+
+def _prepare_query(query_name: str, sql_file: str) -> PreparedQuery:
+    """Compile a query file and extract its metadata.
+
+    Args:
+        query_name (str): The name of the query (file name without extension).
+        sql_file (str): The SQL text of the file.
+
+    Returns:
+        PreparedQuery: The compiled statement, the tables it reads and the
+        names of its bind parameters.
+    """
+    code = _SQL_COMMENT_RE.sub("", sql_file)
+    ctes = {name.lower() for name in _CTE_NAME_RE.findall(code)}
+    tables = []
+    for table in _TABLE_REFERENCE_RE.findall(code):
+        if table.lower() not in ctes and table not in tables:
+            tables.append(table)
+    params = tuple(dict.fromkeys(_BIND_PARAM_RE.findall(code)))
+    return PreparedQuery(
+        name=query_name, sql=text(sql_file), tables=tuple(tables), params=params
+    )
+
+
+def _discover_queries(queries_root_path: str) -> Dict[str, PreparedQuery]:
+    """Read and compile every .sql file in the queries folder.
+
+    Args:
+        queries_root_path (str): Folder with the .sql files.
+
+    Returns:
+        Dict[str, PreparedQuery]: Prepared queries by query name.
+    """
+    registry = {}
+    if not os.path.isdir(queries_root_path):
+        return registry
+    for file_name in sorted(os.listdir(queries_root_path)):
+        query_name, extension = os.path.splitext(file_name)
+        if extension != ".sql":
+            continue
+        with open(os.path.join(queries_root_path, file_name), "r") as f:
+            registry[query_name] = _prepare_query(query_name, f.read())
+    return registry
+
+
+# Queries are read from disk once, when the module is imported.
+_QUERY_REGISTRY: Dict[str, PreparedQuery] = _discover_queries(QUERIES_ROOT_PATH)
+
+# Result columns of each query, recorded the first time it runs.
+_QUERY_SCHEMAS: Dict[str, Tuple[str, ...]] = {}
+
+
+def get_prepared_query(query_name: str) -> PreparedQuery:
+    """Get a query from the registry.
+
+    Args:
+        query_name (str): The name of the query.
+
+    Raises:
+        KeyError: If there is no queries/{query_name}.sql file.
+
+    Returns:
+        PreparedQuery: The prepared query.
+    """
+    try:
+        return _QUERY_REGISTRY[query_name]
+    except KeyError:
+        raise KeyError(f"Unknown query '{query_name}'") from None
+
+
+def get_sql_query_names() -> List[str]:
+    """Get the names of all the queries found in the queries folder.
+
+    Returns:
+        List[str]: The query names.
+    """
+    return list(_QUERY_REGISTRY)
+
+
+def _backend_queries(backend: str) -> Dict[str, Tuple[Callable[[Engine], DataFrame], Tuple[str, ...]]]:
+    if backend not in _BACKEND_QUERIES:
+        raise ValueError(f"Unknown backend '{backend}', use one of {BACKENDS}")
+    return _BACKEND_QUERIES[backend]
+
+
+def get_query_tables(
+    query_name: str, incremental: bool = False, approximate: bool = False, backend: str = "pandas"
+) -> Tuple[str, ...]:
+    """Get the tables read by a query, either a .sql file or a pandas query.
+
+    Args:
+        query_name (str): The name of the query.
+        incremental (bool): Whether the query is built from the summary tables
+            of src.aggregates (see run_query).
+        approximate (bool): Whether the query is built from the sketches of
+            src.sketches (see run_query).
+        backend (str): The execution backend (see run_query).
+
+    Returns:
+        Tuple[str, ...]: The table names.
+    """
+    if approximate and query_name in _APPROXIMATE_QUERIES:
+        return _APPROXIMATE_QUERIES[query_name][1]
+    if incremental and query_name in _INCREMENTAL_QUERIES:
+        return _INCREMENTAL_QUERIES[query_name][1]
+    if query_name in _backend_queries(backend):
+        return _backend_queries(backend)[query_name][1]
+    if query_name in _PANDAS_QUERY_TABLES:
+        return _PANDAS_QUERY_TABLES[query_name]
+    return get_prepared_query(query_name).tables
+
+
+def get_query_schema(query_name: str, database: Engine) -> Tuple[str, ...]:
+    """Get the result columns of a query without fetching any row.
+
+    Args:
+        query_name (str): The name of the query.
+        database (Engine): Database connection.
+
+    Returns:
+        Tuple[str, ...]: The column names of the result.
+    """
+    if query_name not in _QUERY_SCHEMAS:
+        query = get_prepared_query(query_name)
+        inner = query.sql.text.strip().rstrip(";")
+        probe = text(f"SELECT * FROM ({inner}) LIMIT 0")
+        with database.connect() as conn:
+            columns = conn.execute(probe, {p: None for p in query.params}).keys()
+        _QUERY_SCHEMAS[query_name] = tuple(columns)
+    return _QUERY_SCHEMAS[query_name]
 
 
-def read_query(query_name: str) -> str:
-    """Read the query from the file.
+def read_query(query_name: str) -> TextClause:
+    """Read the query from the registry.
 
     Args:
         query_name (str): The name of the file.
 
     Returns:
-        str: The query.
+        TextClause: The query.
     """
-    with open(f"{QUERIES_ROOT_PATH}/{query_name}.sql", "r") as f:
-        sql_file = f.read()
-        sql = text(sql_file)
-    return sql
+    return get_prepared_query(query_name).sql
+
+
+def run_sql_query(
+    query_name: str, database: Engine, params: Optional[Mapping[str, object]] = None
+) -> QueryResult:
+    """Run a registered .sql query.
+
+    Args:
+        query_name (str): The name of the query.
+        database (Engine): Database connection.
+        params (Mapping[str, object], optional): Values for the query's bind
+            parameters.
+
+    Returns:
+        QueryResult: The query name and its result.
+    """
+    query = get_prepared_query(query_name)
+    result = read_sql(query.sql, database, params=dict(params or {}))
+    _QUERY_SCHEMAS.setdefault(query_name, tuple(result.columns))
+    return QueryResult(query=query_name, result=result)
 
 
 def query_delivery_date_difference(database: Engine) -> QueryResult:
@@ -50,9 +322,7 @@ def query_delivery_date_difference(database: Engine) -> QueryResult:
     Returns:
         Query: The query for delivery date difference.
     """
-    query_name = QueryEnum.DELIVERY_DATE_DIFFERECE.value
-    query = read_query(QueryEnum.DELIVERY_DATE_DIFFERECE.value)
-    return QueryResult(query=query_name, result=read_sql(query, database))
+    return run_sql_query(QueryEnum.DELIVERY_DATE_DIFFERECE.value, database)
 
 
 def query_global_ammount_order_status(database: Engine) -> QueryResult:
@@ -64,9 +334,7 @@ def query_global_ammount_order_status(database: Engine) -> QueryResult:
     Returns:
         Query: The query for global percentage of order status.
     """
-    query_name = QueryEnum.GLOBAL_AMMOUNT_ORDER_STATUS.value
-    query = read_query(QueryEnum.GLOBAL_AMMOUNT_ORDER_STATUS.value)
-    return QueryResult(query=query_name, result=read_sql(query, database))
+    return run_sql_query(QueryEnum.GLOBAL_AMMOUNT_ORDER_STATUS.value, database)
 
 
 def query_revenue_by_month_year(database: Engine) -> QueryResult:
@@ -78,9 +346,7 @@ def query_revenue_by_month_year(database: Engine) -> QueryResult:
     Returns:
         Query: The query for revenue by month year.
     """
-    query_name = QueryEnum.REVENUE_BY_MONTH_YEAR.value
-    query = read_query(QueryEnum.REVENUE_BY_MONTH_YEAR.value)
-    return QueryResult(query=query_name, result=read_sql(query, database))
+    return run_sql_query(QueryEnum.REVENUE_BY_MONTH_YEAR.value, database)
 
 
 def query_revenue_per_state(database: Engine) -> QueryResult:
@@ -92,9 +358,7 @@ def query_revenue_per_state(database: Engine) -> QueryResult:
     Returns:
         Query: The query for revenue per state.
     """
-    query_name = QueryEnum.REVENUE_PER_STATE.value
-    query = read_query(QueryEnum.REVENUE_PER_STATE.value)
-    return QueryResult(query=query_name, result=read_sql(query, database))
+    return run_sql_query(QueryEnum.REVENUE_PER_STATE.value, database)
 
 
 def query_top_10_least_revenue_categories(database: Engine) -> QueryResult:
@@ -106,9 +370,7 @@ def query_top_10_least_revenue_categories(database: Engine) -> QueryResult:
     Returns:
         Query: The query for top 10 least revenue categories.
     """
-    query_name = QueryEnum.TOP_10_LEAST_REVENUE_CATEGORIES.value
-    query = read_query(QueryEnum.TOP_10_LEAST_REVENUE_CATEGORIES.value)
-    return QueryResult(query=query_name, result=read_sql(query, database))
+    return run_sql_query(QueryEnum.TOP_10_LEAST_REVENUE_CATEGORIES.value, database)
 
 
 def query_top_10_revenue_categories(database: Engine) -> QueryResult:
@@ -120,9 +382,7 @@ def query_top_10_revenue_categories(database: Engine) -> QueryResult:
     Returns:
         Query: The query for top 10 revenue categories.
     """
-    query_name = QueryEnum.TOP_10_REVENUE_CATEGORIES.value
-    query = read_query(QueryEnum.TOP_10_REVENUE_CATEGORIES.value)
-    return QueryResult(query=query_name, result=read_sql(query, database))
+    return run_sql_query(QueryEnum.TOP_10_REVENUE_CATEGORIES.value, database)
 
 
 def query_real_vs_estimated_delivered_time(database: Engine) -> QueryResult:
@@ -134,9 +394,7 @@ def query_real_vs_estimated_delivered_time(database: Engine) -> QueryResult:
     Returns:
         Query: The query for real vs estimated delivered time.
     """
-    query_name = QueryEnum.REAL_VS_ESTIMATED_DELIVERED_TIME.value
-    query = read_query(QueryEnum.REAL_VS_ESTIMATED_DELIVERED_TIME.value)
-    return QueryResult(query=query_name, result=read_sql(query, database))
+    return run_sql_query(QueryEnum.REAL_VS_ESTIMATED_DELIVERED_TIME.value, database)
 
 
 def query_freight_value_weight_relationship(database: Engine) -> QueryResult:
@@ -219,8 +477,9 @@ def query_orders_per_day_and_holidays_2017(database: Engine) -> QueryResult:
     # Reading the public holidays from public_holidays table
     holidays = read_sql("SELECT * FROM public_holidays", database)
 
-    # Reading the orders from olist_orders table
-    orders = read_sql("SELECT * FROM olist_orders", database)
+    # Reading the 2017 orders from olist_orders; with partitioned storage only
+    # the 2017 partitions are scanned (see src.partitions)
+    orders = read_orders(database, "2017-01-01", "2018-01-01")
 
     # TODO: Convertir la columna order_purchase_timestamp a tipo datetime.
     # Reemplaza el contenido de la columna `order_purchase_timestamp` en el DataFrame `orders`
@@ -260,38 +519,499 @@ def query_orders_per_day_and_holidays_2017(database: Engine) -> QueryResult:
     return QueryResult(query=query_name, result=result_df)
 
 
+def query_customer_cohorts(database: Engine) -> QueryResult:
+    """Get the monthly acquisition cohorts and their retention.
+
+    Args:
+        database (Engine): Database connection.
+
+    Returns:
+        QueryResult: One row per cohort month and period since acquisition,
+        see src.customers.customer_cohorts.
+    """
+    query_name = QueryEnum.CUSTOMER_COHORTS.value
+    return QueryResult(query=query_name, result=customer_cohorts(read_customer_orders(database)))
+
+
+def query_customer_rfm_segments(database: Engine) -> QueryResult:
+    """Get the RFM segments of the customers.
+
+    Every customer is scored by recency, frequency and monetary value; the
+    result summarizes them per segment (see src.customers.rfm_scores).
+
+    Args:
+        database (Engine): Database connection.
+
+    Returns:
+        QueryResult: One row per RFM segment.
+    """
+    query_name = QueryEnum.CUSTOMER_RFM_SEGMENTS.value
+    scores = rfm_scores(read_customer_orders(database))
+    return QueryResult(query=query_name, result=rfm_segments(scores))
+
+
+def query_delivery_percentiles(database: Engine) -> QueryResult:
+    """Get the delivery time and lateness percentiles by month, state and category.
+
+    SQLite has no percentile aggregate, so they come from 1-day histograms
+    (see src.delivery), which give the exact percentiles of whole days.
+
+    Args:
+        database (Engine): Database connection.
+
+    Returns:
+        QueryResult: One row per dimension value, see
+        src.delivery.delivery_percentiles.
+    """
+    query_name = QueryEnum.DELIVERY_PERCENTILES.value
+    return QueryResult(
+        query=query_name, result=delivery_percentiles(compute_delivery_histograms(database))
+    )
+
+
+def query_delivery_lateness_histogram(database: Engine) -> QueryResult:
+    """Get the distribution of delivery lateness in days, per customer state.
+
+    Args:
+        database (Engine): Database connection.
+
+    Returns:
+        QueryResult: customer_state, days (negative is early) and order_count.
+    """
+    query_name = QueryEnum.DELIVERY_LATENESS_HISTOGRAM.value
+    return QueryResult(
+        query=query_name, result=lateness_histogram(compute_delivery_histograms(database))
+    )
+
+
+def _sql_query_function(query_name: str) -> Callable[[Engine], QueryResult]:
+    """Build a query function for a .sql file without a dedicated function.
+
+    Args:
+        query_name (str): The name of the query.
+
+    Returns:
+        Callable[[Engine], QueryResult]: The query function.
+    """
+
+    def query_function(database: Engine) -> QueryResult:
+        return run_sql_query(query_name, database)
+
+    query_function.__name__ = f"query_{query_name}"
+    query_function.__doc__ = f"Get the query for {query_name.replace('_', ' ')}."
+    return query_function
+
+
+def get_query_functions() -> Dict[str, Callable[[Engine], QueryResult]]:
+    """Get the function of every query by query name.
+
+    Every .sql file in the queries folder is included, so a new query only
+    needs its file.
+
+    Returns:
+        Dict[str, Callable[[Engine], QueryResult]]: Query functions by name.
+    """
+    functions = {
+        QueryEnum.DELIVERY_DATE_DIFFERECE.value: query_delivery_date_difference,
+        QueryEnum.GLOBAL_AMMOUNT_ORDER_STATUS.value: query_global_ammount_order_status,
+        QueryEnum.REVENUE_BY_MONTH_YEAR.value: query_revenue_by_month_year,
+        QueryEnum.REVENUE_PER_STATE.value: query_revenue_per_state,
+        QueryEnum.TOP_10_LEAST_REVENUE_CATEGORIES.value: query_top_10_least_revenue_categories,
+        QueryEnum.TOP_10_REVENUE_CATEGORIES.value: query_top_10_revenue_categories,
+        QueryEnum.REAL_VS_ESTIMATED_DELIVERED_TIME.value: query_real_vs_estimated_delivered_time,
+        QueryEnum.ORDERS_PER_DAY_AND_HOLIDAYS_2017.value: query_orders_per_day_and_holidays_2017,
+        QueryEnum.GET_FREIGHT_VALUE_WEIGHT_RELATIONSHIP.value: query_freight_value_weight_relationship,
+        QueryEnum.CUSTOMER_COHORTS.value: query_customer_cohorts,
+        QueryEnum.CUSTOMER_RFM_SEGMENTS.value: query_customer_rfm_segments,
+        QueryEnum.DELIVERY_PERCENTILES.value: query_delivery_percentiles,
+        QueryEnum.DELIVERY_LATENESS_HISTOGRAM.value: query_delivery_lateness_histogram,
+    }
+    for query_name in get_sql_query_names():
+        if query_name not in functions:
+            functions[query_name] = _sql_query_function(query_name)
+    return functions
+
+
 def get_all_queries() -> List[Callable[[Engine], QueryResult]]:
     """Get all queries.
 
     Returns:
         List[Callable[[Engine], QueryResult]]: A list of all queries.
     """
-    return [
-        query_delivery_date_difference,
-        query_global_ammount_order_status,
-        query_revenue_by_month_year,
-        query_revenue_per_state,
-        query_top_10_least_revenue_categories,
-        query_top_10_revenue_categories,
-        query_real_vs_estimated_delivered_time,
-        query_orders_per_day_and_holidays_2017,
-        query_freight_value_weight_relationship,
-    ]
+    return list(get_query_functions().values())
+
+
+def _code_modules(function: Callable) -> List[str]:
+    """Get the src modules whose code a query function runs.
+
+    Those are the modules of the functions, classes and modules it references
+    by name, and the ones it imports in its body, e.g. the helpers of
+    src.customers called by query_customer_cohorts.
+
+    Args:
+        function (Callable): The query function.
+
+    Returns:
+        List[str]: Sorted module names.
+    """
+    code = getattr(function, "__code__", None)
+    if code is None:
+        return []
+    namespace = getattr(function, "__globals__", {})
+    modules = set()
+    codes = [code]
+    while codes:
+        code = codes.pop()
+        codes.extend(const for const in code.co_consts if inspect.iscode(const))
+        for name in code.co_names:
+            value = namespace.get(name)
+            module = value.__name__ if inspect.ismodule(value) else getattr(value, "__module__", None)
+            for candidate in (name, module):
+                if isinstance(candidate, str) and candidate.startswith("src.") and candidate in sys.modules:
+                    modules.add(candidate)
+    return sorted(modules)
+
+
+def _query_code(query_name: str, query_function: Callable) -> str:
+    """Get the code that produces a query result, used to invalidate its cache.
+
+    Args:
+        query_name (str): The name of the query.
+        query_function (Callable): The function that computes the result.
+
+    Returns:
+        str: The SQL text for .sql queries. Otherwise the function source and
+        the source of the src modules it uses, so editing a helper also
+        invalidates the cached results.
+    """
+    derived = [
+        _INCREMENTAL_QUERIES.get(query_name, (None,))[0],
+        _APPROXIMATE_QUERIES.get(query_name, (None,))[0],
+    ] + [queries.get(query_name, (None,))[0] for queries in _BACKEND_QUERIES.values()]
+    if query_name in _QUERY_REGISTRY and query_function not in derived:
+        return _QUERY_REGISTRY[query_name].sql.text
+    sources = [inspect.getsource(query_function)]
+    sources += [inspect.getsource(sys.modules[name]) for name in _code_modules(query_function)]
+    return "\0".join(sources)
+
+
+def _resolve_query(
+    query_name: str, incremental: bool = False, approximate: bool = False, backend: str = "pandas"
+) -> Tuple[Callable[[Engine], QueryResult], Callable]:
+    """Pick the function that computes a query in the requested mode.
+
+    Args:
+        query_name (str): The name of the query.
+        incremental (bool): Whether to use the summary-table variant, if any.
+        approximate (bool): Whether to use the sketch variant, if any. It takes
+            precedence over incremental.
+        backend (str): The backend of the queries computed from the base tables.
+
+    Returns:
+        Tuple[Callable[[Engine], QueryResult], Callable]: The function that
+        returns the QueryResult and the one whose code versions the result.
+    """
+    pivot = None
+    if approximate and query_name in _APPROXIMATE_QUERIES:
+        pivot = _APPROXIMATE_QUERIES[query_name][0]
+    elif incremental and query_name in _INCREMENTAL_QUERIES:
+        pivot = _INCREMENTAL_QUERIES[query_name][0]
+    elif query_name in _backend_queries(backend):
+        pivot = _backend_queries(backend)[query_name][0]
+    if pivot is None:
+        query_function = get_query_functions()[query_name]
+        return query_function, query_function
+
+    def query_function(database: Engine) -> QueryResult:
+        return QueryResult(query=query_name, result=pivot(database))
+
+    return query_function, pivot
+
+
+def query_code_version(
+    query_name: str, incremental: bool = False, approximate: bool = False, backend: str = "pandas"
+) -> str:
+    """Get a digest of the code that computes a query, without touching the data.
+
+    Args:
+        query_name (str): The name of the query.
+        incremental (bool): Same as in run_query.
+        approximate (bool): Same as in run_query.
+        backend (str): Same as in run_query.
+
+    Raises:
+        KeyError: If the query is unknown.
+        ValueError: If the backend is unknown.
+
+    Returns:
+        str: A hex digest that changes when the SQL file, the query function
+        or a src module it uses is edited.
+    """
+    _, code_function = _resolve_query(query_name, incremental, approximate, backend)
+    return hashlib.sha256(_query_code(query_name, code_function).encode()).hexdigest()
+
+
+def query_version(
+    query_name: str,
+    database: Engine,
+    incremental: bool = False,
+    approximate: bool = False,
+    backend: str = "pandas",
+) -> Optional[str]:
+    """Get the version of a query result without computing it.
 
+    It is the key of the result in the persistent cache: it changes whenever
+    the query code or the version of one of the tables it reads changes.
 
-def run_queries(database: Engine) -> Dict[str, DataFrame]:
+    Args:
+        query_name (str): The name of the query.
+        database (Engine): Database connection.
+        incremental (bool): Same as in run_query.
+        approximate (bool): Same as in run_query.
+        backend (str): Same as in run_query.
+
+    Raises:
+        KeyError: If the query is unknown.
+        ValueError: If the backend is unknown.
+
+    Returns:
+        Optional[str]: A hex digest, or None when any of the tables has no
+        recorded version.
+    """
+    _, code_function = _resolve_query(query_name, incremental, approximate, backend)
+    tables = get_query_tables(query_name, incremental=incremental, approximate=approximate, backend=backend)
+    table_versions = get_table_versions(database, tables)
+    if table_versions is None:
+        return None
+    return query_cache_key(query_name, _query_code(query_name, code_function), table_versions)
+
+
+def run_query(
+    query_name: str,
+    database: Engine,
+    use_cache: bool = False,
+    incremental: bool = False,
+    approximate: bool = False,
+    backend: str = "pandas",
+) -> QueryResult:
+    """Run a single query, optionally through the persistent result cache.
+
+    With use_cache, the result is looked up by the hash of the query code and
+    the versions of the tables it reads, so it is only recomputed when either
+    changed. Tables without a recorded version are never served from cache.
+
+    Args:
+        query_name (str): The name of the query.
+        database (Engine): Database connection.
+        use_cache (bool): Whether to read and write the result cache.
+        incremental (bool): Whether to build the monthly, daily and delivery
+            histogram queries from the summary tables of src.aggregates and
+            src.delivery instead of the full history. The summary tables must
+            be up to date.
+        approximate (bool): Whether to build the queries that have an
+            approximate variant (top_10_revenue_categories) from the
+            HyperLogLog and top-K sketches of src.sketches, with bounded
+            error. It takes precedence over incremental.
+        backend (str): How the queries computed from the base tables run:
+            "pandas" (the default functions), "polars" (lazy plans of
+            src.polars_backend for the freight and orders per day queries;
+            needs polars) or "partitioned" (the freight query as a
+            hash-partitioned join on a process pool, see src.hash_join). Both
+            give the same results, up to the rounding of float sums.
+
+    Raises:
+        ValueError: If the backend is unknown.
+
+    Returns:
+        QueryResult: The query name and its result.
+    """
+    query_function, _ = _resolve_query(query_name, incremental, approximate, backend)
+    if not use_cache:
+        return query_function(database)
+
+    cache_key = query_version(query_name, database, incremental, approximate, backend)
+    if cache_key is None:
+        return query_function(database)
+
+    cached = read_cached_result(database, query_name, cache_key)
+    if cached is not None:
+        return QueryResult(query=query_name, result=cached)
+
+    query_result = query_function(database)
+    write_cached_result(database, query_name, cache_key, query_result.result)
+    return query_result
+
+
+def run_queries(
+    database: Engine,
+    use_cache: bool = False,
+    incremental: bool = False,
+    approximate: bool = False,
+    backend: str = "pandas",
+) -> Dict[str, DataFrame]:
     """Transform data based on the queries. For each query, the query is executed and
     the result is stored in the dataframe.
 
     Args:
         database (Engine): Database connection.
+        use_cache (bool): Whether to reuse results of queries whose code and
+            input tables did not change since they were cached.
+        incremental (bool): Whether to build the monthly, daily and delivery
+            histogram queries from the summary tables of src.aggregates and
+            src.delivery (built first if missing).
+        approximate (bool): Whether to build the queries with an approximate
+            variant from the sketches of src.sketches (built if missing).
+        backend (str): The backend of the queries computed from the base
+            tables (see run_query).
 
     Returns:
         Dict[str, DataFrame]: A dictionary with keys as the query file names and
         values the result of the query as a dataframe.
     """
+    if incremental:
+        ensure_aggregates(database)
     query_results = {}
-    for query in get_all_queries():
-        query_result = query(database)
+    for query_name in get_query_functions():
+        query_result = run_query(
+            query_name,
+            database,
+            use_cache=use_cache,
+            incremental=incremental,
+            approximate=approximate,
+            backend=backend,
+        )
         query_results[query_result.query] = query_result.result
     return query_results
+
+
+# Words of a search box query; everything else (quotes, operators) is dropped
+# so user input can never be parsed as FTS5 syntax.
+_SEARCH_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+# The FTS5 matches are filtered on the denormalized state and categories of the
+# index, ranked and cut to `limit` before joining to the orders, so the join
+# only runs for the returned rows. bm25 weighs title hits twice as much as
+# message hits (the UNINDEXED columns get weight 0).
+_SEARCH_REVIEWS_SQL = f"""
+WITH hits AS (
+    SELECT
+        f.review_id,
+        f.order_id,
+        f.review_score,
+        f.review_comment_title,
+        snippet({REVIEWS_FTS_TABLE}, 6, '**', '**', '…', 16) AS snippet,
+        f.customer_state,
+        f.categories,
+        bm25({REVIEWS_FTS_TABLE}, 0, 0, 0, 0, 0, 2.0, 1.0) AS rank
+    FROM {REVIEWS_FTS_TABLE} AS f
+    WHERE {REVIEWS_FTS_TABLE} MATCH :match
+      AND (:state IS NULL OR f.customer_state = :state)
+      AND (:category IS NULL OR instr(', ' || f.categories || ', ', ', ' || :category || ', ') > 0)
+    ORDER BY rank
+    LIMIT :limit
+)
+SELECT
+    h.review_id,
+    h.order_id,
+    h.review_score,
+    h.review_comment_title,
+    h.snippet,
+    o.order_purchase_timestamp,
+    o.order_status,
+    h.customer_state,
+    h.categories,
+    h.rank
+FROM hits AS h
+LEFT JOIN olist_orders AS o ON o.order_id = h.order_id
+ORDER BY h.rank
+"""
+
+
+SEARCH_REVIEWS_COLUMNS = (
+    "review_id",
+    "order_id",
+    "review_score",
+    "review_comment_title",
+    "snippet",
+    "order_purchase_timestamp",
+    "order_status",
+    "customer_state",
+    "categories",
+    "rank",
+)
+
+
+def read_review_filters(database: Engine) -> Tuple[List[str], List[str]]:
+    """Get every customer state and product category of the indexed reviews.
+
+    They are the options of the search filters, read from the denormalized
+    columns of the full-text index so they match what search_reviews filters on.
+
+    Args:
+        database (Engine): Database connection.
+
+    Returns:
+        Tuple[List[str], List[str]]: The sorted states and categories.
+    """
+    # Both lists from one snapshot of the index, even while a load publishes a new one
+    with read_snapshot(database) as conn:
+        states = conn.execute(
+            text(
+                f"SELECT DISTINCT customer_state FROM {REVIEWS_FTS_TABLE} "
+                "WHERE customer_state IS NOT NULL ORDER BY customer_state"
+            )
+        ).scalars().all()
+        category_lists = conn.execute(
+            text(f"SELECT DISTINCT categories FROM {REVIEWS_FTS_TABLE} WHERE categories IS NOT NULL")
+        ).scalars().all()
+    categories = {category for categories in category_lists for category in categories.split(", ")}
+    return list(states), sorted(categories)
+
+
+def build_review_match(search: str) -> Optional[str]:
+    """Turn a search box text into an FTS5 match expression.
+
+    Every word must appear, as a prefix, so "entrega atrasad" also finds
+    "entregue" and "atrasada" (FTS5 has no Portuguese stemmer).
+
+    Args:
+        search (str): Free text typed by the user.
+
+    Returns:
+        str, optional: The match expression, or None if there are no words.
+    """
+    terms = _SEARCH_TERM_RE.findall(search)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_reviews(
+    database: Engine,
+    search: str,
+    limit: int = 50,
+    state: Optional[str] = None,
+    category: Optional[str] = None,
+) -> DataFrame:
+    """Search the review comments through the full-text index built by load.
+
+    Args:
+        database (Engine): Database connection.
+        search (str): Free text; case and accents are ignored.
+        limit (int): Maximum number of reviews returned.
+        state (str, optional): Only reviews of customers from this state.
+        category (str, optional): Only reviews of orders with a product of
+            this category (English name, as in the dashboard).
+
+    Returns:
+        DataFrame: One row per review, best match first, with the order,
+        customer state, product categories and a highlighted snippet.
+    """
+    match = build_review_match(search)
+    if match is None:
+        return DataFrame(columns=list(SEARCH_REVIEWS_COLUMNS))
+    return read_sql(
+        text(_SEARCH_REVIEWS_SQL),
+        database,
+        params={"match": match, "state": state, "category": category, "limit": limit},
+    )
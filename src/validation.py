@@ -0,0 +1,401 @@
+import json
+from collections import namedtuple
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pandas import DataFrame
+
+# A chunk of a table: a DataFrame (e.g. fresh from extract) or Arrow data (e.g.
+# read back from the staged Parquet files, without converting it to pandas).
+Chunk = Union[DataFrame, pa.Table, pa.RecordBatch]
+
+# Declared column of a source table: its kind ("str", "int", "float",
+# "datetime" or "bool"), whether it may be empty and its valid [min, max].
+Column = namedtuple("Column", ["name", "kind", "nullable", "min", "max"], defaults=(True, None, None))
+
+# A foreign key: every non-null `column` of `table` should be a `ref_column`
+# of `ref_table`.
+ForeignKey = namedtuple("ForeignKey", ["table", "column", "ref_table", "ref_column"])
+
+# One finding. severity is "error" (the data can't be loaded as declared) or
+# "warning" (it loads, but some rows won't join or look wrong); count is the
+# number of rows and example the first offending value.
+Issue = namedtuple("Issue", ["table", "column", "check", "severity", "count", "example"])
+
+# What validating a table leaves: its row count, its issues and the distinct
+# values of its key columns (Arrow arrays), for the foreign key checks.
+TableProfile = namedtuple("TableProfile", ["table", "rows", "issues", "keys"])
+
+ValidationReport = namedtuple("ValidationReport", ["rows", "issues"])
+
+# Any timestamp outside this range is a typo or a parsing accident
+DATE_RANGE = ("2000-01-01", "2030-12-31")
+
+# Formats of the extracted timestamps, parsed natively; anything else goes
+# through pandas
+_DATETIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d")
+
+# Text that parses as a number: pandas would take it, and so does Arrow
+_NUMBER = r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$"
+
+_DATE = dict(kind="datetime", min=DATE_RANGE[0], max=DATE_RANGE[1])
+
+TABLE_SCHEMAS: Dict[str, Sequence[Column]] = {
+    "olist_customers": (
+        Column("customer_id", "str", nullable=False),
+        Column("customer_unique_id", "str", nullable=False),
+        Column("customer_zip_code_prefix", "int", min=0, max=99999),
+        Column("customer_city", "str"),
+        Column("customer_state", "str"),
+    ),
+    "olist_geolocation": (
+        Column("geolocation_zip_code_prefix", "int", min=0, max=99999),
+        Column("geolocation_lat", "float", min=-90, max=90),
+        Column("geolocation_lng", "float", min=-180, max=180),
+        Column("geolocation_city", "str"),
+        Column("geolocation_state", "str"),
+    ),
+    "olist_order_items": (
+        Column("order_id", "str", nullable=False),
+        Column("order_item_id", "int", nullable=False, min=1),
+        Column("product_id", "str", nullable=False),
+        Column("seller_id", "str", nullable=False),
+        Column("shipping_limit_date", **_DATE),
+        Column("price", "float", min=0),
+        Column("freight_value", "float", min=0),
+    ),
+    "olist_order_payments": (
+        Column("order_id", "str", nullable=False),
+        Column("payment_sequential", "int", min=1),
+        Column("payment_type", "str"),
+        Column("payment_installments", "int", min=0),
+        Column("payment_value", "float", min=0),
+    ),
+    "olist_order_reviews": (
+        Column("review_id", "str", nullable=False),
+        Column("order_id", "str", nullable=False),
+        Column("review_score", "int", min=1, max=5),
+        Column("review_comment_title", "str"),
+        Column("review_comment_message", "str"),
+        Column("review_creation_date", **_DATE),
+        Column("review_answer_timestamp", **_DATE),
+    ),
+    "olist_orders": (
+        Column("order_id", "str", nullable=False),
+        Column("customer_id", "str", nullable=False),
+        Column("order_status", "str", nullable=False),
+        Column("order_purchase_timestamp", **_DATE),
+        Column("order_approved_at", **_DATE),
+        Column("order_delivered_carrier_date", **_DATE),
+        Column("order_delivered_customer_date", **_DATE),
+        Column("order_estimated_delivery_date", **_DATE),
+    ),
+    "olist_products": (
+        Column("product_id", "str", nullable=False),
+        Column("product_category_name", "str"),
+        Column("product_name_lenght", "float", min=0),
+        Column("product_description_lenght", "float", min=0),
+        Column("product_photos_qty", "float", min=0),
+        Column("product_weight_g", "float", min=0),
+        Column("product_length_cm", "float", min=0),
+        Column("product_height_cm", "float", min=0),
+        Column("product_width_cm", "float", min=0),
+    ),
+    "olist_sellers": (
+        Column("seller_id", "str", nullable=False),
+        Column("seller_zip_code_prefix", "int", min=0, max=99999),
+        Column("seller_city", "str"),
+        Column("seller_state", "str"),
+    ),
+    "product_category_name_translation": (
+        Column("product_category_name", "str", nullable=False),
+        Column("product_category_name_english", "str", nullable=False),
+    ),
+    "public_holidays": (
+        Column("date", nullable=False, **_DATE),
+        Column("localName", "str"),
+    ),
+}
+
+# Keys that must be unique. The reviews are left out: the source repeats
+# review ids across orders.
+PRIMARY_KEYS: Dict[str, Sequence[str]] = {
+    "olist_customers": ("customer_id",),
+    "olist_order_items": ("order_id", "order_item_id"),
+    "olist_order_payments": ("order_id", "payment_sequential"),
+    "olist_orders": ("order_id",),
+    "olist_products": ("product_id",),
+    "olist_sellers": ("seller_id",),
+    "product_category_name_translation": ("product_category_name",),
+}
+
+FOREIGN_KEYS = (
+    ForeignKey("olist_order_items", "order_id", "olist_orders", "order_id"),
+    ForeignKey("olist_order_items", "product_id", "olist_products", "product_id"),
+    ForeignKey("olist_order_items", "seller_id", "olist_sellers", "seller_id"),
+    ForeignKey("olist_orders", "customer_id", "olist_customers", "customer_id"),
+    ForeignKey("olist_order_payments", "order_id", "olist_orders", "order_id"),
+    ForeignKey("olist_order_reviews", "order_id", "olist_orders", "order_id"),
+)
+
+
+def key_columns(table: str) -> List[str]:
+    """Columns of a table that take part in a foreign key, on either side."""
+    columns = [fk.column for fk in FOREIGN_KEYS if fk.table == table]
+    columns += [fk.ref_column for fk in FOREIGN_KEYS if fk.ref_table == table]
+    return sorted(set(columns))
+
+
+def _to_arrow(chunk: Chunk) -> pa.Table:
+    """A chunk as an Arrow table; the checks run on Arrow arrays."""
+    if isinstance(chunk, pa.Table):
+        return chunk
+    if isinstance(chunk, pa.RecordBatch):
+        return pa.Table.from_batches([chunk])
+    arrays = {}
+    for name in chunk.columns:
+        values = chunk[name]
+        try:
+            arrays[name] = pa.array(values, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed Python objects (e.g. numbers and text) are checked as text
+            arrays[name] = pa.array(values.astype(str).where(values.notna()), from_pandas=True)
+    return pa.table(arrays)
+
+
+def _plain(values: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Decode dictionary (categorical) columns and use a single string type."""
+    if pa.types.is_dictionary(values.type):
+        values = pc.cast(values, values.type.value_type)
+    if pa.types.is_large_string(values.type):
+        values = pc.cast(values, pa.string())
+    return values
+
+
+def _parse(values: pa.ChunkedArray, kind: str) -> Tuple[Optional[pa.ChunkedArray], Optional[pa.ChunkedArray]]:
+    """Values of a column as numbers or timestamps, and the mask of the
+    non-empty ones that don't parse; (None, None) for text columns."""
+    valid = pc.is_valid(values)
+    if kind in ("int", "float"):
+        if pa.types.is_integer(values.type) or pa.types.is_floating(values.type) or pa.types.is_boolean(values.type):
+            parsed = pc.cast(values, pa.float64())
+            bad = pc.and_(valid, False)
+        elif pa.types.is_string(values.type):
+            ok = pc.match_substring_regex(values, _NUMBER)
+            parsed = pc.cast(pc.if_else(ok, values, pa.scalar(None, pa.string())), pa.float64())
+            bad = pc.and_(valid, pc.invert(ok))
+        else:
+            return None, pc.fill_null(valid, False)
+        if kind == "int":
+            bad = pc.or_(bad, pc.fill_null(pc.not_equal(pc.floor(parsed), parsed), False))
+        return parsed, bad
+    if kind == "datetime":
+        if pa.types.is_timestamp(values.type):
+            parsed = values
+        elif pa.types.is_date(values.type):
+            parsed = pc.cast(values, pa.timestamp("s"))
+        elif pa.types.is_string(values.type):
+            # The extracted text is ISO: parse it in C++ with the formats of the
+            # source, each one only if the previous left values unparsed, and
+            # hand the rest to pandas (other formats)
+            parsed = None
+            for pattern in _DATETIME_FORMATS:
+                attempt = pc.strptime(values, format=pattern, unit="ns", error_is_null=True)
+                parsed = attempt if parsed is None else pc.coalesce(parsed, attempt)
+                if not pc.sum(pc.and_(valid, pc.is_null(parsed))).as_py():
+                    break
+            else:
+                parsed = pa.chunked_array([pa.array(pd.to_datetime(values.to_pandas(), errors="coerce"))])
+        else:
+            return None, pc.fill_null(valid, False)
+        return parsed, pc.and_(valid, pc.is_null(parsed))
+    return None, None
+
+
+def _bound(value, kind: str, parsed: pa.ChunkedArray) -> pa.Scalar:
+    if kind == "datetime":
+        return pa.scalar(pd.Timestamp(value), type=parsed.type)
+    return pa.scalar(float(value), type=parsed.type)
+
+
+class _Counter:
+    """Row counts of one check across chunks, and its first example."""
+
+    def __init__(self):
+        self.count = 0
+        self.example = None
+
+    def add(self, values: pa.ChunkedArray, mask: pa.ChunkedArray) -> None:
+        mask = pc.fill_null(mask, False)
+        found = pc.sum(mask).as_py() or 0
+        if found:
+            if self.example is None:
+                self.example = str(pc.filter(values, mask)[0].as_py())[:40]
+            self.count += found
+
+
+def _distinct(parts: List[pa.Table]) -> pa.Table:
+    # Distinct rows: a group by without aggregations
+    table = pa.concat_tables(parts)
+    return table.group_by(table.column_names).aggregate([])
+
+
+def profile_table(table: str, chunks: Iterable[Chunk], columns: Optional[Sequence[str]] = None) -> TableProfile:
+    """Validate a table chunk by chunk, with vectorized checks only.
+
+    Checks the declared columns (present, parseable as their kind, not empty
+    when required, within their range) and the uniqueness of the primary key,
+    and keeps the distinct values of the key columns for validate_tables. The
+    checks are Arrow compute kernels: null counts come from the validity
+    bitmaps and text is parsed without going through Python objects. Only one
+    chunk is held at a time, plus the distinct values of the keys.
+
+    Args:
+        table (str): The table name.
+        chunks (Iterable[Chunk]): The table, in one or more DataFrames or Arrow
+            batches.
+        columns (Sequence[str], optional): Only check these declared columns
+            (e.g. the keys read back from the database).
+
+    Returns:
+        TableProfile: Row count, issues and distinct key values of the table.
+    """
+    schema = [c for c in TABLE_SCHEMAS.get(table, ()) if columns is None or c.name in columns]
+    primary_key = list(PRIMARY_KEYS.get(table, ()))
+    if columns is not None and not set(primary_key) <= set(columns):
+        primary_key = []
+    checks = {
+        (column.name, check): _Counter()
+        for column in schema
+        for check in ("unparseable", "missing", "below_min", "above_max")
+    }
+    keys: Dict[str, List[pa.Table]] = {column: [] for column in key_columns(table)}
+    primary_rows: List[pa.Table] = []
+    primary_total = 0
+    absent = set()
+    rows = 0
+
+    for chunk in chunks:
+        chunk = _to_arrow(chunk)
+        rows += chunk.num_rows
+        for column in schema:
+            if column.name not in chunk.column_names:
+                absent.add(column.name)
+                continue
+            values = _plain(chunk.column(column.name))
+            if not column.nullable:
+                checks[(column.name, "missing")].add(values, pc.is_null(values, nan_is_null=True))
+            parsed, bad = _parse(values, column.kind)
+            if bad is not None:
+                checks[(column.name, "unparseable")].add(values, bad)
+            if parsed is None:
+                continue
+            if column.min is not None:
+                checks[(column.name, "below_min")].add(values, pc.less(parsed, _bound(column.min, column.kind, parsed)))
+            if column.max is not None:
+                checks[(column.name, "above_max")].add(
+                    values, pc.greater(parsed, _bound(column.max, column.kind, parsed))
+                )
+        for column, parts in keys.items():
+            if column in chunk.column_names and [column] != primary_key:
+                values = pc.cast(_plain(chunk.column(column)), pa.string())
+                parts.append(_distinct([pa.table({column: values.filter(pc.is_valid(values))})]))
+        if primary_key and set(primary_key) <= set(chunk.column_names):
+            # As text, so chunks with different inferred types still compare
+            key = {name: pc.cast(_plain(chunk.column(name)), pa.string()) for name in primary_key}
+            primary_rows.append(_distinct([pa.table(key)]))
+            primary_total += chunk.num_rows
+
+    issues = [Issue(table, name, "missing_column", "error", rows, None) for name in sorted(absent)]
+    for (name, check), counter in checks.items():
+        if counter.count:
+            severity = "warning" if check in ("below_min", "above_max") else "error"
+            issues.append(Issue(table, name, check, severity, counter.count, counter.example))
+    distinct_keys = {column: _distinct(parts).column(0) for column, parts in keys.items() if parts}
+    if primary_rows:
+        primary = _distinct(primary_rows)
+        duplicated = primary_total - primary.num_rows
+        if duplicated:
+            issues.append(Issue(table, ", ".join(primary_key), "duplicate_key", "error", duplicated, None))
+        if primary_key[0] in keys and len(primary_key) == 1:
+            # A primary key that is also referenced: its distinct values are
+            # already there
+            values = primary.column(0)
+            distinct_keys[primary_key[0]] = values.filter(pc.is_valid(values))
+    return TableProfile(table, rows, issues, distinct_keys)
+
+
+def check_foreign_keys(profiles: Mapping[str, TableProfile]) -> List[Issue]:
+    """Count the rows whose foreign key has no match, for the profiled tables.
+
+    Args:
+        profiles (Mapping[str, TableProfile]): Profiles by table name.
+
+    Returns:
+        List[Issue]: One warning per foreign key with orphan values; count is
+        the number of distinct orphan keys.
+    """
+    issues = []
+    for fk in FOREIGN_KEYS:
+        child, parent = profiles.get(fk.table), profiles.get(fk.ref_table)
+        if child is None or parent is None or fk.column not in child.keys or fk.ref_column not in parent.keys:
+            continue
+        values = child.keys[fk.column]
+        missing = pc.invert(pc.is_in(values, value_set=parent.keys[fk.ref_column]))
+        orphans = pc.sum(missing).as_py() or 0
+        if orphans:
+            example = pc.filter(values, missing)[0].as_py()
+            issues.append(
+                Issue(fk.table, fk.column, f"not_in:{fk.ref_table}.{fk.ref_column}", "warning", orphans, example)
+            )
+    return issues
+
+
+def validate_tables(chunks_by_table: Mapping[str, Iterable[Chunk]]) -> ValidationReport:
+    """Validate several tables and the foreign keys between them.
+
+    Args:
+        chunks_by_table (Mapping[str, Iterable[Chunk]]): The chunks of
+            every table, read lazily one table at a time.
+
+    Returns:
+        ValidationReport: Rows per table and every issue found.
+    """
+    profiles = {table: profile_table(table, chunks) for table, chunks in chunks_by_table.items()}
+    issues = [issue for profile in profiles.values() for issue in profile.issues]
+    issues += check_foreign_keys(profiles)
+    return ValidationReport({table: profile.rows for table, profile in profiles.items()}, issues)
+
+
+def iter_parquet(path: str, batch_rows: int = 200_000) -> Iterable[pa.RecordBatch]:
+    """Read a Parquet file in Arrow batches of up to `batch_rows` rows."""
+    import pyarrow.parquet as pq
+
+    yield from pq.ParquetFile(path).iter_batches(batch_size=batch_rows)
+
+
+def errors(report: ValidationReport) -> List[Issue]:
+    """The issues that must stop the load."""
+    return [issue for issue in report.issues if issue.severity == "error"]
+
+
+def format_report(report: ValidationReport) -> str:
+    """A compact text report: a summary line and one line per issue."""
+    n_errors = len(errors(report))
+    lines = [
+        f"{len(report.rows)} tables, {sum(report.rows.values()):,} rows: "
+        f"{n_errors} errors, {len(report.issues) - n_errors} warnings"
+    ]
+    for issue in sorted(report.issues, key=lambda i: (i.severity != "error", i.table, i.column)):
+        example = f" (e.g. {issue.example!r})" if issue.example is not None else ""
+        lines.append(f"{issue.severity.upper()} {issue.table}.{issue.column} {issue.check}: {issue.count:,}{example}")
+    return "\n".join(lines)
+
+
+def write_report(report: ValidationReport, path: str) -> None:
+    """Save the report as JSON (rows per table and the list of issues)."""
+    payload = {"rows": report.rows, "issues": [issue._asdict() for issue in report.issues]}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
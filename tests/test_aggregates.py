@@ -0,0 +1,85 @@
+import pandas as pd
+import pytest
+
+from src.aggregates import (
+    append_and_refresh,
+    orders_per_day_and_holidays_from_aggregates,
+    real_vs_estimated_delivered_time_from_aggregates,
+    refresh_aggregates,
+    revenue_by_month_year_from_aggregates,
+)
+from src.load import dispose_engines, get_engine, load_dataframe
+from src.transform import query_real_vs_estimated_delivered_time, query_revenue_by_month_year
+
+
+def _orders(rows):
+    columns = [
+        "order_id",
+        "order_status",
+        "order_purchase_timestamp",
+        "order_delivered_customer_date",
+        "order_estimated_delivery_date",
+    ]
+    df = pd.DataFrame(rows, columns=columns)
+    for col in columns[2:]:
+        df[col] = pd.to_datetime(df[col])
+    return df
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = get_engine(str(tmp_path / "olist.db"))
+    load_dataframe(
+        "olist_orders",
+        _orders(
+            [
+                ("o1", "delivered", "2017-01-03 10:00", "2017-01-10 12:00", "2017-01-20"),
+                ("o2", "delivered", "2017-01-04 09:00", "2017-02-01 08:00", "2017-01-25"),
+                ("o3", "canceled", "2017-01-04 11:00", None, "2017-01-25"),
+            ]
+        ),
+        engine,
+    )
+    load_dataframe(
+        "olist_order_payments",
+        pd.DataFrame({"order_id": ["o1", "o2", "o3"], "payment_value": [10.0, 20.0, 30.0]}),
+        engine,
+    )
+    load_dataframe(
+        "public_holidays", pd.DataFrame({"date": pd.to_datetime(["2017-01-01"])}), engine
+    )
+    refresh_aggregates(engine)
+    yield engine
+    dispose_engines()
+
+
+def test_append_and_refresh_matches_full_queries(engine):
+    affected = append_and_refresh(
+        {
+            "olist_orders": _orders(
+                [("o4", "delivered", "2018-03-01 10:00", "2018-03-05 10:00", "2018-03-15")]
+            ),
+            "olist_order_payments": pd.DataFrame({"order_id": ["o4"], "payment_value": [5.0]}),
+        },
+        engine,
+    )
+    assert affected.revenue_months == {"2018-03"}
+    assert affected.days == {"2018-03-01"}
+
+    pd.testing.assert_frame_equal(
+        revenue_by_month_year_from_aggregates(engine),
+        query_revenue_by_month_year(engine).result,
+    )
+    pd.testing.assert_frame_equal(
+        real_vs_estimated_delivered_time_from_aggregates(engine),
+        query_real_vs_estimated_delivered_time(engine).result,
+        # read_sql gives object columns for years without any delivery
+        check_dtype=False,
+    )
+
+
+def test_orders_per_day_from_aggregates(engine):
+    result = orders_per_day_and_holidays_from_aggregates(engine)
+    assert result["order_count"].tolist() == [1, 2]
+    assert result["holiday"].tolist() == [False, False]
+    assert result["date"].tolist() == [1483401600000, 1483488000000]
@@ -0,0 +1,60 @@
+import ast
+import inspect
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from src.artifacts import export_artifact_json, export_filter_options, result_json_name, write_result_artifact
+from src.config import QUERY_RESULTS_EXPORT_PATH
+from src.pipeline import build_stages
+from src.transform import get_query_functions
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_export_filter_options_from_result_artifacts(tmp_path):
+    revenue = pd.DataFrame(
+        {"month": ["Jan", "Feb"], "Year2016": [0.0, 1.0], "Year2017": [2.0, 3.0]}
+    )
+    states = pd.DataFrame({"customer_state": ["SP", "BA", None], "Revenue": [3.0, 2.0, 1.0]})
+    paths = [
+        write_result_artifact("revenue_by_month_year", revenue, root=str(tmp_path)),
+        write_result_artifact("revenue_per_state", states, root=str(tmp_path)),
+    ]
+
+    with open(export_filter_options(paths, str(tmp_path / "out")), "r") as f:
+        options = json.load(f)
+
+    assert options == {
+        "years": [2016, 2017],
+        "months": ["Jan", "Feb"],
+        "states": ["BA", "SP"],
+        # top_10_revenue_categories was not exported in this run
+        "categories": [],
+    }
+
+
+def _dashboard_constant(name):
+    # dashboard.py runs the Streamlit app on import: read the literal instead
+    tree = ast.parse((ROOT / "dashboard.py").read_text(encoding="utf-8"))
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == name for t in node.targets):
+            return node.value
+    raise KeyError(name)
+
+
+def test_dashboard_loads_the_exported_results(tmp_path):
+    page_datasets = ast.literal_eval(_dashboard_constant("PAGE_DATASETS"))
+    names = {name for datasets in page_datasets.values() for name in datasets}
+    assert {"customer_cohorts", "customer_rfm_segments"} <= names
+    assert names <= set(get_query_functions())
+
+    # The dashboard reads QUERY_RESULTS_EXPORT_PATH / result_json_name(name),
+    # where the pipeline export stage writes by default
+    assert ast.unparse(_dashboard_constant("QUERY_RESULTS_DIR")) == "Path(QUERY_RESULTS_EXPORT_PATH)"
+    assert inspect.signature(build_stages).parameters["results_dir"].default == QUERY_RESULTS_EXPORT_PATH
+    outdir = tmp_path / "out"
+    for name in sorted(names):
+        artifact = write_result_artifact(name, pd.DataFrame({"x": [1]}), root=str(tmp_path))
+        assert export_artifact_json(artifact, str(outdir)) == str(outdir / result_json_name(name))
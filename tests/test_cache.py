@@ -0,0 +1,71 @@
+import pandas as pd
+from sqlalchemy import event, text
+
+from src.cache import QUERY_CACHE_TABLE
+from src.load import dispose_engines, get_engine, load, load_dataframe
+from src.transform import _query_code, _resolve_query, run_query
+
+
+def _orders(statuses):
+    return pd.DataFrame(
+        {
+            "order_id": [f"o{i}" for i in range(len(statuses))],
+            "order_status": statuses,
+        }
+    )
+
+
+def _cached_keys(engine):
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT cache_key FROM {QUERY_CACHE_TABLE}")).fetchall()
+
+
+def _count_order_reads(engine):
+    # Statements that read olist_orders: the query itself, never the cache lookups
+    reads = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if "FROM olist_orders" in statement:
+            reads.append(statement)
+
+    return reads
+
+
+def test_run_query_cache_is_invalidated_by_new_data(tmp_path):
+    engine = get_engine(str(tmp_path / "olist.db"))
+    reads = _count_order_reads(engine)
+    try:
+        load_dataframe("olist_orders", _orders(["delivered", "canceled"]), engine)
+        first = run_query("global_ammount_order_status", engine, use_cache=True).result
+        key = _cached_keys(engine)
+        assert len(reads) == 1
+
+        # Reloading identical data keeps the table version, so the cache is hit
+        # and the query is not executed again
+        load_dataframe("olist_orders", _orders(["delivered", "canceled"]), engine)
+        second = run_query("global_ammount_order_status", engine, use_cache=True).result
+        pd.testing.assert_frame_equal(first, second)
+        assert _cached_keys(engine) == key
+        assert len(reads) == 1
+
+        load_dataframe("olist_orders", _orders(["delivered", "delivered"]), engine)
+        third = run_query("global_ammount_order_status", engine, use_cache=True).result
+        assert third.to_dict("records") == [{"order_status": "delivered", "Ammount": 2}]
+        assert _cached_keys(engine) != key
+        assert len(reads) == 2
+
+        # load() records the new version too
+        load({"olist_orders": _orders(["delivered"] * 3)}, engine)
+        fourth = run_query("global_ammount_order_status", engine, use_cache=True).result
+        assert fourth.to_dict("records") == [{"order_status": "delivered", "Ammount": 3}]
+        assert len(reads) == 3
+    finally:
+        dispose_engines()
+
+
+def test_query_code_covers_the_helpers_of_python_queries():
+    _, code_function = _resolve_query("customer_cohorts")
+    code = _query_code("customer_cohorts", code_function)
+    # Editing src.customers changes the cache key of the queries built on it
+    assert "def customer_cohorts(" in code
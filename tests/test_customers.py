@@ -0,0 +1,50 @@
+import pandas as pd
+
+from src.customers import customer_cohorts, retention_matrix, rfm_scores, rfm_segments
+
+
+def _orders(rows):
+    df = pd.DataFrame(
+        rows, columns=["customer_unique_id", "order_id", "order_purchase_timestamp", "payment_value"]
+    )
+    df["order_purchase_timestamp"] = pd.to_datetime(df["order_purchase_timestamp"])
+    return df
+
+
+ORDERS = _orders(
+    [
+        ("u1", "o1", "2017-01-05", 100.0),
+        ("u1", "o2", "2017-01-20", 50.0),  # same month: counted once
+        ("u1", "o3", "2017-03-02", 30.0),
+        ("u2", "o4", "2017-01-31", 10.0),
+        ("u3", "o5", "2017-02-10", 20.0),
+        ("u3", "o6", "2017-03-15", 40.0),
+    ]
+)
+
+
+def test_customer_cohorts():
+    cohorts = customer_cohorts(ORDERS)
+    assert cohorts[["cohort_month", "period", "customers", "cohort_size"]].values.tolist() == [
+        ["2017-01", 0, 2, 2],
+        ["2017-01", 2, 1, 2],
+        ["2017-02", 0, 1, 1],
+        ["2017-02", 1, 1, 1],
+    ]
+    matrix = retention_matrix(cohorts)
+    assert matrix.loc["2017-01", 2] == 0.5
+    assert pd.isna(matrix.loc["2017-01", 1])
+
+
+def test_rfm_scores():
+    scores = rfm_scores(ORDERS, as_of=pd.Timestamp("2017-04-01")).set_index("customer_unique_id")
+    assert scores["recency"].to_dict() == {"u1": 30, "u2": 60, "u3": 17}
+    assert scores["frequency"].to_dict() == {"u1": 3, "u2": 1, "u3": 2}
+    assert scores["monetary"].to_dict() == {"u1": 180.0, "u2": 10.0, "u3": 60.0}
+    assert scores.loc["u1", "rfm"] == "455"
+    assert scores["segment"].to_dict() == {"u1": "Champions", "u2": "Hibernating", "u3": "Champions"}
+
+    segments = rfm_segments(scores.reset_index())
+    assert segments["segment"].tolist() == ["Champions", "Hibernating"]
+    assert segments["customers"].tolist() == [2, 1]
+    assert segments["share"].sum() == 1.0
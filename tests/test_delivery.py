@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.aggregates import append_and_refresh
+from src.delivery import (
+    compute_delivery_histograms,
+    delivery_percentiles,
+    histogram_percentiles,
+    merge_histograms,
+    read_delivery_histograms,
+    refresh_delivery_histograms,
+)
+from src.load import dispose_engines, get_engine, load_all
+
+
+def _orders(n, rng):
+    purchase = pd.Timestamp("2017-01-01") + pd.to_timedelta(rng.integers(0, 90 * 24, n), unit="h")
+    delivered = purchase + pd.to_timedelta(rng.integers(1, 40 * 24, n), unit="h")
+    estimated = purchase.normalize() + pd.to_timedelta(rng.integers(10, 30, n), unit="D")
+    return pd.DataFrame(
+        {
+            "order_id": [f"o{i}" for i in range(n)],
+            "customer_id": [f"c{i}" for i in range(n)],
+            "order_status": np.where(rng.random(n) < 0.9, "delivered", "shipped"),
+            "order_purchase_timestamp": purchase,
+            "order_delivered_customer_date": delivered,
+            "order_estimated_delivery_date": estimated,
+            "order_approved_at": purchase,
+        }
+    )
+
+
+@pytest.fixture
+def tables():
+    rng = np.random.default_rng(7)
+    orders = _orders(400, rng)
+    items = pd.DataFrame(
+        {
+            "order_id": np.repeat(orders["order_id"], 2),
+            "order_item_id": np.tile([1, 2], len(orders)),
+            "product_id": rng.choice(["p1", "p2", "p3"], 2 * len(orders)),
+            "seller_id": "s1",
+            "price": 10.0,
+            "freight_value": 1.0,
+        }
+    )
+    return {
+        "olist_orders": orders,
+        "olist_customers": pd.DataFrame(
+            {"customer_id": orders["customer_id"], "customer_state": rng.choice(["SP", "RJ", "MG"], len(orders))}
+        ),
+        "olist_order_items": items,
+        "olist_order_payments": pd.DataFrame({"order_id": orders["order_id"], "payment_value": 11.0}),
+        "olist_products": pd.DataFrame(
+            {"product_id": ["p1", "p2", "p3"], "product_category_name": ["beleza", "esporte", "sem_traducao"]}
+        ),
+        "product_category_name_translation": pd.DataFrame(
+            {"product_category_name": ["beleza", "esporte"], "product_category_name_english": ["health_beauty", "sports"]}
+        ),
+    }
+
+
+@pytest.fixture
+def engine(tmp_path, tables):
+    engine = get_engine(str(tmp_path / "olist.db"))
+    load_all(tables, engine)
+    yield engine
+    dispose_engines()
+
+
+def _per_order(tables):
+    orders = tables["olist_orders"].merge(tables["olist_customers"], on="customer_id")
+    orders = orders[orders["order_status"] == "delivered"]
+    purchase = orders["order_purchase_timestamp"]
+    return orders.assign(
+        delivery_days=(orders["order_delivered_customer_date"] - purchase).dt.days,
+        lateness_days=(
+            orders["order_delivered_customer_date"].dt.normalize() - orders["order_estimated_delivery_date"]
+        ).dt.days,
+        month=purchase.dt.strftime("%Y-%m"),
+    )
+
+
+def test_percentiles_match_numpy(engine, tables):
+    histograms = compute_delivery_histograms(engine)
+    orders = _per_order(tables)
+    for by in ((), ("customer_state",), ("month",)):
+        for metric in ("delivery_days", "lateness_days"):
+            result = histogram_percentiles(merge_histograms(histograms, by, metric), by)
+            groups = orders.groupby(by[0]) if by else [(None, orders)]
+            expected = [
+                [len(g)]
+                + [np.percentile(g[metric], p, method="inverted_cdf") for p in (50, 90, 99)]
+                + [g[metric].mean(), (g[metric] > 0).mean()]
+                for _, g in groups
+            ]
+            got = result[["order_count", "p50", "p90", "p99", "mean", "late_share"]]
+            np.testing.assert_allclose(got.to_numpy(dtype=float), np.array(expected, dtype=float))
+
+
+def test_category_histograms_count_each_order_once(engine, tables):
+    histograms = compute_delivery_histograms(engine)
+    orders = _per_order(tables)
+
+    # Orders with two items of the same category count once in it; the
+    # untranslated category keeps its Portuguese name
+    by_category = merge_histograms(histograms, ["category"]).groupby("category")["order_count"].sum()
+    items = tables["olist_order_items"].merge(tables["olist_products"], on="product_id")
+    expected = (
+        items[items["order_id"].isin(orders["order_id"])]
+        .drop_duplicates(["order_id", "product_category_name"])
+        .groupby("product_category_name")
+        .size()
+        .rename({"beleza": "health_beauty", "esporte": "sports"})
+        .sort_index()
+    )
+    pd.testing.assert_series_equal(by_category, expected, check_names=False)
+
+    # Rollups without the category use the "*" rows, one per order
+    percentiles = delivery_percentiles(histograms)
+    states = percentiles[percentiles["dimension"] == "customer_state"]
+    assert states["order_count"].sum() == len(orders)
+    assert set(percentiles["dimension"]) == {"month", "customer_state", "category"}
+
+
+def test_refresh_by_month_matches_full_refresh(engine, tables):
+    refresh_delivery_histograms(engine)
+
+    new_orders = _orders(30, np.random.default_rng(11))
+    new_orders["order_id"] = "n" + new_orders["order_id"]
+    new_orders["customer_id"] = "c0"
+    append_and_refresh(
+        {
+            "olist_orders": new_orders,
+            "olist_order_items": pd.DataFrame(
+                {"order_id": new_orders["order_id"], "order_item_id": 1, "product_id": "p1", "seller_id": "s1"}
+            ),
+        },
+        engine,
+    )
+
+    columns = ["year", "month_no", "customer_state", "category", "metric", "days"]
+    incremental = read_delivery_histograms(engine).sort_values(columns).reset_index(drop=True)
+    full = compute_delivery_histograms(engine).sort_values(columns).reset_index(drop=True)
+    pd.testing.assert_frame_equal(incremental, full, check_dtype=False)
@@ -2,8 +2,10 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import pandas as pd
+
 from src.config import DATASET_ROOT_PATH, PUBLIC_HOLIDAYS_URL, get_csv_to_table_mapping
-from src.extract import extract, get_public_holidays
+from src.extract import compact_dataframe, extract, get_public_holidays, table_nbytes
 
 
 def test_get_public_holidays():
@@ -31,3 +33,27 @@ def test_extract():
     assert dataframes["olist_products"].shape == (32951, 9)
     assert dataframes["olist_sellers"].shape == (3095, 4)
     assert dataframes["product_category_name_translation"].shape == (71, 2)
+
+
+def test_compact_dataframe():
+    """Test the compact_dataframe function."""
+    df = pd.DataFrame(
+        {
+            "order_id": ["o1", "o2", "o3"],
+            "order_status": ["delivered", "delivered", None],
+            "order_item_id": [1, 2, 3],
+            "price": [10.1, 20.2, 30.3],
+            "product_weight_g": [100.0, None, 2500.0],
+        }
+    )
+    compact = compact_dataframe("olist_orders", df)
+    assert compact["order_status"].dtype == "category"
+    assert compact["order_id"].dtype == "string"
+    assert compact["order_item_id"].dtype == "int8"
+    # float32 only when lossless: weights yes, prices no
+    assert compact["product_weight_g"].dtype == "float32"
+    assert compact["price"].dtype == "float64"
+    assert compact.astype(object).where(compact.notna(), None).values.tolist() == (
+        df.astype(object).where(df.notna(), None).values.tolist()
+    )
+    assert table_nbytes(compact) < table_nbytes(df)
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.hash_join import freight_value_weight_relationship, partition_ids
+from src.load import dispose_engines, get_engine, load_all
+from src.transform import run_query
+
+
+@pytest.fixture
+def engine(tmp_path):
+    rng = np.random.default_rng(13)
+    n = 400
+    orders = pd.DataFrame(
+        {
+            "order_id": [f"o{i}" for i in range(n)],
+            "customer_id": [f"c{i}" for i in range(n)],
+            "order_status": rng.choice(["delivered", "canceled"], n, p=[0.85, 0.15]),
+            "order_purchase_timestamp": pd.Timestamp("2017-01-01") + pd.to_timedelta(rng.integers(0, 300, n), unit="D"),
+        }
+    )
+    orders["order_delivered_customer_date"] = orders["order_purchase_timestamp"] + pd.Timedelta(days=5)
+    orders["order_estimated_delivery_date"] = orders["order_delivered_customer_date"]
+    n_items = rng.integers(1, 5, n)
+    freight = rng.gamma(2.0, 9.7, n_items.sum())
+    freight[::17] = np.nan
+    weights = rng.gamma(2.0, 700.0, 9)
+    weights[2] = np.nan
+    engine = get_engine(str(tmp_path / "olist.db"))
+    load_all(
+        {
+            "olist_orders": orders,
+            "olist_order_items": pd.DataFrame(
+                {
+                    # Items of an unknown order and of a product without a row drop out
+                    "order_id": np.append(np.repeat(orders["order_id"], n_items).iloc[1:], "missing"),
+                    "order_item_id": np.concatenate([np.arange(1, k + 1) for k in n_items]),
+                    "product_id": rng.choice([f"p{i}" for i in range(10)], n_items.sum()),
+                    "seller_id": "s1",
+                    "freight_value": freight,
+                }
+            ),
+            "olist_products": pd.DataFrame({"product_id": [f"p{i}" for i in range(9)], "product_weight_g": weights}),
+        },
+        engine,
+    )
+    yield engine
+    dispose_engines()
+
+
+def test_partition_ids_are_stable_and_in_range():
+    keys = pd.Series([f"o{i}" for i in range(1000)] + [None])
+    ids = partition_ids(keys, 7)
+    assert ids.max() < 7 and len(set(ids)) == 7
+    # Same key, same partition, whatever the chunk it comes in
+    np.testing.assert_array_equal(partition_ids(keys[500:], 7), ids[500:])
+
+
+def test_partitioned_join_matches_pandas(engine):
+    expected = run_query("get_freight_value_weight_relationship", engine).result
+
+    # Small chunks: every partition is written in several files
+    result = freight_value_weight_relationship(engine, workers=2, partitions=5, chunk_rows=97)
+    pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-12)
+    pd.testing.assert_series_equal(result["order_id"], expected["order_id"])
+
+    result = run_query("get_freight_value_weight_relationship", engine, backend="partitioned").result
+    pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-12)
+
+
+def test_partitioned_join_on_a_read_only_engine(engine):
+    expected = run_query("get_freight_value_weight_relationship", engine).result
+    reader = get_engine(engine.url.database, read_only=True)
+
+    result = freight_value_weight_relationship(reader, workers=1, partitions=3)
+    pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-12)
+    result = run_query("get_freight_value_weight_relationship", reader, backend="partitioned").result
+    pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-12)
@@ -0,0 +1,64 @@
+import ast
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Plotting backends: they must be imported by the chart that uses them, not at
+# start-up (streamlit already imports the lazy `plotly` package stub, which is cheap)
+HEAVY_MODULES = ("matplotlib.pyplot", "seaborn", "plotly.express", "plotly.subplots")
+
+# Cumulative import time budget (seconds) of each cold start, with ample
+# margin over the measured time (pandas alone is ~0.3s)
+IMPORT_BUDGET = 1.5
+
+
+def _import_profile(code: str) -> dict:
+    """Run `code` in a fresh interpreter with -X importtime.
+
+    Returns:
+        dict: Cumulative import time in seconds of every imported module.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    profile = {}
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)", line)
+        if match:
+            profile[match.group(2)] = int(match.group(1)) / 1e6
+    return profile
+
+
+def _dashboard_imports() -> str:
+    """The module-level import statements of dashboard.py (its cold start)."""
+    tree = ast.parse((ROOT / "dashboard.py").read_text(encoding="utf-8"))
+    imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return "\n".join(ast.unparse(node) for node in imports)
+
+
+@pytest.mark.parametrize(
+    "code",
+    ["import src.plots", "import src.pipeline", "import src.report", _dashboard_imports()],
+    ids=["src.plots", "src.pipeline", "src.report", "dashboard"],
+)
+def test_cold_start_import_budget(code):
+    profile = _import_profile(code)
+    heavy = sorted(set(profile) & set(HEAVY_MODULES))
+    assert not heavy, f"plotting backends imported at start-up: {heavy}"
+
+    # Streamlit itself is the dashboard's fixed cost and is not counted
+    total = sum(
+        seconds
+        for name, seconds in profile.items()
+        if "." not in name and name != "streamlit"
+    )
+    assert total < IMPORT_BUDGET, f"imports took {total:.2f}s"
@@ -0,0 +1,116 @@
+import pandas as pd
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from src.load import dispose_engines, get_engine, load_all, load_dataframe, read_snapshot
+from src.transform import read_review_filters, search_reviews
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Path to a throwaway SQLite file; engines are disposed after each test."""
+    yield str(tmp_path / "olist.db")
+    dispose_engines()
+
+
+def test_get_engine_is_reused_per_path_and_mode(db_path):
+    engine = get_engine(db_path)
+    assert get_engine(db_path) is engine
+    assert get_engine(db_path, read_only=True) is not engine
+
+
+def test_get_engine_applies_pragmas(db_path):
+    engine = get_engine(db_path)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA temp_store").scalar() == 2
+
+
+def test_read_only_engine_rejects_writes(db_path):
+    load_dataframe("olist_sellers", pd.DataFrame({"seller_id": ["s1"]}), get_engine(db_path))
+    reader = get_engine(db_path, read_only=True)
+    assert pd.read_sql("SELECT * FROM olist_sellers", reader)["seller_id"].tolist() == ["s1"]
+    with pytest.raises(OperationalError):
+        with reader.begin() as conn:
+            conn.exec_driver_sql("DROP TABLE olist_sellers")
+
+
+def test_load_all_publishes_atomically_to_snapshot_readers(db_path):
+    writer = get_engine(db_path)
+    load_all({"olist_sellers": pd.DataFrame({"seller_id": ["s1"]})}, writer)
+    reader = get_engine(db_path, read_only=True)
+
+    with read_snapshot(reader) as conn:
+        load_all({"olist_sellers": pd.DataFrame({"seller_id": ["s2", "s3"]})}, writer)
+        # The open snapshot keeps seeing the previous load
+        assert pd.read_sql("SELECT * FROM olist_sellers", conn)["seller_id"].tolist() == ["s1"]
+
+    assert pd.read_sql("SELECT * FROM olist_sellers", reader)["seller_id"].tolist() == ["s2", "s3"]
+    tables = pd.read_sql("SELECT name FROM sqlite_master WHERE type = 'table'", reader)["name"]
+    assert "olist_sellers__staging" not in tables.tolist()
+
+
+def test_failed_publish_keeps_previous_tables(db_path):
+    engine = get_engine(db_path)
+    load_all({"olist_sellers": pd.DataFrame({"seller_id": ["s1"]})}, engine)
+    # olist_orders lacks the columns its indexes need, so the publish fails
+    with pytest.raises(OperationalError):
+        load_all(
+            {
+                "olist_sellers": pd.DataFrame({"seller_id": ["s2"]}),
+                "olist_orders": pd.DataFrame({"order_id": ["o1"]}),
+            },
+            engine,
+        )
+    assert pd.read_sql("SELECT * FROM olist_sellers", engine)["seller_id"].tolist() == ["s1"]
+
+
+def test_load_all_builds_review_search_index(db_path):
+    engine = get_engine(db_path)
+    load_all(
+        {
+            "olist_customers": pd.DataFrame({"customer_id": ["c1", "c2"], "customer_state": ["SP", "RJ"]}),
+            "olist_orders": pd.DataFrame(
+                {
+                    "order_id": ["o1", "o2"],
+                    "customer_id": ["c1", "c2"],
+                    "order_status": ["shipped", "delivered"],
+                    "order_purchase_timestamp": pd.to_datetime(["2017-01-01", "2017-01-02"]),
+                    "order_delivered_customer_date": pd.to_datetime([None, None]),
+                }
+            ),
+            "olist_order_items": pd.DataFrame(
+                {"order_id": ["o1", "o2"], "product_id": ["p1", "p2"], "seller_id": ["s1", "s1"]}
+            ),
+            "olist_products": pd.DataFrame(
+                {"product_id": ["p1", "p2"], "product_category_name": ["moveis", "pcs"]}
+            ),
+            "product_category_name_translation": pd.DataFrame(
+                {"product_category_name": ["moveis"], "product_category_name_english": ["furniture"]}
+            ),
+            "olist_order_reviews": pd.DataFrame(
+                {
+                    "review_id": ["r1", "r2", "r3"],
+                    "order_id": ["o1", "o2", "o2"],
+                    "review_score": [1, 2, 5],
+                    "review_comment_title": [None, "Péssimo", None],
+                    "review_comment_message": ["Não recebi o produto", "produtos não chegaram", None],
+                }
+            ),
+        },
+        engine,
+    )
+    reader = get_engine(db_path, read_only=True)
+
+    # Case and accents are ignored, and every word matches as a prefix
+    found = search_reviews(reader, "NAO produto")
+    assert found.set_index("review_id")["categories"].to_dict() == {"r1": "furniture", "r2": "pcs"}
+    assert found.set_index("review_id")["customer_state"].to_dict() == {"r1": "SP", "r2": "RJ"}
+    assert search_reviews(reader, "pess")["review_id"].tolist() == ["r2"]
+    assert search_reviews(reader, "nao", state="RJ")["review_id"].tolist() == ["r2"]
+    assert search_reviews(reader, "nao", category="furniture")["review_id"].tolist() == ["r1"]
+    # User input is never parsed as FTS5 syntax
+    assert search_reviews(reader, "pessimo OR recebi").empty
+    assert search_reviews(reader, '"*').empty
+    # The search filters offer every indexed state and category
+    assert read_review_filters(reader) == (["RJ", "SP"], ["furniture", "pcs"])
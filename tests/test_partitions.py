@@ -0,0 +1,186 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.aggregates import append_and_refresh
+from src.load import (
+    database_path,
+    dispose_engines,
+    get_engine,
+    load,
+    load_all,
+    load_dataframe,
+    read_only_engine_for,
+)
+from src.partitions import (
+    Partition,
+    UNDATED_PARTITION,
+    build_partitions,
+    partition_range,
+    prune_partitions,
+    read_orders,
+    read_partitions,
+    run_partitioned,
+)
+from src.transform import query_orders_per_day_and_holidays_2017
+
+
+@pytest.fixture
+def engine(tmp_path):
+    rng = np.random.default_rng(1)
+    n = 300
+    purchase = pd.Series(pd.Timestamp("2016-10-01") + pd.to_timedelta(rng.integers(0, 700, n), unit="D"))
+    purchase[:3] = pd.NaT
+    orders = pd.DataFrame(
+        {
+            "order_id": [f"o{i}" for i in range(n)],
+            "customer_id": [f"c{i}" for i in range(n)],
+            "order_status": "delivered",
+            "order_purchase_timestamp": purchase,
+            "order_delivered_customer_date": purchase + pd.Timedelta(days=7),
+            "order_estimated_delivery_date": purchase + pd.Timedelta(days=10),
+        }
+    )
+    engine = get_engine(str(tmp_path / "olist.db"))
+    load_all(
+        {
+            "olist_orders": orders,
+            "olist_order_items": pd.DataFrame(
+                {
+                    "order_id": list(orders["order_id"]) * 2 + ["orphan"],
+                    "order_item_id": [1] * n + [2] * n + [1],
+                    "product_id": "p1",
+                    "seller_id": "s1",
+                }
+            ),
+            "olist_order_payments": pd.DataFrame({"order_id": orders["order_id"], "payment_value": 10.0}),
+            "public_holidays": pd.DataFrame(
+                {"date": pd.to_datetime(["2017-01-01", "2017-12-25"]), "localName": ["Ano novo", "Natal"]}
+            ),
+        },
+        engine,
+    )
+    yield engine
+    dispose_engines()
+
+
+def test_partitions_hold_every_row(engine):
+    keys = build_partitions(engine, "year")
+    assert keys == ["2016", "2017", "2018", UNDATED_PARTITION]
+
+    catalog = read_partitions(engine)
+    # olist_order_reviews was not loaded, so it is not partitioned
+    assert set(catalog) == {"olist_orders", "olist_order_items", "olist_order_payments"}
+    for table, partitions in catalog.items():
+        total = pd.read_sql(f"SELECT COUNT(*) AS n FROM {table}", engine)["n"][0]
+        parts = sum(pd.read_sql(f"SELECT COUNT(*) AS n FROM {p.partition_table}", engine)["n"][0] for p in partitions)
+        assert parts == total
+    # The item without an order is kept in the undated partition
+    undated = pd.read_sql("SELECT order_id FROM olist_order_items__pundated", engine)
+    assert "orphan" in set(undated["order_id"])
+
+
+def test_partition_range():
+    assert partition_range("2017") == ("2017-01-01", "2018-01-01")
+    assert partition_range("2017-12") == ("2017-12-01", "2018-01-01")
+    assert partition_range("2017-02-28") == ("2017-02-28", "2017-03-01")
+    assert partition_range(UNDATED_PARTITION) == (None, None)
+
+
+def test_prune_partitions():
+    partitions = [
+        Partition("t", "2017-01", "t__p2017_01", "2017-01-01", "2017-02-01"),
+        Partition("t", "2017-02", "t__p2017_02", "2017-02-01", "2017-03-01"),
+        Partition("t", UNDATED_PARTITION, "t__pundated", None, None),
+    ]
+    assert [p.key for p in prune_partitions(partitions, "2017-01-15", "2017-02-01")] == ["2017-01"]
+    assert [p.key for p in prune_partitions(partitions, "2017-02-01")] == ["2017-02"]
+    assert len(prune_partitions(partitions)) == 3
+
+
+@pytest.mark.parametrize("granularity", ["year", "month"])
+def test_pruned_queries_match_the_base_tables(engine, granularity):
+    expected_orders = read_orders(engine, "2017-03-10", "2017-09-01").sort_values("order_id")
+    expected_2017 = query_orders_per_day_and_holidays_2017(engine).result
+
+    build_partitions(engine, granularity)
+    orders = read_orders(engine, "2017-03-10", "2017-09-01").sort_values("order_id")
+    pd.testing.assert_frame_equal(orders.reset_index(drop=True), expected_orders.reset_index(drop=True))
+    assert len(read_orders(engine)) == 300
+
+    result = query_orders_per_day_and_holidays_2017(engine).result
+    pd.testing.assert_frame_equal(
+        result.sort_values("date").reset_index(drop=True), expected_2017.sort_values("date").reset_index(drop=True)
+    )
+
+    # Joins run inside each partition and the partial results add up
+    joined = run_partitioned(
+        engine,
+        "SELECT COUNT(*) AS items FROM {olist_orders} o JOIN {olist_order_items} i ON i.order_id = o.order_id "
+        "WHERE (:start IS NULL OR o.order_purchase_timestamp >= :start) "
+        "AND (:end IS NULL OR o.order_purchase_timestamp < :end)",
+        start="2017-01-01",
+        end="2018-01-01",
+    )
+    assert joined["items"].sum() == 2 * len(read_orders(engine, "2017-01-01", "2018-01-01"))
+
+
+@pytest.mark.parametrize("granularity", [None, "month"])
+def test_partitioned_reads_on_a_read_only_engine(engine, granularity):
+    expected_orders = read_orders(engine, "2017-01-01", "2018-01-01")
+    expected_2017 = query_orders_per_day_and_holidays_2017(engine).result
+    if granularity:
+        build_partitions(engine, granularity)
+    reader = get_engine(engine.url.database, read_only=True)
+    assert database_path(reader) == database_path(engine) == engine.url.database
+    assert read_only_engine_for(reader) is reader
+
+    orders = read_orders(reader, "2017-01-01", "2018-01-01")
+    assert sorted(orders["order_id"]) == sorted(expected_orders["order_id"])
+    result = query_orders_per_day_and_holidays_2017(reader).result
+    pd.testing.assert_frame_equal(
+        result.sort_values("date").reset_index(drop=True), expected_2017.sort_values("date").reset_index(drop=True)
+    )
+
+
+def test_partitions_follow_loads_and_appends(engine):
+    build_partitions(engine, "month")
+    new_order = pd.DataFrame(
+        {
+            "order_id": ["new"],
+            "customer_id": ["c0"],
+            "order_status": ["delivered"],
+            "order_purchase_timestamp": [pd.Timestamp("2017-05-20 10:00")],
+            "order_delivered_customer_date": [pd.Timestamp("2017-05-27")],
+            "order_estimated_delivery_date": [pd.Timestamp("2017-05-30")],
+        }
+    )
+    append_and_refresh({"olist_orders": new_order}, engine)
+    may = pd.read_sql("SELECT order_id FROM olist_orders__p2017_05", engine)
+    assert "new" in set(may["order_id"])
+
+    # Reloading a partitioned table drops the now stale partitions
+    load_all({"olist_order_payments": pd.DataFrame({"order_id": ["o1"], "payment_value": [1.0]})}, engine)
+    assert read_partitions(engine) == {}
+    assert len(read_orders(engine, "2017-05-20", "2017-05-21")) >= 1
+
+
+# load_all(atomic=False) writes through load_dataframe
+@pytest.mark.parametrize("writer", ["load_dataframe", "load"])
+def test_direct_writes_drop_stale_partitions(engine, writer):
+    build_partitions(engine, "year")
+    orders = pd.DataFrame(
+        {
+            "order_id": ["a", "b", "c"],
+            "customer_id": ["c1", "c2", "c3"],
+            "order_status": "delivered",
+            "order_purchase_timestamp": pd.to_datetime(["2017-02-01", "2017-06-01", "2017-11-01"]),
+        }
+    )
+    if writer == "load_dataframe":
+        load_dataframe("olist_orders", orders, engine)
+    else:
+        load({"olist_orders": orders}, engine)
+
+    assert read_partitions(engine) == {}
+    assert sorted(read_orders(engine, "2017-01-01", "2018-01-01")["order_id"]) == ["a", "b", "c"]
@@ -0,0 +1,103 @@
+import pytest
+
+import src.transform as transform
+from src.pipeline import Stage, build_stages, load_state, plan_stages, run_stages, stage_fingerprint
+from src.transform import _prepare_query
+
+
+def _graph(calls, fail=()):
+    def stage(name, *deps):
+        def run():
+            if name in fail:
+                raise RuntimeError(f"{name} broke")
+            calls.append(name)
+
+        return Stage(name, deps, run)
+
+    stages = [
+        stage("extract:a"),
+        stage("extract:b"),
+        stage("load", "extract:a", "extract:b"),
+        stage("transform:x", "load"),
+        stage("transform:y", "load"),
+        stage("export", "transform:x", "transform:y"),
+    ]
+    return {s.name: s for s in stages}
+
+
+def test_failed_run_resumes_from_the_failed_stage(tmp_path):
+    state_path = str(tmp_path / "state.json")
+    calls = []
+    stages = _graph(calls, fail={"transform:y"})
+    assert not run_stages(stages, plan_stages(stages, {}), state_path, workers=1)
+    assert "export" not in calls
+
+    state = load_state(state_path)
+    assert state["transform:y"]["status"] == "failed"
+    assert plan_stages(stages, state) == ["transform:y", "export"]
+
+    calls.clear()
+    stages = _graph(calls)
+    assert run_stages(stages, plan_stages(stages, state), state_path)
+    assert calls == ["transform:y", "export"]
+    assert plan_stages(stages, load_state(state_path)) == []
+
+
+def test_from_stage_and_only(tmp_path):
+    state = {name: {"status": "done"} for name in _graph([])}
+    stages = _graph([])
+    assert plan_stages(stages, state, from_stage=["transform:x"]) == ["transform:x", "export"]
+    assert plan_stages(stages, state, only=["transform"]) == ["transform:x", "transform:y"]
+
+    del state["load"]
+    with pytest.raises(ValueError):
+        plan_stages(stages, state, only=["transform:x"])
+    with pytest.raises(ValueError):
+        plan_stages(stages, state, from_stage=["nope"])
+
+
+def test_transient_stages_run_with_their_dependents():
+    stages = {
+        s.name: s
+        for s in [
+            Stage("extract:a", (), None),
+            Stage("extract:b", (), None),
+            Stage("stage:a", ("extract:a",), None, transient=True),
+            Stage("stage:b", ("extract:b",), None, transient=True),
+            Stage("load", ("stage:a", "stage:b"), None),
+            Stage("export", ("load",), None),
+        ]
+    }
+    state = {name: {"status": "done"} for name in stages}
+    # The staging tables of both tables are gone after the first load
+    assert plan_stages(stages, state, from_stage=["load"]) == ["stage:a", "stage:b", "load", "export"]
+    assert plan_stages(stages, state, from_stage=["extract:a"]) == [
+        "extract:a", "stage:a", "stage:b", "load", "export"
+    ]
+    # Staging alone would never be published
+    assert plan_stages(stages, state, only=["stage:a"]) == ["stage:a", "stage:b", "load"]
+
+
+def test_changed_fingerprint_invalidates_the_checkpoint(tmp_path):
+    state_path = str(tmp_path / "state.json")
+    options = {"backend": "pandas"}
+    calls = []
+    stages = _graph(calls)
+    stages["transform:x"] = stages["transform:x"]._replace(fingerprint=lambda: options["backend"])
+    assert run_stages(stages, plan_stages(stages, {}), state_path)
+    assert plan_stages(stages, load_state(state_path)) == []
+
+    options["backend"] = "polars"
+    assert plan_stages(stages, load_state(state_path)) == ["transform:x", "export"]
+
+
+def test_transform_fingerprint_follows_the_query_code(tmp_path, monkeypatch):
+    stages = build_stages(db_path=str(tmp_path / "olist.db"), workdir=str(tmp_path), results_dir=str(tmp_path))
+    name = "global_ammount_order_status"
+    before = stage_fingerprint(stages[f"transform:{name}"])
+    other = stage_fingerprint(stages["transform:revenue_per_state"])
+
+    edited = _prepare_query(name, transform._QUERY_REGISTRY[name].sql.text + "\n-- edited")
+    monkeypatch.setitem(transform._QUERY_REGISTRY, name, edited)
+    assert stage_fingerprint(stages[f"transform:{name}"]) != before
+    assert stage_fingerprint(stages["transform:revenue_per_state"]) == other
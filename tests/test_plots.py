@@ -0,0 +1,36 @@
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+import pandas as pd
+
+from src.plots import _streaming_linear_fit, plot_freight_value_weight_relationship
+
+
+def test_streaming_linear_fit_matches_polyfit():
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0, 30_000, 10_001)
+    y = 0.002 * x + 15 + rng.normal(0, 5, x.size)
+    slope, intercept = _streaming_linear_fit(x, y, chunk_size=997)
+    np.testing.assert_allclose([slope, intercept], np.polyfit(x, y, 1))
+    assert _streaming_linear_fit(np.ones(3), np.arange(3.0)) is None
+    assert _streaming_linear_fit(np.array([]), np.array([])) is None
+
+
+def test_plot_freight_value_weight_relationship_uses_all_points():
+    df = pd.DataFrame(
+        {"product_weight_g": [100.0, 200.0, np.nan, 40_000.0], "freight_value": [10.0, 12.0, 5.0, 300.0]}
+    )
+    fig = plot_freight_value_weight_relationship(df, bins=10, show=False)
+    mesh = fig.axes[0].collections[0]
+    assert mesh.get_array().sum() == 3
+
+
+def test_plot_freight_value_weight_relationship_without_rows():
+    for df in (
+        pd.DataFrame({"product_weight_g": [], "freight_value": []}),
+        pd.DataFrame({"product_weight_g": [np.nan], "freight_value": [5.0]}),
+    ):
+        fig = plot_freight_value_weight_relationship(df, bins=10, show=False)
+        assert not fig.axes[0].collections and not fig.axes[0].lines
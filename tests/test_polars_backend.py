@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.load import dispose_engines, get_engine, load_all
+from src.transform import run_query
+
+pl = pytest.importorskip("polars")
+
+from src.polars_backend import freight_value_weight_relationship, orders_per_day_and_holidays_2017  # noqa: E402
+
+QUERIES = ("get_freight_value_weight_relationship", "orders_per_day_and_holidays_2017")
+
+
+def _assert_same_result(result, expected):
+    # Counts, dates and keys are exact; float sums may differ in the last bit
+    # (pandas uses compensated summation)
+    pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-12)
+    for column in result.columns:
+        if result[column].dtype.kind != "f":
+            pd.testing.assert_series_equal(result[column], expected[column], check_exact=True)
+
+
+@pytest.fixture
+def tables():
+    rng = np.random.default_rng(9)
+    n = 500
+    purchase = pd.Series(pd.Timestamp("2016-12-01") + pd.to_timedelta(rng.integers(0, 500 * 24, n), unit="h"))
+    purchase[:5] = pd.NaT
+    orders = pd.DataFrame(
+        {
+            "order_id": [f"o{i}" for i in range(n)],
+            "customer_id": [f"c{i}" for i in range(n)],
+            "order_status": rng.choice(["delivered", "shipped", "canceled"], n, p=[0.8, 0.1, 0.1]),
+            "order_purchase_timestamp": purchase,
+            "order_delivered_customer_date": purchase + pd.Timedelta(days=8),
+            "order_estimated_delivery_date": purchase + pd.Timedelta(days=12),
+        }
+    )
+    n_items = rng.integers(1, 6, n)
+    items = pd.DataFrame(
+        {
+            "order_id": np.repeat(orders["order_id"], n_items),
+            "order_item_id": np.concatenate([np.arange(1, k + 1) for k in n_items]),
+            # p9 has no product row, so its items drop out of the join
+            "product_id": rng.choice([f"p{i}" for i in range(10)], n_items.sum()),
+            "seller_id": "s1",
+            "freight_value": rng.gamma(2.0, 9.7, n_items.sum()),
+        }
+    )
+    weights = rng.gamma(2.0, 700.0, 9)
+    weights[3] = np.nan
+    return {
+        "olist_orders": orders,
+        "olist_order_items": items,
+        "olist_products": pd.DataFrame({"product_id": [f"p{i}" for i in range(9)], "product_weight_g": weights}),
+        "public_holidays": pd.DataFrame(
+            {"date": pd.to_datetime(["2017-01-01", "2017-04-21", "2017-12-25", "2018-01-01"]), "localName": "x"}
+        ),
+    }
+
+
+@pytest.fixture
+def engine(tmp_path, tables):
+    engine = get_engine(str(tmp_path / "olist.db"))
+    load_all(tables, engine)
+    yield engine
+    dispose_engines()
+
+
+@pytest.mark.parametrize("query_name", QUERIES)
+def test_polars_backend_matches_pandas(engine, query_name):
+    expected = run_query(query_name, engine).result
+    _assert_same_result(run_query(query_name, engine, backend="polars").result, expected)
+
+    # Every other query falls back to the default functions
+    pd.testing.assert_frame_equal(
+        run_query("global_ammount_order_status", engine, backend="polars").result,
+        run_query("global_ammount_order_status", engine).result,
+    )
+    with pytest.raises(ValueError):
+        run_query(query_name, engine, backend="spark")
+
+
+def test_plans_read_parquet_folders(engine, tables, tmp_path):
+    folder = tmp_path / "staged"
+    folder.mkdir()
+    for table, df in tables.items():
+        df.to_parquet(folder / f"{table}.parquet", index=False)
+
+    for plan, query_name in zip((freight_value_weight_relationship, orders_per_day_and_holidays_2017), QUERIES):
+        _assert_same_result(plan(str(folder)), run_query(query_name, engine).result)
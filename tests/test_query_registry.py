@@ -0,0 +1,91 @@
+import pandas as pd
+import pytest
+
+import src.transform as transform
+from src.load import dispose_engines, get_engine, load_dataframe
+from src.transform import (
+    _discover_queries,
+    _prepare_query,
+    get_query_functions,
+    get_query_schema,
+    get_query_tables,
+    run_query,
+    run_sql_query,
+)
+
+SHIPPED_TABLES = {
+    "delivery_date_difference": ("olist_orders", "olist_customers"),
+    "global_ammount_order_status": ("olist_orders",),
+    "real_vs_estimated_delivered_time": ("olist_orders",),
+    "revenue_by_month_year": ("olist_orders", "olist_order_payments", "olist_order_items"),
+    "revenue_per_state": ("olist_orders", "olist_customers", "olist_order_payments"),
+    "top_10_least_revenue_categories": (
+        "olist_orders",
+        "olist_order_payments",
+        "olist_order_items",
+        "olist_products",
+        "product_category_name_translation",
+    ),
+    "top_10_revenue_categories": (
+        "olist_orders",
+        "olist_order_payments",
+        "olist_order_items",
+        "olist_products",
+        "product_category_name_translation",
+    ),
+}
+
+STATUS_SQL = """-- Orders of a status, FROM a comment that names no_such_table
+WITH picked AS (
+    SELECT order_id, order_status FROM olist_orders WHERE order_status = :status
+)
+SELECT p.order_status, COUNT(*) AS n, strftime('%H:%M', '2017-01-01 12:30') AS at
+FROM picked AS p
+JOIN olist_orders o ON o.order_id = p.order_id
+WHERE o.order_id <> :status OR :limit IS NULL
+GROUP BY p.order_status
+"""
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = get_engine(str(tmp_path / "olist.db"))
+    orders = pd.DataFrame({"order_id": ["o1", "o2", "o3"], "order_status": ["delivered", "delivered", "canceled"]})
+    load_dataframe("olist_orders", orders, engine)
+    yield engine
+    dispose_engines()
+
+
+def test_shipped_queries_read_their_base_tables():
+    registry = _discover_queries(transform.QUERIES_ROOT_PATH)
+    assert {name: query.tables for name, query in registry.items()} == SHIPPED_TABLES
+    assert all(query.params == () for query in registry.values())
+    for name, tables in SHIPPED_TABLES.items():
+        assert get_query_tables(name) == tables
+
+
+def test_prepare_query_skips_comments_and_ctes():
+    query = _prepare_query("orders_with_status", STATUS_SQL)
+    assert query.tables == ("olist_orders",)
+    # Each parameter once, in order; '12:30' and '%H:%M' are not parameters
+    assert query.params == ("status", "limit")
+    assert query.sql.text == STATUS_SQL
+
+
+def test_new_sql_file_is_discovered_and_runs(tmp_path, engine, monkeypatch):
+    folder = tmp_path / "queries"
+    folder.mkdir()
+    (folder / "orders_with_status.sql").write_text(STATUS_SQL)
+    (folder / "notes.txt").write_text("SELECT 1")
+    monkeypatch.setattr(transform, "_QUERY_REGISTRY", _discover_queries(str(folder)))
+    monkeypatch.setattr(transform, "_QUERY_SCHEMAS", {})
+
+    assert "orders_with_status" in get_query_functions() and "notes" not in get_query_functions()
+    assert get_query_tables("orders_with_status") == ("olist_orders",)
+    # The schema is probed with LIMIT 0 and NULL parameters
+    assert get_query_schema("orders_with_status", engine) == ("order_status", "n", "at")
+
+    result = run_sql_query("orders_with_status", engine, {"status": "delivered", "limit": None}).result
+    assert result.to_dict("records") == [{"order_status": "delivered", "n": 2, "at": "12:30"}]
+    with pytest.raises(KeyError):
+        run_query("no_such_query", engine)
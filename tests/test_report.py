@@ -0,0 +1,32 @@
+import pandas as pd
+
+from src.report import Chart, render_report
+
+CHARTS = [
+    Chart("order_status", "global_ammount_order_status", "plot_global_amount_order_status", {}),
+    Chart("revenue_per_state", "revenue_per_state", "plot_revenue_per_state", {}),
+]
+
+
+def _results(amounts):
+    return {
+        "global_ammount_order_status": pd.DataFrame(
+            {"order_status": ["delivered", "canceled"], "Ammount": amounts}
+        ),
+        "revenue_per_state": pd.DataFrame({"customer_state": ["SP", "RJ"], "Revenue": [3.0, 1.0]}),
+    }
+
+
+def test_render_report_skips_unchanged_charts(tmp_path):
+    rendered = []
+    outdir = str(tmp_path)
+
+    manifest = render_report(_results([5, 1]), outdir, workers=2, charts=CHARTS, log=rendered.append)
+    assert manifest["order_status"]["files"] == ["order_status.png", "order_status.svg"]
+    assert manifest["revenue_per_state"]["files"] == ["revenue_per_state.html"]
+    assert (tmp_path / "order_status.png").exists()
+    assert len(rendered) == 2
+
+    rendered.clear()
+    render_report(_results([5, 2]), outdir, workers=2, charts=CHARTS, log=rendered.append)
+    assert rendered == ["Rendered order_status"]
@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import event
+
+from src.aggregates import append_and_refresh
+from src.load import TABLE_VERSIONS_TABLE, dispose_engines, get_engine, load_all
+from src.sellers import haversine_km, read_scorecard_page, read_seller_states, refresh_seller_scorecard
+
+
+def test_haversine_km():
+    # São Paulo -> Rio de Janeiro
+    assert haversine_km(-23.55, -46.63, -22.91, -43.17) == pytest.approx(360.6, abs=0.5)
+    assert np.isnan(haversine_km(np.nan, 0.0, 0.0, 0.0))
+
+
+def _orders(rows):
+    df = pd.DataFrame(
+        rows,
+        columns=[
+            "order_id",
+            "customer_id",
+            "order_status",
+            "order_purchase_timestamp",
+            "order_delivered_customer_date",
+            "order_estimated_delivery_date",
+        ],
+    )
+    for col in df.columns[3:]:
+        df[col] = pd.to_datetime(df[col])
+    return df
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = get_engine(str(tmp_path / "olist.db"))
+    load_all(
+        {
+            "olist_geolocation": pd.DataFrame(
+                {
+                    "geolocation_zip_code_prefix": [1000, 1000, 2000],
+                    "geolocation_lat": [-23.5, -23.6, -22.91],
+                    "geolocation_lng": [-46.63, -46.63, -43.17],
+                }
+            ),
+            "olist_customers": pd.DataFrame(
+                {"customer_id": ["c1", "c2"], "customer_zip_code_prefix": [2000, 1000]}
+            ),
+            "olist_sellers": pd.DataFrame(
+                {"seller_id": ["s1", "s2"], "seller_zip_code_prefix": [1000, 1000], "seller_state": ["SP", "SP"]}
+            ),
+            "olist_orders": _orders(
+                [
+                    ("o1", "c1", "delivered", "2017-01-01", "2017-01-05 10:00", "2017-01-05"),
+                    ("o2", "c2", "delivered", "2017-01-02", "2017-01-20", "2017-01-10"),
+                    ("o3", "c2", "canceled", "2017-01-03", None, "2017-01-10"),
+                ]
+            ),
+            "olist_order_items": pd.DataFrame(
+                {
+                    "order_id": ["o1", "o1", "o2", "o3"],
+                    "seller_id": ["s1", "s1", "s1", "s2"],
+                    "product_id": ["p1", "p2", "p1", "p1"],
+                    "price": [10.0, 20.0, 5.0, 99.0],
+                    "freight_value": [1.0, 2.0, 3.0, 4.0],
+                }
+            ),
+            "olist_order_reviews": pd.DataFrame(
+                {"review_id": ["r1", "r2"], "order_id": ["o1", "o2"], "review_score": [5, 2]}
+            ),
+            "olist_order_payments": pd.DataFrame(
+                {"order_id": ["o1", "o2", "o3"], "payment_value": [33.0, 8.0, 103.0]}
+            ),
+        },
+        engine,
+    )
+    refresh_seller_scorecard(engine)
+    yield engine
+    dispose_engines()
+
+
+def test_refresh_seller_scorecard(engine):
+    page, total = read_scorecard_page(engine)
+    assert total == 1  # s2 has no delivered orders
+    row = page.iloc[0]
+    assert (row["seller_id"], row["order_count"], row["item_count"]) == ("s1", 2, 3)
+    assert row["revenue"] == 35.0
+    assert row["on_time_rate"] == 0.5  # o1 arrives on the estimated day, o2 late
+    assert row["avg_review_score"] == 3.5
+    assert row["avg_freight"] == 2.0
+    # o1 goes to Rio (~360 km), o2 within the seller zip (0 km)
+    assert row["avg_distance_km"] == pytest.approx(360.6 / 2, abs=5)
+
+
+def test_append_and_refresh_updates_only_affected_sellers(engine):
+    append_and_refresh(
+        {
+            "olist_orders": _orders(
+                [("o4", "c1", "delivered", "2017-02-01", "2017-02-03", "2017-02-10")]
+            ),
+            "olist_order_items": pd.DataFrame(
+                {"order_id": ["o4"], "seller_id": ["s2"], "product_id": ["p1"], "price": [50.0], "freight_value": [5.0]}
+            ),
+        },
+        engine,
+    )
+    page, total = read_scorecard_page(engine, sort_by="revenue", descending=True)
+    assert total == 2
+    assert page["seller_id"].tolist() == ["s2", "s1"]
+    incremental = page.copy()
+
+    refresh_seller_scorecard(engine)
+    pd.testing.assert_frame_equal(read_scorecard_page(engine)[0], incremental)
+
+    second_page, _ = read_scorecard_page(engine, page=1, page_size=1, sort_by="revenue", descending=True)
+    assert second_page["seller_id"].tolist() == ["s1"]
+    # Every scorecard column is a sort key; the filter lists the seller states
+    assert read_scorecard_page(engine, sort_by="seller_id", descending=False)[0]["seller_id"].tolist() == ["s1", "s2"]
+    assert read_seller_states(engine) == ["SP"]
+    with pytest.raises(ValueError):
+        read_scorecard_page(engine, sort_by="seller_id; DROP TABLE x")
+
+
+def test_incremental_refresh_reads_only_the_zips_of_its_sellers(engine):
+    def version():
+        return pd.read_sql(
+            f"SELECT version, row_count FROM {TABLE_VERSIONS_TABLE} WHERE table_name = 'seller_scorecard'", engine
+        ).iloc[0].tolist()
+
+    statements = []
+    full = version()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        refresh_seller_scorecard(engine, ["s1"])
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert any("FROM olist_geolocation" in s for s in statements)
+    # The centroids are looked up by zip, and the scorecard is not read back
+    assert not any("GROUP BY geolocation_zip_code_prefix" in s and " IN (" not in s for s in statements)
+    assert not any("SELECT * FROM seller_scorecard" in s for s in statements)
+    assert version()[0] != full[0] and version()[1] == full[1] == 1
+    assert read_scorecard_page(engine)[0]["avg_distance_km"].iloc[0] == pytest.approx(360.6 / 2, abs=5)
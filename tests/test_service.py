@@ -0,0 +1,129 @@
+import asyncio
+import io
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from src.load import dispose_engines, get_engine, load_dataframe
+from src.service import QueryService
+
+
+def _orders(statuses):
+    return pd.DataFrame({"order_id": [f"o{i}" for i in range(len(statuses))], "order_status": statuses})
+
+
+@pytest.fixture
+def served(tmp_path):
+    db_path = str(tmp_path / "olist.db")
+    engine = get_engine(db_path)
+    load_dataframe("olist_orders", _orders(["delivered", "delivered", "canceled"]), engine)
+
+    service = QueryService(db_path, cache_size=2)
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(service.start("127.0.0.1", 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+    yield url, service, engine
+
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+    loop.close()
+    service.close()
+    dispose_engines()
+
+
+def _get(url, headers=None):
+    request = urllib.request.Request(url, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.headers, error.read()
+
+
+def test_query_results_as_json_and_arrow(served):
+    url, service, _ = served
+    status, headers, body = _get(f"{url}/queries/global_ammount_order_status")
+    assert status == 200
+    assert json.loads(body) == [
+        {"order_status": "canceled", "Ammount": 1},
+        {"order_status": "delivered", "Ammount": 2},
+    ]
+
+    status, arrow_headers, body = _get(f"{url}/queries/global_ammount_order_status?format=arrow")
+    assert arrow_headers["Content-Type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(io.BytesIO(body)).read_all()
+    assert table.to_pydict() == {"order_status": ["canceled", "delivered"], "Ammount": [1, 2]}
+    # Each representation has its own ETag, and the second one hit the LRU cache
+    assert arrow_headers["ETag"] != headers["ETag"]
+    assert service.stats["misses"] == 1 and service.stats["hits"] == 1
+
+    assert "global_ammount_order_status" in json.loads(_get(f"{url}/queries")[2])
+    assert _get(f"{url}/queries/unknown")[0] == 404
+    assert _get(f"{url}/queries/global_ammount_order_status?format=csv")[0] == 400
+
+
+def test_etag_follows_the_data_version(served):
+    url, service, engine = served
+    query_url = f"{url}/queries/global_ammount_order_status"
+    _, headers, _ = _get(query_url)
+    etag = headers["ETag"]
+
+    status, _, body = _get(query_url, {"If-None-Match": etag})
+    assert (status, body) == (304, b"")
+    assert service.stats["not_modified"] == 1
+
+    # New data changes the version: the old ETag no longer matches
+    load_dataframe("olist_orders", _orders(["canceled"]), engine)
+    status, headers, body = _get(query_url, {"If-None-Match": etag})
+    assert status == 200 and headers["ETag"] != etag
+    assert json.loads(body) == [{"order_status": "canceled", "Ammount": 1}]
+
+
+def test_concurrent_requests_compute_once(served):
+    url, service, _ = served
+    query_url = f"{url}/queries/global_ammount_order_status"
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(_get(query_url))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({body for _, _, body in responses}) == 1
+    assert service.stats["misses"] == 1 and service.stats["hits"] == 7
+
+
+def test_cancelled_computation_releases_concurrent_waiters(tmp_path):
+    service = QueryService(str(tmp_path / "olist.db"))
+    started = asyncio.Event()
+
+    async def compute(query_name):
+        started.set()
+        await asyncio.sleep(60)
+
+    service._compute = compute
+
+    async def scenario():
+        first = asyncio.create_task(service.result("global_ammount_order_status", "v1"))
+        await started.wait()
+        second = asyncio.create_task(service.result("global_ammount_order_status", "v1"))
+        await asyncio.sleep(0)
+        first.cancel()
+        results = await asyncio.wait_for(asyncio.gather(first, second, return_exceptions=True), timeout=5)
+        return [type(r) for r in results]
+
+    try:
+        assert asyncio.run(scenario()) == [asyncio.CancelledError, asyncio.CancelledError]
+        assert not service._pending
+    finally:
+        service.close()
+        dispose_engines()
@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.aggregates import append_and_refresh
+from src.load import dispose_engines, get_engine, load_all, load_dataframe
+from src.sketches import (
+    SKETCH_TABLES,
+    hash64,
+    hll_estimate,
+    hll_registers,
+    merge_top_k,
+    refresh_category_sketches,
+    top_k_summary,
+)
+from src.transform import run_query
+
+
+def _sketch(keys):
+    return hll_registers(hash64(pd.Series(keys)), np.zeros(len(keys), dtype=np.int64), 1)[0]
+
+
+def test_hll_estimate_and_union():
+    for n in (50, 20000):
+        keys = [f"order{i}" for i in range(n)]
+        # 1.6% standard error: 5% is more than three of them
+        assert float(hll_estimate(_sketch(keys))) == pytest.approx(n, rel=0.05)
+
+    a, b = [f"o{i}" for i in range(0, 6000)], [f"o{i}" for i in range(4000, 9000)]
+    np.testing.assert_array_equal(np.maximum(_sketch(a), _sketch(b)), _sketch(a + b))
+
+
+def test_merged_top_k_bounds_the_true_weights():
+    rng = np.random.default_rng(3)
+    weights = pd.DataFrame(
+        {
+            "partition": np.repeat([f"2017-{m:02d}" for m in range(1, 13)], 30),
+            "item": np.tile([f"item{i:02d}" for i in range(30)], 12),
+            "weight": rng.pareto(1.5, 360) * 100,
+        }
+    )
+    truth = weights.groupby("item")["weight"].sum()
+
+    merged = merge_top_k(top_k_summary(weights, capacity=5)).set_index("item")
+    true = truth.reindex(merged.index)
+    assert (merged["estimate"] >= true - 1e-9).all()
+    assert (merged["estimate"] - merged["error"] <= true + 1e-9).all()
+
+    # With room for every item the summary is exact
+    exact = merge_top_k(top_k_summary(weights, capacity=30)).set_index("item")
+    assert (exact["error"] == 0).all()
+    pd.testing.assert_series_equal(exact["estimate"], truth.loc[exact.index], check_names=False)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    rng = np.random.default_rng(5)
+    n = 600
+    orders = pd.DataFrame(
+        {
+            "order_id": [f"o{i}" for i in range(n)],
+            "customer_id": [f"c{i}" for i in range(n)],
+            "order_status": "delivered",
+            "order_purchase_timestamp": pd.Timestamp("2017-01-01")
+            + pd.to_timedelta(rng.integers(0, 200, n), unit="D"),
+        }
+    )
+    orders["order_delivered_customer_date"] = orders["order_purchase_timestamp"] + pd.Timedelta(days=10)
+    orders["order_estimated_delivery_date"] = orders["order_delivered_customer_date"]
+    n_items = rng.integers(1, 4, n)
+    categories = [f"cat{i}" for i in range(12)]
+    engine = get_engine(str(tmp_path / "olist.db"))
+    load_all(
+        {
+            "olist_orders": orders,
+            "olist_order_payments": pd.DataFrame(
+                {"order_id": orders["order_id"], "payment_value": rng.gamma(2.0, 60.0, n).round(2)}
+            ),
+            "olist_order_items": pd.DataFrame(
+                {
+                    "order_id": np.repeat(orders["order_id"], n_items),
+                    "order_item_id": np.concatenate([np.arange(1, k + 1) for k in n_items]),
+                    "product_id": rng.choice(categories, n_items.sum(), p=np.linspace(2, 0.2, 12) / 13.2),
+                    "seller_id": "s1",
+                }
+            ),
+            "olist_products": pd.DataFrame({"product_id": categories, "product_category_name": categories}),
+            "product_category_name_translation": pd.DataFrame(
+                {"product_category_name": categories, "product_category_name_english": [c + "_en" for c in categories]}
+            ),
+        },
+        engine,
+    )
+    yield engine
+    dispose_engines()
+
+
+def test_approximate_top_categories_match_exact(engine):
+    exact = run_query("top_10_revenue_categories", engine).result
+    approx = run_query("top_10_revenue_categories", engine, approximate=True).result
+
+    # Fewer categories per month than the top-K capacity: revenue is exact
+    assert approx["Category"].tolist() == exact["Category"].tolist()
+    np.testing.assert_allclose(approx["Revenue"], exact["Revenue"])
+    assert (approx["Revenue_error"] == 0).all()
+    np.testing.assert_allclose(approx["Num_order"], exact["Num_order"], rtol=0.05)
+
+
+def test_sketches_follow_appended_orders(engine):
+    refresh_category_sketches(engine)
+    append_and_refresh(
+        {
+            "olist_orders": pd.DataFrame(
+                {
+                    "order_id": ["new1"],
+                    "customer_id": ["c0"],
+                    "order_status": ["delivered"],
+                    "order_purchase_timestamp": [pd.Timestamp("2017-03-01")],
+                    "order_delivered_customer_date": [pd.Timestamp("2017-03-05")],
+                    "order_estimated_delivery_date": [pd.Timestamp("2017-03-09")],
+                }
+            ),
+            "olist_order_payments": pd.DataFrame({"order_id": ["new1"], "payment_value": [5000.0]}),
+            "olist_order_items": pd.DataFrame(
+                {"order_id": ["new1"], "order_item_id": [1], "product_id": ["cat11"], "seller_id": ["s1"]}
+            ),
+        },
+        engine,
+    )
+    incremental = [pd.read_sql(f"SELECT * FROM {t} ORDER BY 1, 2, 3", engine) for t in SKETCH_TABLES]
+    refresh_category_sketches(engine)
+    full = [pd.read_sql(f"SELECT * FROM {t} ORDER BY 1, 2, 3", engine) for t in SKETCH_TABLES]
+    for a, b in zip(incremental, full):
+        pd.testing.assert_frame_equal(a, b)
+
+
+@pytest.mark.parametrize("reload", ["load_dataframe", "load_all"])
+def test_replacing_a_source_table_drops_the_sketches(engine, reload):
+    approx = run_query("top_10_revenue_categories", engine, approximate=True).result
+    payments = pd.read_sql("SELECT * FROM olist_order_payments", engine)
+    payments["payment_value"] *= 2
+    if reload == "load_dataframe":
+        load_dataframe("olist_order_payments", payments, engine, if_exists="replace")
+    else:
+        load_all({"olist_order_payments": payments}, engine)
+
+    assert not set(SKETCH_TABLES) & set(pd.read_sql("SELECT name FROM sqlite_master", engine)["name"])
+    # The next approximate query rebuilds them from the new payments
+    rebuilt = run_query("top_10_revenue_categories", engine, approximate=True).result
+    np.testing.assert_allclose(rebuilt["Revenue"], approx["Revenue"] * 2)
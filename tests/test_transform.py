@@ -3,8 +3,12 @@ from pytest import fixture
 from src.config import QUERY_RESULTS_ROOT_PATH, DATASET_ROOT_PATH, PUBLIC_HOLIDAYS_URL
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
+import glob
+import hashlib
+import inspect
 import json
 import math
+import os
 from src.transform import (
     query_delivery_date_difference,
     query_global_ammount_order_status,
@@ -16,7 +20,7 @@ from src.transform import (
     query_orders_per_day_and_holidays_2017,
     query_freight_value_weight_relationship,
 )
-from src.load import load
+from src.load import dispose_engines, get_engine, load
 from src.extract import extract
 from src.config import get_csv_to_table_mapping
 from src.transform import QueryResult
@@ -40,16 +44,57 @@ def float_vectors_are_close(a: list, b: list, tolerance: float = TOLERANCE) -> b
     return all([math.isclose(a[i], b[i], abs_tol=tolerance) for i in range(len(a))])
 
 
-@fixture(scope="session", autouse=True)
-def database() -> Engine:
-    """Initialize the database for testing."""
-    engine = create_engine("sqlite://")
-    csv_folder = DATASET_ROOT_PATH
-    public_holidays_url = PUBLIC_HOLIDAYS_URL
-    csv_table_mapping = get_csv_to_table_mapping()
-    csv_dataframes = extract(csv_folder, csv_table_mapping, public_holidays_url)
+def _test_db_key() -> str:
+    """Hash of the dataset files (name, size, mtime) and of the loader code.
+
+    Returns:
+        str: The key of the snapshot database.
+    """
+    import src.extract
+    import src.load
+
+    key = hashlib.sha256()
+    for csv_file, table_name in sorted(get_csv_to_table_mapping().items()):
+        stat = os.stat(os.path.join(DATASET_ROOT_PATH, csv_file))
+        key.update(f"{csv_file}:{table_name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    key.update(PUBLIC_HOLIDAYS_URL.encode())
+    for module in (src.extract, src.load):
+        key.update(inspect.getsource(module).encode())
+    return key.hexdigest()[:16]
+
+
+def _build_test_db(path: str) -> None:
+    """Extract the dataset and load it into a new SQLite file at `path`.
+
+    Args:
+        path (str): The snapshot path; written under a temporary name first.
+    """
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    engine = create_engine(f"sqlite:///{tmp_path}")
+    csv_dataframes = extract(DATASET_ROOT_PATH, get_csv_to_table_mapping(), PUBLIC_HOLIDAYS_URL)
     load(data_frames=csv_dataframes, database=engine)
-    return engine
+    engine.dispose()
+    os.replace(tmp_path, path)
+
+
+@fixture(scope="session", autouse=True)
+def database(pytestconfig) -> Engine:
+    """Initialize the database for testing.
+
+    The extracted dataset is loaded once into a snapshot file in the pytest
+    cache, keyed on the dataset and loader code. Later sessions open that
+    snapshot read-only, so they skip the CSV parsing and the holidays request.
+    """
+    cache_dir = str(pytestconfig.cache.mkdir("olist_db"))
+    path = os.path.join(cache_dir, f"olist-{_test_db_key()}.db")
+    if not os.path.exists(path):
+        for stale in glob.glob(os.path.join(cache_dir, "olist-*.db")):
+            os.remove(stale)
+        _build_test_db(path)
+    yield get_engine(path, read_only=True)
+    dispose_engines()
 
 
 def read_query_result(query_name: str) -> dict:
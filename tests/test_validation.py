@@ -0,0 +1,64 @@
+import pandas as pd
+import pyarrow as pa
+
+from src.validation import errors, format_report, profile_table, validate_tables
+
+
+def _orders(ids, customers, purchase):
+    return pd.DataFrame(
+        {
+            "order_id": ids,
+            "customer_id": customers,
+            "order_status": "delivered",
+            "order_purchase_timestamp": purchase,
+        }
+    )
+
+
+def test_profile_finds_bad_values_across_chunks():
+    chunks = [
+        _orders(["o1", "o2"], ["c1", "c2"], ["2017-10-02 10:56:33", "2017-13-45 00:00:00"]),
+        # The second chunk repeats a key of the first one, in Arrow form
+        pa.Table.from_pandas(_orders(["o2", None], ["c3", "c4"], ["1970-01-01", None])),
+    ]
+    profile = profile_table("olist_orders", chunks)
+    found = {(i.column, i.check): i for i in profile.issues}
+
+    assert profile.rows == 4
+    assert found[("order_purchase_timestamp", "unparseable")][4:] == (1, "2017-13-45 00:00:00")
+    assert found[("order_purchase_timestamp", "below_min")].severity == "warning"
+    assert found[("order_id", "missing")].count == 1
+    assert found[("order_id", "duplicate_key")].count == 1
+    # Declared columns that the extract didn't produce
+    assert found[("order_approved_at", "missing_column")].severity == "error"
+
+
+def test_numbers_as_text_and_categorical_keys():
+    items = pd.DataFrame(
+        {
+            "order_id": pd.Series(["o1", "o1", "o2"], dtype="category"),
+            "order_item_id": ["1", "2", "2.5"],
+            "product_id": "p1",
+            "seller_id": "s1",
+            "shipping_limit_date": pd.to_datetime(["2017-01-01"] * 3),
+            "price": ["10.5", "abc", "-1"],
+            "freight_value": [1.0, None, 2.0],
+        }
+    )
+    found = {(i.column, i.check): i[4:] for i in profile_table("olist_order_items", [items]).issues}
+    assert found == {
+        ("order_item_id", "unparseable"): (1, "2.5"),
+        ("price", "unparseable"): (1, "abc"),
+        ("price", "below_min"): (1, "-1"),
+    }
+
+
+def test_validate_tables_reports_orphan_foreign_keys():
+    orders = _orders(["o1", "o2"], ["c1", "c9"], "2017-01-01 00:00:00")
+    customers = pd.DataFrame({"customer_id": ["c1", "c2"], "customer_unique_id": ["u1", "u2"]})
+    report = validate_tables({"olist_orders": [orders[:1], orders[1:]], "olist_customers": [customers]})
+
+    orphans = [i for i in report.issues if i.check == "not_in:olist_customers.customer_id"]
+    assert [(i.severity, i.count, i.example) for i in orphans] == [("warning", 1, "c9")]
+    assert report.rows == {"olist_orders": 2, "olist_customers": 2}
+    assert format_report(report).splitlines()[0] == f"2 tables, 4 rows: {len(errors(report))} errors, 1 warnings"